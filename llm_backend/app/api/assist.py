@@ -1,10 +1,11 @@
 from http.client import HTTPException
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
 from typing import List, Dict
 from app.core.logger import get_logger, log_structured
-from app.services.conversation_service import ConversationService
+from app.core.streaming import stream_until_disconnect
+from app.services.message_writer import get_message_writer
 from app.services.llm_factory import LLMFactory
 from fastapi.responses import StreamingResponse
 
@@ -22,17 +23,21 @@ class ChatMessage(BaseModel):
     conversation_id: int
 
 @router.post("/chat")
-async def chat_endpoint(request: ChatMessage):
+async def chat_endpoint(request: ChatMessage, http_request: Request):
     try:
         logger.info(f"Received chat request from user {request.user_id} for conversation {request.conversation_id}")
         chat_service = LLMFactory.create_chat_service()
         # TODO: 会话处理
+        # 客户端断开时停止生成, 不再继续消耗上游 token
         return StreamingResponse(
-            chat_service.generate_stream(
-                messages = request.messages,
-                user_id = request.user_id,
-                conversation_id = request.conversation_id,
-                on_complete = ConversationService.save_message
+            stream_until_disconnect(
+                http_request,
+                chat_service.generate_stream(
+                    messages = request.messages,
+                    user_id = request.user_id,
+                    conversation_id = request.conversation_id,
+                    on_complete = get_message_writer().enqueue # 放入写入队列, 不阻塞流式响应
+                )
             ),
             media_type = "text/event-stream"
         )
@@ -41,7 +46,7 @@ async def chat_endpoint(request: ChatMessage):
         return HTTPException(status_code = 500, detail = str(e))
 
 @router.post("/reason")
-async def reason_endpoint(request: ReasonRequest):
+async def reason_endpoint(request: ReasonRequest, http_request: Request):
     try:
         logger.info(f"Processing reasoning request for user {request.user_id}")
         reasoner = LLMFactory.create_reasoner_service()
@@ -56,7 +61,7 @@ async def reason_endpoint(request: ReasonRequest):
         )
 
         return StreamingResponse(
-            reasoner.generate_stream(request.messages),
+            stream_until_disconnect(http_request, reasoner.generate_stream(request.messages)),
             media_type="text/event-stream"
         )
     except Exception as e:
@@ -64,17 +69,20 @@ async def reason_endpoint(request: ReasonRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/search")
-async def search_endpoint(request: ChatMessage):
+async def search_endpoint(request: ChatMessage, http_request: Request):
     # 带有搜索功能的聊天接口
     try:
         logger.info(f"Processing search request for user {request.user_id} in conversation {request.conversation_id}")
         logger.info(f"request: {request}")
         search_service = LLMFactory.create_search_service()
         return StreamingResponse(
-            search_service.generate(
-                query = request.messages[0]["content"],
-                user_id = request.user_id,
-                conversation_id = request.conversation_id
+            stream_until_disconnect(
+                http_request,
+                search_service.generate(
+                    query = request.messages[0]["content"],
+                    user_id = request.user_id,
+                    conversation_id = request.conversation_id
+                )
             ),
             media_type = "text/event-stream"
         )
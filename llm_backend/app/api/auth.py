@@ -2,12 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_db
-from app.core.security import create_access_token, get_current_user
+from app.core.security import create_access_token, get_current_user, get_token_payload
 from app.schemas.user import UserCreate, UserResponse, Token, UserLogin
 from app.services.user_service import UserService
 from datetime import timedelta
 from app.core.config import settings
-from app.models.user import User
+from app.services.user_cache import UserPrincipal, get_user_cache
 
 router = APIRouter()
 
@@ -37,7 +37,31 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/users/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: UserPrincipal = Depends(get_current_user)):
     """获取当前登录用户的信息"""
     return current_user
 
+@router.post("/logout")
+async def logout(
+        current_user: UserPrincipal = Depends(get_current_user),
+        payload: dict = Depends(get_token_payload)
+):
+    """退出登录, 撤销当前令牌直到其过期"""
+    jti = payload.get("jti")
+    if not jti:
+        # 没有 jti 的旧令牌无法单独撤销, 只能等待过期
+        raise HTTPException(status_code=400, detail="Token cannot be revoked")
+    await get_user_cache().revoke_token(jti, payload["exp"])
+    return {"message": "Logged out"}
+
+@router.post("/users/me/deactivate", response_model=UserResponse)
+async def deactivate_current_user(
+        current_user: UserPrincipal = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    """停用当前账号, 已签发的令牌随即失效"""
+    user = await UserService(db).update_status(current_user.id, "inactive")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
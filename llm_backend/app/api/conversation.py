@@ -1,9 +1,13 @@
-from http.client import HTTPException
+from typing import Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from app.core.config import settings
 from app.core.logger import get_logger
-from app.services.conversation_service import ConversationService
+from app.core.security import get_current_user
+from app.services.conversation_service import ConversationService, InvalidCursorError
+from app.services.user_cache import UserPrincipal
 
 logger = get_logger(service="conversation")
 
@@ -23,7 +27,7 @@ async def create_conversation(request: CreateConversationRequest):
         return {"conversation_id": conversation_id}
     except Exception as e:
         logger.error(f"Error creating conversation: {str(e)}", exc_info=True)
-        return HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/conversations/user/{user_id}")
 async def get_user_conversations(user_id: int):
@@ -33,19 +37,62 @@ async def get_user_conversations(user_id: int):
         return conversations
     except Exception as e:
         logger.error(f"Error getting conversations for user {user_id}: {str(e)}", exc_info=True)
-        return HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/conversations/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: int, user_id: int):
-    # 获取会话的所有消息
+async def get_conversation_messages(
+        conversation_id: int,
+        user_id: int,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=settings.MESSAGE_PAGE_MAX_LIMIT),
+        before: Optional[str] = None,
+        after: Optional[str] = None,
+        stream: bool = False
+):
+    # 获取会话消息; 不带 limit 和游标时返回全部消息, 否则分页返回,
+    # 翻页游标放在响应头 X-Before-Cursor / X-After-Cursor 中
+    # stream=true 时以 NDJSON 流式返回游标范围内的全部消息
+    if before and after:
+        raise HTTPException(status_code=400, detail="before and after cannot be used together")
     try:
-        messages = await ConversationService.get_conversation_messages(conversation_id, user_id)
-        return messages
+        if stream:
+            await ConversationService.verify_conversation_owner(conversation_id, user_id)
+            # 先校验游标, 避免流开始后才出错
+            for cursor in (before, after):
+                if cursor:
+                    ConversationService.decode_cursor(cursor)
+            return StreamingResponse(
+                ConversationService.stream_conversation_messages(conversation_id, before=before, after=after),
+                media_type = "application/x-ndjson"
+            )
+
+        page = await ConversationService.get_conversation_messages(
+            conversation_id, user_id, limit=limit, before=before, after=after
+        )
+        if page.before_cursor:
+            response.headers["X-Before-Cursor"] = page.before_cursor
+        if page.after_cursor:
+            response.headers["X-After-Cursor"] = page.after_cursor
+        return page.messages
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Error getting messages for conversation {conversation_id}: {str(e)}", exc_info=True)
-        return HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/conversations/user/{user_id}")
+async def purge_user_history(user_id: int, current_user: UserPrincipal = Depends(get_current_user)):
+    # 删除用户的全部会话和消息, 分批执行; 只允许已登录用户删除自己的历史
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to purge another user's history")
+    try:
+        deleted = await ConversationService.purge_user_history(user_id)
+        return {"message": f"History purged for user: {user_id}", **deleted}
+    except Exception as e:
+        logger.error(f"Error purging history for user {user_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: int):
@@ -55,7 +102,7 @@ async def delete_conversation(conversation_id: int):
         return {"message": f"Conversation deleted: {conversation_id}"}
     except Exception as e:
         logger.error(f"Error deleting conversation {conversation_id}: {str(e)}", exc_info=True)
-        return HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/conversations/{conversation_id}/name")
 async def update_conversation_name(conversation_id: int, request: UpdateConversationNameRequest):
@@ -65,4 +112,4 @@ async def update_conversation_name(conversation_id: int, request: UpdateConversa
         return {"message": f"Conversation name updated to: {request.name}"}
     except Exception as e:
         logger.error(f"Error updating conversation name for {conversation_id}: {str(e)}", exc_info=True)
-        return HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
@@ -17,10 +17,32 @@ class Settings(BaseSettings):
     DB_PASSWORD: str
     DB_NAME: str
 
+    DB_ECHO: bool = False  # 是否输出每条 SQL 及参数, 仅用于调试, 生产环境开启会占用大量 CPU 和磁盘
+    DB_POOL_SIZE: int = 20  # 连接池常驻连接数
+    DB_MAX_OVERFLOW: int = 10  # 连接池满时允许额外创建的连接数
+    DB_POOL_RECYCLE: int = 1800  # 连接的最长使用时间(秒), 应小于 MySQL 的 wait_timeout
+    DB_POOL_TIMEOUT: float = 10  # 连接池耗尽时等待空闲连接的秒数
+    DB_QUERY_CACHE_SIZE: int = 1200  # SQLAlchemy 编译后语句的缓存条数
+
+    # Message settings
+    MESSAGE_WRITER_QUEUE_SIZE: int = 1000  # 待写入对话队列的容量, 满时流式接口等待
+    MESSAGE_WRITER_BATCH_SIZE: int = 100  # 单次批量写入的最大对话轮数
+    MESSAGE_WRITER_FLUSH_INTERVAL: float = 0.5  # 批量写入的最长等待时间(秒)
+    MESSAGE_WRITER_MAX_RETRIES: int = 3  # 批量写入失败后的重试次数, 仍失败时逐条写入
+    MESSAGE_WRITER_RETRY_BACKOFF: float = 0.5  # 第一次重试前的等待(秒), 之后每次翻倍
+    MESSAGE_PAGE_DEFAULT_LIMIT: int = 50  # 消息历史每页默认条数
+    MESSAGE_PAGE_MAX_LIMIT: int = 500  # 消息历史每页最大条数
+    MESSAGE_STREAM_BATCH_SIZE: int = 500  # 流式导出消息时每批从服务端游标读取的行数
+    PURGE_CONVERSATION_BATCH: int = 100  # 清除用户历史时每批处理的会话数
+    PURGE_MESSAGE_BATCH: int = 5000  # 清除用户历史时单条 DELETE 最多删除的消息数
+
     # JWT settings
     SECRET_KEY: str = "your-secret-key"  # 在生产环境中使用安全的密钥
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    USER_CACHE_TTL: float = 60  # 认证用户信息的缓存时间(秒)
+    USER_CACHE_SIZE: int = 10000  # 进程内最多缓存的用户数
+    USER_CACHE_BACKEND: str = "redis"  # 用户信息缓存: redis(进程内 + Redis 共享, 失效和撤销广播到所有进程) 或 memory(仅单进程部署)
 
     @property
     def DATABASE_URL(self) -> str:
@@ -36,8 +58,22 @@ class Settings(BaseSettings):
     REDIS_PORT: int
     REDIS_DB: int = 0
     REDIS_PASSWORD: str = ''
+    REDIS_MAX_CONNECTIONS: int = 50  # 每个进程的 Redis 连接池上限
+    REDIS_POOL_TIMEOUT: int = 5  # 连接池耗尽时等待空闲连接的秒数
     REDIS_CACHE_EXPIRE: int = 3600  # 缓存过期时间，单位秒
     REDIS_CACHE_THRESHOLD: float = 0.8  # 语义相似度阈值
+    CACHE_EXACT_INCLUDE_SYSTEM: bool = True  # 精确匹配时是否把系统提示词纳入哈希
+    CACHE_EXACT_INCLUDE_MODEL: bool = True  # 精确匹配时是否把模型名纳入哈希
+    CACHE_EVICTION_POLICY: str = "lru"  # 语义缓存淘汰策略: lru(最近最少使用) 或 lfu(访问次数最少)
+    CACHE_MAX_ENTRIES_PER_USER: int = 1000  # 每个用户最多缓存的条目数
+    CACHE_MAX_BYTES_PER_USER: int = 50 * 1024 * 1024  # 每个用户缓存的最大字节数, 0 表示不限制
+    REDIS_CACHE_VECTOR_DTYPE: str = "float32"  # 缓存向量的存储精度: float32, float16 或 int8
+    REDIS_CACHE_INDEX_BACKEND: str = "hnsw"  # 语义缓存向量索引: hnsw(进程内 HNSW), memory(进程内矩阵, 逐条暴力计算) 或 redis(RediSearch HNSW, 多个 worker 共享)
+    REDIS_CACHE_INDEX_MAX_NAMESPACES: int = 256  # 进程内索引最多保留的用户数, 超出时淘汰最久未使用的, 再次使用时从 Redis 重新预热
+    REDIS_CACHE_HNSW_MIN_ENTRIES: int = 4096  # 条目数达到该值的用户才建 HNSW 图, 更少时用矩阵精确计算
+    CACHE_REPLAY_MODE: str = "chunked"  # 缓存命中的回放方式: all(一次发完), chunked(分块不等待) 或 paced(按 token 速率发送)
+    CACHE_REPLAY_CHUNK_SIZE: int = 64  # 回放时每个 SSE 帧包含的字符数
+    CACHE_REPLAY_TOKENS_PER_SEC: float = 200  # paced 模式下的目标速率(token/秒)
 
     @property
     def REDIS_URL(self) -> str:
@@ -51,6 +87,12 @@ class Settings(BaseSettings):
     OLLAMA_REASON_MODEL: str
     OLLAMA_EMBEDDING_MODEL: str
     OLLAMA_AGENT_MODEL: str
+    OLLAMA_NUM_PARALLEL: int = 4  # 与 Ollama 服务端的 OLLAMA_NUM_PARALLEL 保持一致, 作为连接数上限
+    OLLAMA_CONNECT_TIMEOUT: float = 5  # 建立连接的超时(秒)
+    OLLAMA_READ_TIMEOUT: float = 300  # 两次收到数据之间的最长等待(秒)
+    EMBEDDING_CACHE_SIZE: int = 2048  # 向量结果 LRU 缓存条数
+    EMBEDDING_BATCH_WINDOW_MS: float = 5  # 合并并发向量请求的时间窗口(毫秒)
+    EMBEDDING_BATCH_SIZE: int = 32  # 单次 /api/embed 请求的最大文本数
 
     # Deepseek settings
     DEEPSEEK_API_KEY: str
@@ -62,11 +104,32 @@ class Settings(BaseSettings):
     REASON_SERVICE: ServiceType = ServiceType.OLLAMA
     AGENT_SERVICE: ServiceType = ServiceType.DEEPSEEK
 
+    # LLM HTTP client settings
+    LLM_HTTP_MAX_CONNECTIONS: int = 100  # 每个上游主机的最大连接数
+    LLM_HTTP_MAX_KEEPALIVE: int = 20  # 每个上游主机保留的空闲长连接数
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 30  # 空闲长连接的保留时间(秒)
+    LLM_HTTP_TIMEOUT: float = 600  # 读写超时(秒), 长回复的流式生成可能持续较久
+    LLM_HTTP_CONNECT_TIMEOUT: float = 5  # 建立连接的超时(秒)
+
+    # Streaming settings
+    SSE_COALESCE_WINDOW_MS: float = 0  # 合并相邻 token 的时间窗口(毫秒), 0 表示逐 token 发送
+    SSE_COALESCE_MAX_CHARS: int = 512  # 合并时一帧最多累积的字符数, 达到后立即发送, 0 表示不限制
+    SSE_DISCONNECT_POLL_INTERVAL: float = 1.0  # 检查客户端是否断开的间隔(秒)
+
     # Search settings
     SERPAPI_KEY: str
     SEARCH_RESULT_COUNT: int = 3
     SERPAPI_URL: str
     SERPAPI_TIMEOUT: int = 15
+    SERPAPI_MAX_CONNECTIONS: int = 20  # 到 SerpAPI 的最大并发连接数
+    SEARCH_LANGUAGE: str = "zh-CN"  # 搜索结果语言(hl)
+    SEARCH_COUNTRY: str = "cn"  # 搜索地区(gl)
+    SEARCH_CACHE_TTL: float = 300  # 搜索结果缓存时间(秒), 0 表示不缓存
+    SEARCH_CACHE_SIZE: int = 1024  # 最多缓存的查询数
+    SEARCH_CONTEXT_TOKEN_BUDGET: int = 1500  # 发送给模型的搜索结果上下文的 token 预算(本地估算)
+    SEARCH_SNIPPET_DEDUP_THRESHOLD: float = 0.8  # 摘要相似度(二元组 Jaccard)达到该值视为重复
+    TOOL_TIMEOUT: float = 20  # 单次工具调用的超时(秒)
+    TOOL_MAX_CONCURRENCY: int = 8  # 同一工具同时执行的调用数上限
 
     SEARCH_USE_OLLAMA: bool = True
 
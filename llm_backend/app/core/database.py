@@ -1,19 +1,61 @@
 import logging
+import time
+from sqlalchemy import event, exc
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.core.config import settings
+from app.core.metrics import metrics
 
-# 设置 SQLAlchemy 日志级别为 INFO，以显示 SQL 查询日志, 便于调试
-logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+# 仅在调试时输出 SQL 查询日志; 生产环境每条语句都经过日志系统代价很高
+if settings.DB_ECHO:
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """记录取连接耗时和超时次数的连接池, 占用情况由 instrument_pool 通过连接池事件导出"""
+
+    def connect(self):
+        start_time = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            metrics.inc("db.pool.timeouts")
+            raise
+        finally:
+            metrics.observe("db.pool.checkout_seconds", time.perf_counter() - start_time)
+
+def _report_pool_usage(pool, checked_out: int, capacity: int):
+    metrics.set_gauge("db.pool.checked_out", checked_out)
+    metrics.set_gauge("db.pool.overflow", max(pool.overflow(), 0))
+    metrics.set_gauge("db.pool.saturation", checked_out / capacity if capacity else 0.0)
+
+def instrument_pool(engine, capacity: int):
+    """在连接取出和归还时导出连接池占用情况, 用于根据实际数据调整连接池大小
+
+    capacity 为连接池大小加上最多溢出的连接数; 监听注册在引擎上, dispose 重建连接池后仍然有效
+    """
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _report_pool_usage(engine.pool, engine.pool.checkedout(), capacity)
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        # checkin 事件在连接放回连接池之前触发, 此时仍计入正在归还的这个连接
+        _report_pool_usage(engine.pool, engine.pool.checkedout() - 1, capacity)
 
 # 创建异步引擎
 engine= create_async_engine(
     settings.DATABASE_URL,
-    echo = True,   # 设置为 False 也可以关闭 SQL 日志
+    echo = settings.DB_ECHO,   # 默认关闭 SQL 日志
+    poolclass = MeteredQueuePool,
     pool_pre_ping = True, # 自动检测断开的连接
-    pool_size = 5,  # 连接池大小， 保持 5 个连接处于可用状态。在高并发情况下，最多可以同时处理 5 个数据库请求，而不需要每次都去创建新的连接。
-    max_overflow = 10  # 最大连接数
+    pool_size = settings.DB_POOL_SIZE,  # 连接池大小, 常驻的连接数, 并发请求在此范围内不需要新建连接
+    max_overflow = settings.DB_MAX_OVERFLOW,  # 超出连接池大小后最多再创建的连接数
+    pool_recycle = settings.DB_POOL_RECYCLE, # 定期重建连接, 避免使用已被 MySQL 关闭的连接
+    pool_timeout = settings.DB_POOL_TIMEOUT, # 等待空闲连接的超时
+    query_cache_size = settings.DB_QUERY_CACHE_SIZE # 编译后语句的缓存, 热点语句不必每次重新编译
 )
+instrument_pool(engine.sync_engine, settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW)
 
 # 创建异步会话工厂, 用于生成数据库会话
 AsyncSessionLocal = sessionmaker(
@@ -35,4 +77,4 @@ async def get_db():
             await session.rollback() # 回滚事务
             raise # 抛出异常
         finally:
-            await session.close()  # 关闭会话, await 关键字表示这是一个异步操作
\ No newline at end of file
+            await session.close()  # 关闭会话, await 关键字表示这是一个异步操作
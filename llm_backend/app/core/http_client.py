@@ -0,0 +1,37 @@
+from typing import Dict
+import httpx
+from openai import DefaultAsyncHttpxClient
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="http_client")
+
+# 按上游地址划分的共享 httpx 客户端, 每个主机一个连接池
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def get_http_client(base_url: str) -> httpx.AsyncClient:
+    """获取某个上游地址共用的 httpx 客户端, 供 AsyncOpenAI(http_client=...) 使用
+
+    同一主机的所有请求复用一个连接池, 连接数和长连接参数由配置决定
+    """
+    client = _clients.get(base_url)
+    if client is None or client.is_closed:
+        # DefaultAsyncHttpxClient 保留 openai SDK 的默认设置(如跟随重定向)
+        client = DefaultAsyncHttpxClient(
+            limits = httpx.Limits(
+                max_connections = settings.LLM_HTTP_MAX_CONNECTIONS, # 单个主机的最大连接数
+                max_keepalive_connections = settings.LLM_HTTP_MAX_KEEPALIVE, # 空闲时保留的长连接数
+                keepalive_expiry = settings.LLM_HTTP_KEEPALIVE_EXPIRY # 空闲长连接的保留时间(秒)
+            ),
+            timeout = httpx.Timeout(settings.LLM_HTTP_TIMEOUT, connect=settings.LLM_HTTP_CONNECT_TIMEOUT)
+        )
+        _clients[base_url] = client
+        logger.info(f"HTTP connection pool created for {base_url}, max_connections={settings.LLM_HTTP_MAX_CONNECTIONS}")
+    return client
+
+async def close_http_clients():
+    """关闭所有共享客户端, 在应用退出时调用"""
+    for base_url, client in list(_clients.items()):
+        await client.aclose()
+        logger.info(f"HTTP connection pool closed for {base_url}")
+    _clients.clear()
@@ -1,5 +1,39 @@
+from typing import Tuple
 import numpy as np
 
 def cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
     """计算两个向量的余弦相似度"""
-    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
\ No newline at end of file
+    return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
+
+def normalize(vectors) -> np.ndarray:
+    """归一化为 float32 单位向量, 支持单个向量或按行归一化的矩阵, 零向量保持为零"""
+    arr = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    np.maximum(norms, np.finfo(np.float32).tiny, out=norms) # 避免除以零
+    return arr / norms
+
+def cosine_similarity_batch(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """一个已归一化的查询向量与 N×D 已归一化矩阵的余弦相似度, 一次矩阵乘法完成"""
+    return matrix @ query
+
+def cosine_similarity_many(queries: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Q×D 个已归一化查询与 N×D 已归一化矩阵的相似度, 返回 Q×N, 用于批量任务"""
+    return queries @ matrix.T
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """用 argpartition 取最大的 k 个分数, 返回 (下标, 分数), 按分数降序
+
+    scores 为一维时返回一维结果; 为 Q×N 时对每一行分别取 top-k
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        empty = np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+        return empty, np.empty(empty.shape, dtype=scores.dtype)
+    if k == n:
+        top = np.argsort(-scores, axis=-1)
+    else:
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1)
+        top = np.take_along_axis(top, order, axis=-1)
+    return top, np.take_along_axis(scores, top, axis=-1)
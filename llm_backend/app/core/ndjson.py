@@ -0,0 +1,50 @@
+from typing import Any, List
+from app.core.logger import get_logger
+from app.core.sse import json_loads
+
+logger = get_logger(service="ndjson")
+
+class NDJSONParser:
+    """增量 NDJSON 解析器
+
+    按任意大小的块喂入数据, 只解析已经完整的行; 不完整的尾部留在缓冲区,
+    下次只从新数据中查找换行, 不会重复扫描或重新拼接半行
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0 # 缓冲区中已确认没有换行的长度
+
+    def feed(self, data: bytes) -> List[Any]:
+        """喂入一块数据, 返回其中解析出的完整对象"""
+        self._buffer += data
+        objects = []
+        start = 0
+        search_from = self._scanned
+        while True:
+            end = self._buffer.find(b"\n", search_from)
+            if end == -1:
+                break
+            self._parse_line(start, end, objects)
+            start = search_from = end + 1
+        if start:
+            del self._buffer[:start] # 一次性丢弃本块中已解析的所有行
+        self._scanned = len(self._buffer)
+        return objects
+
+    def flush(self) -> List[Any]:
+        """数据结束时解析最后一行(没有换行结尾的情况)"""
+        objects = []
+        self._parse_line(0, len(self._buffer), objects)
+        self._buffer.clear()
+        self._scanned = 0
+        return objects
+
+    def _parse_line(self, start: int, end: int, objects: List[Any]):
+        line = self._buffer[start:end].strip()
+        if not line:
+            return
+        try:
+            objects.append(json_loads(line))
+        except ValueError as e:
+            logger.error(f"JSON decode error: {str(e)}")
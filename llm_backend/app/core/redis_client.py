@@ -0,0 +1,35 @@
+from typing import Optional
+from redis.asyncio import BlockingConnectionPool, Redis
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(service="redis_client")
+
+_pool: Optional[BlockingConnectionPool] = None
+_client: Optional[Redis] = None
+
+def get_redis() -> Redis:
+    """获取进程内共享的异步 Redis 客户端
+
+    所有调用方共用一个有上限的连接池, 连接用完时等待而不是无限新建
+    """
+    global _pool, _client
+    if _client is None:
+        _pool = BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections = settings.REDIS_MAX_CONNECTIONS, # 每个进程的最大连接数
+            timeout = settings.REDIS_POOL_TIMEOUT # 等待空闲连接的最长时间(秒)
+        )
+        _client = Redis(connection_pool=_pool)
+        logger.info(f"Redis connection pool created, max_connections={settings.REDIS_MAX_CONNECTIONS}")
+    return _client
+
+async def close_redis():
+    """关闭共享客户端并断开连接池中的所有连接"""
+    global _pool, _client
+    if _client is not None:
+        await _client.aclose()
+        await _pool.disconnect()
+        _client = None
+        _pool = None
+        logger.info("Redis connection pool closed")
@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,8 +7,8 @@ from fastapi.security import OAuth2PasswordBearer
 
 from app.core.config import settings
 from app.services.user_service import UserService
-from app.core.database import get_db
-from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.user_cache import UserPrincipal, get_user_cache
+from app.core.database import AsyncSessionLocal
 from app.core.logger import get_logger
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token") # 定义 OAuth2 密码模式的令牌 URL
@@ -21,19 +22,20 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         # 如果没有提供 expires_delta，则 30 分钟后过期
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire}) # 将过期时间添加到要编码的数据
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex}) # 添加过期时间和令牌 ID, 退出登录时按 jti 撤销
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM) # 使用 SECRET_KEY 和指定的算法编码 JWT
     return encoded_jwt
 
-async def get_current_user(
-        token: str = Depends(oauth2_scheme),
-        db: AsyncSession = Depends(get_db)
-):
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def get_token_payload(token: str = Depends(oauth2_scheme)) -> dict:
+    """解码令牌, 已撤销的令牌视为无效"""
+    credentials_exception = _credentials_exception()
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -45,10 +47,30 @@ async def get_current_user(
     except JWTError: # 捕获 JWT 解码错误
         logger.warning("JWT decode error")
         raise credentials_exception
-
-    user_service = UserService(db)
-    user = await user_service.get_user_by_email(email=email)
-    if not user:
-        logger.warning(f"User not found: {email}")
+    jti = payload.get("jti")
+    if jti and get_user_cache().is_revoked(jti):
+        logger.warning(f"Revoked token: {email}")
         raise credentials_exception
-    return user
+    return payload
+
+async def get_current_user(payload: dict = Depends(get_token_payload)) -> UserPrincipal:
+    email: str = payload["sub"]
+    # 先查缓存, 未命中时才打开只读的数据库会话
+    cache = get_user_cache()
+    principal = await cache.get(email)
+    if principal is None:
+        async with AsyncSessionLocal() as db:
+            user = await UserService(db).get_user_by_email(email=email)
+        if not user:
+            logger.warning(f"User not found: {email}")
+            raise _credentials_exception()
+        principal = UserPrincipal.from_user(user)
+        await cache.set(principal)
+    # 被停用的用户即使令牌未过期也不能继续访问; 状态变化时会失效缓存, 这里读到的是最新状态
+    if principal.status != "active":
+        logger.warning(f"Inactive user: {email}, status: {principal.status}")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User is not active",
+        )
+    return principal
@@ -0,0 +1,110 @@
+import asyncio
+import json
+from typing import Any, AsyncGenerator, AsyncIterator
+from app.core.config import settings
+
+# JSON 后端: 优先使用 orjson, 其次 msgspec, 都没有安装时退回标准库
+try:
+    import orjson
+
+    JSON_BACKEND = "orjson"
+
+    def json_dumps(obj: Any) -> bytes:
+        """序列化为 UTF-8 字节, 中文不转义"""
+        return orjson.dumps(obj)
+
+    def json_loads(data) -> Any:
+        """反序列化, 解析失败抛出 ValueError"""
+        return orjson.loads(data)
+except ImportError:
+    try:
+        import msgspec
+
+        JSON_BACKEND = "msgspec"
+        _encoder = msgspec.json.Encoder()
+        _decoder = msgspec.json.Decoder()
+
+        def json_dumps(obj: Any) -> bytes:
+            """序列化为 UTF-8 字节, 中文不转义"""
+            return _encoder.encode(obj)
+
+        def json_loads(data) -> Any:
+            """反序列化, 解析失败抛出 ValueError"""
+            try:
+                return _decoder.decode(data)
+            except msgspec.DecodeError as e:
+                raise ValueError(str(e)) from e
+    except ImportError:
+        JSON_BACKEND = "json"
+
+        def json_dumps(obj: Any) -> bytes:
+            """序列化为 UTF-8 字节, 中文不转义"""
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+        def json_loads(data) -> Any:
+            """反序列化, 解析失败抛出 ValueError"""
+            return json.loads(data)
+
+def encode_data(obj: Any) -> bytes:
+    """编码一个 SSE data 帧"""
+    return b"data: " + json_dumps(obj) + b"\n\n"
+
+async def _next(iterator: AsyncIterator):
+    return await iterator.__anext__()
+
+async def coalesce(tokens: AsyncIterator[str], window: float, max_chars: int = None) -> AsyncGenerator[str, None]:
+    """把 window 秒内陆续到达的 token 合并成一段, 减少帧数和写操作
+
+    window <= 0 时原样透传; 一段累积到 max_chars 个字符时不等窗口结束立即发出(<= 0 不限制).
+    等待下一个 token 的任务跨窗口保留, 不会因超时被取消; 结束或被关闭时同时关闭 tokens, 让上游连接及时释放
+    """
+    if max_chars is None:
+        max_chars = settings.SSE_COALESCE_MAX_CHARS
+    loop = asyncio.get_running_loop()
+    iterator = tokens.__aiter__()
+    pending = None
+    try:
+        if window <= 0:
+            async for token in iterator:
+                yield token
+            return
+
+        while True:
+            # 窗口从这一段的第一个 token 到达时开始计时
+            if pending is None:
+                pending = asyncio.ensure_future(_next(iterator))
+            try:
+                buffer = [await pending]
+            except StopAsyncIteration:
+                return
+            pending = None
+            deadline = loop.time() + window
+            size = len(buffer[0])
+
+            finished = False
+            while max_chars <= 0 or size < max_chars:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                pending = asyncio.ensure_future(_next(iterator))
+                done, _ = await asyncio.wait({pending}, timeout=remaining)
+                if not done:
+                    break # 超时, 保留 pending 留给下一段
+                task, pending = pending, None
+                try:
+                    buffer.append(task.result())
+                    size += len(buffer[-1])
+                except StopAsyncIteration:
+                    finished = True
+                    break
+            yield "".join(buffer)
+            if finished:
+                return
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            # 等待取消完成, 否则 tokens 仍在运行, 无法关闭
+            await asyncio.gather(pending, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
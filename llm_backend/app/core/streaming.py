@@ -0,0 +1,91 @@
+import asyncio
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Optional, Set, TypeVar
+from fastapi import Request
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.metrics import metrics
+from app.core.tokens import estimate_tokens
+
+logger = get_logger(service="streaming")
+
+T = TypeVar("T")
+
+# 后台任务的强引用, 防止任务在完成前被垃圾回收
+_background_tasks: Set[asyncio.Task] = set()
+
+def run_detached(coro: Awaitable) -> asyncio.Task:
+    """在后台运行协程, 不受调用方取消的影响"""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def _next(iterator: AsyncIterator[T]) -> T:
+    return await iterator.__anext__()
+
+async def stream_until_disconnect(
+        request: Request,
+        stream: AsyncIterator[T],
+        poll_interval: float = None
+) -> AsyncGenerator[T, None]:
+    """转发 stream 的输出, 同时定期检查客户端是否已断开
+
+    上游长时间没有输出(如模型在思考)时也能发现断开; 断开后取消正在等待的读取并关闭 stream,
+    由各服务在收到取消后关闭上游连接、保存部分回答
+    """
+    poll_interval = poll_interval or settings.SSE_DISCONNECT_POLL_INTERVAL
+    iterator = stream.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    loop = asyncio.get_running_loop()
+    next_check = loop.time() + poll_interval
+    try:
+        while True:
+            pending = asyncio.ensure_future(_next(iterator))
+            while True:
+                # 输出持续不断时也按间隔检查, 不只在等待超时时检查
+                done, _ = await asyncio.wait({pending}, timeout=max(0, next_check - loop.time()))
+                if done:
+                    break
+                if await request.is_disconnected():
+                    logger.info(f"Client disconnected from {request.url.path}, aborting stream")
+                    metrics.inc("stream.client_disconnects")
+                    return
+                next_check = loop.time() + poll_interval
+            task, pending = pending, None
+            try:
+                item = task.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+async def handle_disconnect(
+        service: str,
+        partial_response: str,
+        save: Optional[Callable[[], Awaitable]] = None
+):
+    """生成被中断时调用: 记录已生成的 token 数, 并在后台保存部分回答
+
+    保存放在独立任务中并用 shield 等待, 调用方再次被取消时保存仍会完成
+    """
+    tokens = estimate_tokens(partial_response)
+    metrics.inc(f"{service}.stream.aborted")
+    metrics.inc(f"{service}.stream.aborted_tokens", tokens)
+    logger.info(f"{service} stream aborted after ~{tokens} tokens")
+    if save is None or not partial_response:
+        return
+
+    async def save_partial():
+        try:
+            await save()
+            metrics.inc(f"{service}.stream.partial_tokens_saved", tokens)
+        except Exception as e:
+            logger.error(f"Error saving partial response: {str(e)}", exc_info=True)
+
+    await asyncio.shield(run_detached(save_partial()))
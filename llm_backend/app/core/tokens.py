@@ -0,0 +1,13 @@
+import re
+
+# 中日韩字符大致一个字一个 token, 其余文本按约 4 个字符一个 token 估算
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯]")
+_CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """本地估算文本的 token 数, 不依赖分词器"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + _CHARS_PER_TOKEN - 1) // _CHARS_PER_TOKEN
@@ -0,0 +1,61 @@
+import json
+import struct
+import numpy as np
+
+# 二进制向量格式:
+#   第 1 字节: 格式版本
+#   第 2 字节: 数据类型 (见 DTYPE_CODES)
+#   int8 额外带 4 字节 little-endian float32 缩放系数
+#   之后是 little-endian 的向量数据
+FORMAT_VERSION = 1
+
+DTYPE_CODES = {
+    "float32": 0,
+    "float16": 1,
+    "int8": 2,
+}
+_CODE_DTYPES = {
+    0: np.dtype("<f4"),
+    1: np.dtype("<f2"),
+    2: np.dtype("i1"),
+}
+_HEADER = struct.Struct("<BB")
+_SCALE = struct.Struct("<f")
+
+
+def encode_vector(vector, dtype: str = "float32") -> bytes:
+    """把向量编码为带版本号的二进制格式"""
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported vector dtype: {dtype}")
+    arr = np.asarray(vector, dtype=np.float32)
+    header = _HEADER.pack(FORMAT_VERSION, DTYPE_CODES[dtype])
+    if dtype == "int8":
+        # 对称量化, 单位向量的分量在 [-1, 1] 之间, 误差对余弦相似度影响很小
+        scale = float(np.abs(arr).max()) / 127 or 1.0
+        quantized = np.clip(np.rint(arr / scale), -127, 127).astype(np.int8)
+        return header + _SCALE.pack(scale) + quantized.tobytes()
+    return header + arr.astype(_CODE_DTYPES[DTYPE_CODES[dtype]]).tobytes()
+
+
+def is_legacy(raw: bytes) -> bool:
+    """是否为旧版本写入的 JSON 文本格式"""
+    return raw[:1] == b"["
+
+
+def decode_vector(raw: bytes) -> np.ndarray:
+    """解码向量, float32 用 np.frombuffer 零拷贝; 兼容旧的 JSON 格式"""
+    if is_legacy(raw):
+        return np.asarray(json.loads(raw), dtype=np.float32)
+    version, code = _HEADER.unpack_from(raw)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported vector format version: {version}")
+    dtype = _CODE_DTYPES.get(code)
+    if dtype is None:
+        raise ValueError(f"Unsupported vector dtype code: {code}")
+    offset = _HEADER.size
+    if code == DTYPE_CODES["int8"]:
+        (scale,) = _SCALE.unpack_from(raw, offset)
+        offset += _SCALE.size
+        return np.frombuffer(raw, dtype=dtype, offset=offset).astype(np.float32) * np.float32(scale)
+    data = np.frombuffer(raw, dtype=dtype, offset=offset)
+    return data if dtype == np.float32 else data.astype(np.float32)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, Enum
+from sqlalchemy import Column, Integer, String, DateTime, func, Enum, Index
 from app.core.database import Base
 import enum
 
@@ -11,6 +11,10 @@ class DialogueType(enum.Enum):
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # 按用户查询会话列表并按创建时间倒序
+        Index("ix_conversations_user_created", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False)
@@ -18,4 +22,6 @@ class Conversation(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     status = Column(String(32), default="ongoing")
-    dialogue_type = Column(Enum(DialogueType), nullable=False)
\ No newline at end of file
+    dialogue_type = Column(Enum(DialogueType), nullable=False)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")  # 消息条数, 写入消息时原子递增
+    last_message_at = Column(DateTime, nullable=True)  # 最后一条消息的时间
\ No newline at end of file
@@ -1,12 +1,16 @@
 
 from app.core.database import Base
-from sqlalchemy import Column, Integer, String, DateTime, Text, func
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, func
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # 按会话查询并按 (created_at, id) 排序/分页, 同时满足外键对 conversation_id 索引的要求
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key = True, index = True)
-    conversation_id = Column(Integer, nullable = False)
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete = "CASCADE", name = "fk_messages_conversation_id"), nullable = False)  # 删除会话时级联删除消息
     sender = Column(String(64), nullable = False)
     content = Column(Text, nullable = False)
     created_at = Column(DateTime, server_default = func.now())
@@ -0,0 +1,61 @@
+"""按工具集合预编译的提示词和工具描述, 每个进程只构建一次"""
+import hashlib
+from typing import Dict, List, NamedTuple, Tuple
+from app.core.logger import get_logger
+from app.core.sse import json_dumps
+from app.prompts.search_prompts import SEARCH_SYSTEM_PROMPT, SEARCH_SUMMARY_SYSTEM_PROMPT
+from app.services.function_tools import ToolRegistry
+
+logger = get_logger(service="prompt_registry")
+
+class CompiledPrompts(NamedTuple):
+    """一组工具对应的静态请求内容
+
+    系统提示词不含任何按请求变化的内容, 字节完全固定, 上游的前缀(KV)缓存才能命中
+    """
+    tools_key: Tuple[str, ...]
+    tools: List[Dict]  # 工具定义, 每个请求复用同一个列表
+    system_message: Dict
+    summary_system_message: Dict
+    fingerprint: str  # 系统提示词 + 工具定义的哈希, 用于确认前缀在请求之间保持不变
+
+def describe_tools(definitions: List[Dict]) -> str:
+    """生成系统提示词中的工具说明"""
+    tool_description = []
+    for tool_def in definitions:
+        func = tool_def.get("function")
+        params = []
+
+        # 获取必须参数和描述
+        for param_name, param_info in func["parameters"]["properties"].items():
+            if param_name in func["parameters"].get("required", []):
+                params.append(f"{param_name}, 作用是: {param_info['description']}")
+
+        tool_desc = f"{func['name']},{func['description']}"
+        if params:
+            tool_desc += f", 必须参数有: {', '.join(params)}"
+        tool_description.append(tool_desc)
+    return "当前可用的工具有: " + " ; ".join(tool_description)
+
+def _compile(registry: ToolRegistry) -> CompiledPrompts:
+    tools = registry.get_tools_definition()
+    system_prompt = SEARCH_SYSTEM_PROMPT.format(tools_description=describe_tools(tools))
+    fingerprint = hashlib.sha1(system_prompt.encode("utf-8") + b"\0" + json_dumps(tools)).hexdigest()[:12]
+    return CompiledPrompts(
+        tools_key=registry.tools_key(),
+        tools=tools,
+        system_message={"role": "system", "content": system_prompt},
+        summary_system_message={"role": "system", "content": SEARCH_SUMMARY_SYSTEM_PROMPT},
+        fingerprint=fingerprint,
+    )
+
+_compiled: Dict[Tuple[str, ...], CompiledPrompts] = {}
+
+def get_compiled_prompts(registry: ToolRegistry) -> CompiledPrompts:
+    """获取工具集合对应的预编译内容, 相同工具集合的服务共用一份"""
+    key = registry.tools_key()
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = _compiled[key] = _compile(registry)
+        logger.info(f"Compiled prompts for tools {key}, fingerprint {compiled.fingerprint}")
+    return compiled
@@ -1,5 +1,4 @@
 """搜索服务的提示词管理"""
-from datetime import datetime
 
 # 基础系统提示
 SEARCH_SYSTEM_PROMPT = """你是一个智能助手，可以通过调用外部的工具获取实时信息。
@@ -14,10 +13,8 @@ SEARCH_SYSTEM_PROMPT = """你是一个智能助手，可以通过调用外部的
 4. 问题中包含'最新'、'当前'、'今天'等时间敏感关键词。
 其他情况下，请直接回答用户的问题。"""
 
-# 搜索结果总结提示
-SEARCH_SUMMARY_PROMPT = """# 以下内容是基于用户发送的消息的搜索结果:
-
-{context}
+# 搜索结果总结的系统提示, 不含按请求变化的内容, 作为固定前缀发送
+SEARCH_SUMMARY_SYSTEM_PROMPT = """用户消息中会给出基于用户问题的搜索结果, 请根据搜索结果回答用户问题。
 
 每个搜索结果包含标题、链接和内容。在引用来源时，请使用以下固定格式：
 - 引用格式：[标题](链接)
@@ -27,14 +24,20 @@ SEARCH_SUMMARY_PROMPT = """# 以下内容是基于用户发送的消息的搜索
 
 在回答时，请注意以下几点：
 
-今天是{cur_date}。
 1. 并非搜索结果的所有内容都与用户的问题密切相关，你需要结合问题，对搜索结果进行甄别、筛选。
 2. 对于列举类的问题，尽量将答案控制在10个要点以内，并告诉用户可以查看搜索来源、获得完整信息。
 3. 对于创作类的问题，请务必在每个段落末尾使用规定格式引用来源。
 4. 如果回答很长，请尽量结构化、分段落总结。如果需要分点作答，尽量控制在5个点以内。
 5. 对于客观类的问答，如果答案非常简短，可以适当补充相关信息。
 6. 你需要根据用户要求和回答内容选择合适、美观的回答格式，确保可读性强。
-7. 你的回答应该综合多个相关网页来回答，不要重复引用同一个来源。
+7. 你的回答应该综合多个相关网页来回答，不要重复引用同一个来源。"""
+
+# 搜索结果总结提示, 按请求变化的部分放在固定前缀之后
+SEARCH_SUMMARY_PROMPT = """# 以下内容是基于用户发送的消息的搜索结果:
+
+{context}
+
+今天是{cur_date}。
 
 用户问题：{query}"""
 
@@ -1,15 +1,26 @@
-from typing import List, Dict
-
-from openai import conversations
+import base64
+from datetime import datetime
+from typing import AsyncGenerator, List, Dict, NamedTuple, Optional, Tuple
 
+from app.core.config import settings
 from app.core.database import AsyncSessionLocal
+from app.core.sse import json_dumps
 from app.models.conversation import Conversation, DialogueType
 from app.models.message import Message
 from app.core.logger import get_logger
-from sqlalchemy import select
+from sqlalchemy import and_, delete, or_, select
 
 logger = get_logger(service="conversation")
 
+class InvalidCursorError(ValueError):
+    """分页游标格式不正确"""
+
+class MessagePage(NamedTuple):
+    """一页消息, 以及向前/向后翻页用的游标(没有更多时为 None)"""
+    messages: List[Dict]
+    before_cursor: Optional[str]
+    after_cursor: Optional[str]
+
 class ConversationService:
 
     @staticmethod
@@ -36,60 +47,6 @@ class ConversationService:
             logger.info(f"Created new conversation {conversation.id} for user {user_id}")
             return conversation.id
 
-    @staticmethod
-    async def save_message(
-        user_id: int,
-        conversation_id: int,
-        messages: List[Dict],
-        response: str
-    ):
-        # 保存对话信息
-        try:
-            async with AsyncSessionLocal() as db:
-                # 查询会话
-                stmt = select(Conversation).where(Conversation.id == conversation_id)
-                result = await db.execute(stmt)
-                conversation = result.scalar_one_or_none()
-
-                if not conversation:
-                    logger.error(f"Conversation {conversation_id} not found")
-                    return
-
-                # 查询现有消息数量
-                stmt = select(Message).where(Message.conversation_id == conversation_id)
-                result = await db.execute(stmt)
-                message_count = len(result.all())
-
-                # 获取用户的问题内容
-                user_content = next((msg["content"] for msg in messages if msg["role"] == "user"), "")
-
-                # 如果是第一条消息，更新会话标题
-                if message_count == 0:
-                    title = ConversationService.get_conversation_title(user_content)
-                    conversation.title = title
-
-                # 保存用户消息
-                user_message = Message(
-                    conversation_id = conversation_id,
-                    role = "user",
-                    content = user_content
-                )
-                db.add(user_message)
-
-                # 保存模型回复
-                assistant_message = Message(
-                    conversation_id = conversation_id,
-                    sender = "assistant",
-                    content = response
-                )
-                db.add(assistant_message)
-                await db.commit()
-        except (Exception) as e:
-            logger.error(f"Error saving conversation: {str(e)}", exc_info=True)
-            logger.error(
-                f"Error details - user_id: {user_id}, conversation_id: {conversation_id}")
-            logger.error(f"Messages: {messages}")
-
     @staticmethod
     async def get_user_conversations(user_id: int) -> List[Dict]:
         try:
@@ -118,67 +75,210 @@ class ConversationService:
 
 
     @staticmethod
-    async def get_conversation_messages(conversation_id: int, user_id: int) -> List[Dict]:
-        # 获取回话里所有消息
+    def encode_cursor(created_at: datetime, message_id: int) -> str:
+        """把 (created_at, id) 编码成不透明的分页游标"""
+        raw = f"{created_at.isoformat()}|{message_id}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+        """解析分页游标, 格式不正确时抛出 InvalidCursorError"""
         try:
+            raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+            created_at, message_id = raw.split("|", 1)
+            return datetime.fromisoformat(created_at), int(message_id)
+        except Exception:
+            raise InvalidCursorError(f"Invalid cursor: {cursor}")
+
+    @staticmethod
+    def _message_to_dict(row) -> Dict:
+        return {
+            "id": row.id,
+            "sender": row.sender,
+            "content": row.content,
+            "created_at": row.created_at.isoformat(),
+            "message_type": row.message_type
+        }
+
+    @staticmethod
+    def _messages_query(conversation_id: int, before: Optional[str] = None, after: Optional[str] = None):
+        """只查询需要的列, 按 (created_at, id) 做键集分页条件"""
+        stmt = select(
+            Message.id,
+            Message.sender,
+            Message.content,
+            Message.created_at,
+            Message.message_type
+        ).where(Message.conversation_id == conversation_id)
+        # 展开成 OR 条件而不是行比较, 便于 MySQL 走 (conversation_id, created_at, id) 索引的范围扫描
+        if before:
+            created_at, message_id = ConversationService.decode_cursor(before)
+            stmt = stmt.where(or_(
+                Message.created_at < created_at,
+                and_(Message.created_at == created_at, Message.id < message_id)
+            ))
+        if after:
+            created_at, message_id = ConversationService.decode_cursor(after)
+            stmt = stmt.where(or_(
+                Message.created_at > created_at,
+                and_(Message.created_at == created_at, Message.id > message_id)
+            ))
+        return stmt
+
+    @staticmethod
+    async def _ensure_conversation_owner(db, conversation_id: int, user_id: int):
+        """验证会话是否属于用户"""
+        stmt = select(Conversation.id).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == user_id
+        )
+        result = await db.execute(stmt)
+        if result.scalar_one_or_none() is None:
+            raise ValueError(f"Conversation {conversation_id} not found")
+
+    @staticmethod
+    async def verify_conversation_owner(conversation_id: int, user_id: int):
+        """验证会话是否属于用户, 不属于时抛出 ValueError"""
+        async with AsyncSessionLocal() as db:
+            await ConversationService._ensure_conversation_owner(db, conversation_id, user_id)
+
+    @staticmethod
+    async def get_conversation_messages(
+            conversation_id: int,
+            user_id: int,
+            limit: Optional[int] = None,
+            before: Optional[str] = None,
+            after: Optional[str] = None
+    ) -> MessagePage:
+        """按 (created_at, id) 游标分页获取会话消息, 每页按时间升序返回
+
+        - 不带 limit 和游标: 全部消息(与分页之前的行为一致)
+        - 只带 limit: 最新的 limit 条
+        - before: 游标之前(更早)的 limit 条
+        - after: 游标之后(更新)的 limit 条
+        """
+        try:
+            paginated = limit is not None or before or after
+            limit = limit or settings.MESSAGE_PAGE_DEFAULT_LIMIT
             async with AsyncSessionLocal() as db:
                 # 首先验证回话是否属于用户
-                stmt = select(Conversation).where(
-                    Conversation.id == conversation_id,
-                    Conversation.user_id == user_id
-                )
-                result = await db.execute(stmt)
-                conversation = result.scalar_one_or_none()
+                await ConversationService._ensure_conversation_owner(db, conversation_id, user_id)
 
-                if not conversation:
-                    raise ValueError(f"Conversation {conversation_id} not found")
+                stmt = ConversationService._messages_query(conversation_id, before, after)
+                # 多取一条判断是否还有下一页
+                if not paginated:
+                    stmt = stmt.order_by(Message.created_at, Message.id)
+                elif after:
+                    stmt = stmt.order_by(Message.created_at, Message.id).limit(limit + 1)
+                else:
+                    stmt = stmt.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+                result = await db.execute(stmt)
+                rows = result.all()
 
-                # 查询所有消息
-                stmt = select(Message).where(
-                    Message.conversation_id == conversation_id
-                ).order_by(Message.created_at)
+            has_more = paginated and len(rows) > limit
+            if paginated:
+                rows = rows[:limit]
+            if paginated and not after:
+                rows.reverse() # 倒序查询的结果恢复为时间升序
+            messages = [ConversationService._message_to_dict(row) for row in rows]
 
-                result = await db.execute(stmt)
-                messages = result.scalars().all()
-                return[
-                    {
-                        "id": msg.id,
-                        "sender": msg.sender,
-                        "content": msg.content,
-                        "created_at": msg.created_at.isoformat(),
-                        "message_type": msg.message_type
-                    }
-                    for msg in messages
-                ]
+            before_cursor = after_cursor = None
+            if rows:
+                # 向前翻页: 没有游标或 before 翻页时, 取决于是否还有更早的消息; after 翻页时前面总有消息
+                if has_more or after:
+                    before_cursor = ConversationService.encode_cursor(rows[0].created_at, rows[0].id)
+                # 向后翻页: 最后一条的游标, 可用于继续翻页或轮询新消息
+                after_cursor = ConversationService.encode_cursor(rows[-1].created_at, rows[-1].id)
+            return MessagePage(messages, before_cursor, after_cursor)
         except Exception as e:
             logger.error(f"Error fetching messages for conversation {conversation_id}: {str(e)}", exc_info=True)
             raise
 
+    @staticmethod
+    async def stream_conversation_messages(
+            conversation_id: int,
+            before: Optional[str] = None,
+            after: Optional[str] = None
+    ) -> AsyncGenerator[bytes, None]:
+        """以 NDJSON 流式返回会话消息(时间升序), 通过服务端游标逐批读取, 不在内存中保留全部消息
+
+        调用前先用 verify_conversation_owner 校验会话归属
+        """
+        stmt = ConversationService._messages_query(conversation_id, before, after) \
+            .order_by(Message.created_at, Message.id) \
+            .execution_options(yield_per=settings.MESSAGE_STREAM_BATCH_SIZE)
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(stmt)
+            async for row in result:
+                yield json_dumps(ConversationService._message_to_dict(row)) + b"\n"
+
     @staticmethod
     async def delete_conversation(conversation_id: int):
-        # 删除会话及其消息
+        # 删除会话及其消息: 两条批量 DELETE, 在同一个事务中完成
         try:
             async with AsyncSessionLocal() as db:
-                # 删除消息
-                stmt = select(Message).where(Message.conversation_id == conversation_id)
-                result = await db.execute(stmt)
-                messages = result.scalars().all()
-                for msg in messages:
-                    await db.delete(msg)
+                # 删除消息; 外键已设置级联删除, 这里显式删除以兼容尚未补建外键的旧库
+                result = await db.execute(delete(Message).where(Message.conversation_id == conversation_id))
+                message_count = result.rowcount
 
                 # 删除会话
-                stmt = select(Conversation).where(Conversation.id == conversation_id)
-                result = await db.execute(stmt)
-                conversation = result.scalar_one_or_none()
-                if conversation:
-                    await db.delete(conversation)
+                await db.execute(delete(Conversation).where(Conversation.id == conversation_id))
 
                 await db.commit()
-                logger.info(f"Deleted conversation {conversation_id} and its messages")
+                logger.info(f"Deleted conversation {conversation_id} and its {message_count} messages")
         except Exception as e:
             logger.error(f"Error deleting conversation {conversation_id}: {str(e)}", exc_info=True)
             raise
 
+    @staticmethod
+    async def purge_user_history(
+            user_id: int,
+            conversation_batch: int = None,
+            message_batch: int = None
+    ) -> Dict[str, int]:
+        """删除用户的全部会话和消息(如 GDPR 删除请求)
+
+        按批处理, 每批是一个独立的短事务: 先按 message_batch 条分块删除一批会话的消息, 再删除这些会话,
+        避免一次性删除大量数据时长时间持有锁
+        """
+        conversation_batch = conversation_batch or settings.PURGE_CONVERSATION_BATCH
+        message_batch = message_batch or settings.PURGE_MESSAGE_BATCH
+        deleted = {"conversations": 0, "messages": 0}
+        try:
+            while True:
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(
+                        select(Conversation.id).where(Conversation.user_id == user_id).limit(conversation_batch)
+                    )
+                    conversation_ids = result.scalars().all()
+                if not conversation_ids:
+                    break
+
+                while True:
+                    async with AsyncSessionLocal() as db:
+                        result = await db.execute(
+                            delete(Message)
+                            .where(Message.conversation_id.in_(conversation_ids))
+                            .with_dialect_options(mysql_limit=message_batch)
+                        )
+                        await db.commit()
+                    deleted["messages"] += result.rowcount
+                    if result.rowcount < message_batch:
+                        break
+
+                async with AsyncSessionLocal() as db:
+                    result = await db.execute(delete(Conversation).where(Conversation.id.in_(conversation_ids)))
+                    await db.commit()
+                deleted["conversations"] += result.rowcount
+            logger.info(
+                f"Purged history for user {user_id}: "
+                f"{deleted['conversations']} conversations, {deleted['messages']} messages"
+            )
+            return deleted
+        except Exception as e:
+            logger.error(f"Error purging history for user {user_id}: {str(e)}", exc_info=True)
+            raise
+
     @staticmethod
     async def update_conversation_name(conversation_id: int, name: str):
         # 更新会话名称
@@ -1,10 +1,15 @@
 import asyncio
-import json
 import time
+from contextlib import aclosing
+from app.core import sse
+from app.core.http_client import get_http_client
 from app.core.logger import get_logger
+from app.core.metrics import metrics
+from app.core.streaming import handle_disconnect, run_detached
+from app.core.tokens import estimate_tokens
 from openai import AsyncOpenAI
 from app.core.config import settings
-from app.services.redis_semantic_cache import RedisSemanticCache
+from app.services.redis_semantic_cache import CachedResponse, get_semantic_cache
 from typing import AsyncGenerator, List, Dict, Optional, Callable
 
 logger = get_logger(service="deepseek_service")
@@ -14,18 +19,58 @@ class DeepseekService:
         logger.info("DeepseekService initialized with model: %s", model)
         self.client = AsyncOpenAI(
             api_key = settings.DEEPSEEK_API_KEY,
-            base_url = settings.DEEPSEEK_BASE_URL
+            base_url = settings.DEEPSEEK_BASE_URL,
+            http_client = get_http_client(settings.DEEPSEEK_BASE_URL) # 共享连接池
         )
         self.model = model
-        self.cache = RedisSemanticCache(prefix="deepseek_cache")
+        self.cache = get_semantic_cache() # 进程内共享, 按 user_id 隔离
 
-    async def _stream_cached_response(self, response: str, delay: float = 0.05)-> AsyncGenerator[str, None]:
-        """模拟流式返回缓存的响应"""
-        # 每次返回 4 个字符
-        chunks = [response[i : i+4] for i in range(0, len(response), 4)]
-        for chunk in chunks:
-            await asyncio.sleep(delay) # 每次返回前等待 delay 秒
-            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+    def _encode_frames(self, response: str) -> bytes:
+        """把完整响应按 CACHE_REPLAY_CHUNK_SIZE 切块并编码成 SSE 帧, 写缓存时只做一次"""
+        size = max(1, settings.CACHE_REPLAY_CHUNK_SIZE)
+        return b"".join(sse.encode_data(response[i : i+size]) for i in range(0, len(response), size))
+
+    async def _stream_cached_response(self, cached: CachedResponse) -> AsyncGenerator[bytes, None]:
+        """回放缓存的响应, 方式由 CACHE_REPLAY_MODE 决定
+
+        - all: 所有帧一次发出
+        - chunked: 逐帧发出, 不等待
+        - paced: 按 CACHE_REPLAY_TOKENS_PER_SEC 的速率逐帧发出
+        """
+        frames = cached.frames or self._encode_frames(cached.text) # 旧条目没有预编码的帧
+        mode = settings.CACHE_REPLAY_MODE
+        if mode == "all":
+            yield frames
+            return
+
+        # JSON 字符串中的换行会被转义, 帧之间的空行可以安全地作为分隔符
+        parts = [part + b"\n\n" for part in frames.split(b"\n\n") if part]
+        if mode != "paced" or settings.CACHE_REPLAY_TOKENS_PER_SEC <= 0:
+            for part in parts:
+                yield part
+            return
+
+        # 按估算的 token 总数平均分配到每一帧, 以起始时间为基准计算发送时刻, 避免 sleep 误差累积
+        interval = estimate_tokens(cached.text) / settings.CACHE_REPLAY_TOKENS_PER_SEC / len(parts)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for i, part in enumerate(parts):
+            delay = start + i * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield part
+
+    async def _iter_content(self, response) -> AsyncGenerator[str, None]:
+        """从流式响应中取出文本增量, 提前结束时关闭上游 HTTP 流, DeepSeek 随之停止生成"""
+        finished = False
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            finished = True
+        finally:
+            if not finished:
+                await asyncio.shield(run_detached(response.close()))
 
     async def generate_stream(
             self,
@@ -33,22 +78,22 @@ class DeepseekService:
             user_id: Optional[int] = None,
             conversation_id: Optional[int] = None,
             on_complete: Optional[Callable[[int, int, List[Dict], str], None]] = None
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
        try:
-            # 为每个用户创建独立的缓存实例, 以支持多用户缓存隔离
-            cache = RedisSemanticCache(prefix = "deepseek_cache", user_id = user_id)
             start_time = time.time()
-            # 检查缓存
-            cached_response = await cache.lookup(messages)
+            # 检查缓存, 按用户 ID 隔离
+            cached_response = await self.cache.lookup(messages, user_id = user_id, model = self.model)
             if cached_response: # 缓存命中
                 response_time = time.time() - start_time
                 logger.info(f"Cache hit! Response time: {response_time:.4f} seconds")
 
                 async for chunk in self._stream_cached_response(cached_response):
                     yield chunk
+                # 缓存命中时从收到请求到最后一个字节的耗时
+                metrics.observe("deepseek.cache_hit.ttlb_seconds", time.time() - start_time)
 
                 if on_complete and user_id is not None and conversation_id is not None:
-                    await on_complete(user_id, conversation_id, messages, cached_response)
+                    await on_complete(user_id, conversation_id, messages, cached_response.text)
                 return
             # 缓存未命中，调用 Deepseek API
             full_response = []
@@ -58,15 +103,30 @@ class DeepseekService:
                 stream = True
             )
 
-            async for chunk in response:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    content = json.dumps(chunk.choices[0].delta.content, ensure_ascii=False)
-                    full_response.append(content)
-                    yield f"data: {content}\n\n"
+            try:
+                # 时间窗口内到达的 token 合并成一帧
+                async with aclosing(sse.coalesce(self._iter_content(response), settings.SSE_COALESCE_WINDOW_MS / 1000)) as stream:
+                    async for content in stream:
+                        full_response.append(content) # 缓存原始文本, 而不是 JSON 编码后的片段
+                        yield sse.encode_data(content)
+            except (asyncio.CancelledError, GeneratorExit):
+                # 客户端断开: 上游连接已关闭, 部分回答照常保存, 但不写入缓存
+                partial_response = "".join(full_response)
+                save = None
+                if on_complete and user_id is not None and conversation_id is not None:
+                    save = lambda: on_complete(user_id, conversation_id, messages, partial_response)
+                await handle_disconnect("deepseek", partial_response, save)
+                raise
 
             complete_response = "".join(full_response)
-            # 将新响应存入缓存
-            await cache.update(messages, complete_response)
+            # 将新响应连同预编码的 SSE 帧存入缓存, 命中时无需再逐块序列化; 在后台执行, 不拖慢流式响应的结束
+            run_detached(self.cache.update(
+                messages,
+                complete_response,
+                user_id = user_id,
+                model = self.model,
+                frames = self._encode_frames(complete_response)
+            ))
 
             response_time = time.time() - start_time
             logger.info(f"Cache miss. Response time: {response_time:.4f} seconds")
@@ -76,8 +136,7 @@ class DeepseekService:
 
        except Exception as e:
             logger.error(f"Error in generate_response: {str(e)}", exc_info=True)
-            error_msg = json.dumps(f"生成回复时出错: {str(e)}", ensure_ascii=False)
-            yield f"data: {error_msg}\n\n"
+            yield sse.encode_data(f"生成回复时出错: {str(e)}")
 
     async def generate(self, messages: List[Dict]) -> str:
         """非流式生成回复"""
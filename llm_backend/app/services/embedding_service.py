@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.streaming import run_detached
+
+logger = get_logger(service="embedding")
+
+class EmbeddingService:
+    """Ollama 向量服务
+
+    - 复用同一个 aiohttp 会话, 不再为每次调用建立新连接
+    - 以 hash(模型 + 文本) 为键的 LRU 缓存, 同一条消息在 lookup 和 update 中只计算一次
+    - 微批处理: 短时间窗口内的并发请求合并成一次 /api/embed 调用
+    """
+
+    def __init__(
+            self,
+            model_name: str = None,
+            cache_size: int = None,
+            batch_window: float = None,
+            max_batch_size: int = None
+    ):
+        self.base_url = settings.OLLAMA_BASE_URL
+        self.model_name = model_name or settings.OLLAMA_EMBEDDING_MODEL
+        self.cache_size = cache_size or settings.EMBEDDING_CACHE_SIZE
+        self.batch_window = batch_window if batch_window is not None else settings.EMBEDDING_BATCH_WINDOW_MS / 1000
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_BATCH_SIZE
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._memo: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {} # 正在计算的文本, 相同文本的并发请求共用一个结果
+        self._pending: List[Tuple[str, str]] = [] # 等待发送的 (键, 文本)
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        """关闭会话, 在应用退出时调用"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            await self._flush()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _memo_key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    async def embed(self, text: str) -> List[float]:
+        """获取文本向量"""
+        key = self._memo_key(text)
+        cached = self._memo.get(key)
+        if cached is not None:
+            self._memo.move_to_end(key) # 标记为最近使用
+            return cached
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            self._pending.append((key, text))
+            if len(self._pending) >= self.max_batch_size:
+                self._schedule_flush(0)
+            elif self._flush_handle is None:
+                self._schedule_flush(self.batch_window)
+        # shield 避免某个调用方被取消时把共享的 future 一起取消
+        return await asyncio.shield(future)
+
+    def _schedule_flush(self, delay: float):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._flush_handle = loop.call_later(delay, lambda: run_detached(self._flush()))
+
+    async def _flush(self):
+        """把积攒的文本中最多 max_batch_size 条作为一个批次发送给 Ollama, 剩余的立即安排下一批"""
+        self._flush_handle = None
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:self.max_batch_size]
+        if not batch:
+            return
+        if self._pending:
+            self._schedule_flush(0)
+        try:
+            embeddings = await self._request([text for _, text in batch])
+            if len(embeddings) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+            for (key, _), embedding in zip(batch, embeddings):
+                self._remember(key, embedding)
+                self._resolve(key, result=embedding)
+        except Exception as e:
+            logger.error(f"Error getting Ollama embedding: {str(e)}", exc_info=True)
+            for key, _ in batch:
+                self._resolve(key, error=e)
+
+    def _resolve(self, key: str, result: List[float] = None, error: Exception = None):
+        future = self._inflight.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _remember(self, key: str, embedding: List[float]):
+        self._memo[key] = embedding
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.cache_size:
+            self._memo.popitem(last=False) # 淘汰最久未使用的条目
+
+    async def _request(self, texts: List[str]) -> List[List[float]]:
+        session = self._get_session()
+        async with session.post(
+            f"{self.base_url}/api/embed",
+            json = {
+                "model": self.model_name,
+                "input": texts # input 传列表即可一次获取多个向量
+            }
+        ) as response:
+            response.raise_for_status()
+            result = await response.json()
+            return result["embeddings"]
+
+
+_embedding_service: Optional[EmbeddingService] = None
+
+def get_embedding_service() -> EmbeddingService:
+    """获取进程内共享的向量服务"""
+    global _embedding_service
+    if _embedding_service is None:
+        _embedding_service = EmbeddingService()
+    return _embedding_service
+
+async def close_embedding_service():
+    global _embedding_service
+    if _embedding_service is not None:
+        await _embedding_service.close()
+        _embedding_service = None
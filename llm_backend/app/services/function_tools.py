@@ -1,6 +1,13 @@
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Any
+from typing import Callable, Dict, List, Any, NamedTuple, Optional, Sequence, Tuple
+import asyncio
 import json
+import time
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.metrics import metrics
+
+logger = get_logger(service="function_tools")
 
 @dataclass
 class FunctionTool:
@@ -8,13 +15,35 @@ class FunctionTool:
     description: str
     parameters: Dict
     handler: Callable
+    timeout: Optional[float] = None  # 单次调用的超时(秒), 默认 TOOL_TIMEOUT
+    max_concurrency: Optional[int] = None  # 同一工具同时执行的调用数上限, 默认 TOOL_MAX_CONCURRENCY
+
+class ToolCall(NamedTuple):
+    """模型请求的一次工具调用"""
+    id: str
+    name: str
+    arguments: str  # JSON 字符串
+
+class ToolCallResult(NamedTuple):
+    """一次工具调用的结果, error 不为空表示调用失败或超时"""
+    call: ToolCall
+    arguments: Dict
+    result: Any
+    error: Optional[str]
+    seconds: float
 
 class ToolRegistry:
     def __init__(self):
         self._tools: Dict[str, FunctionTool] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
 
     def register(self, tool: FunctionTool):
         self._tools[tool.name] = tool
+        self._semaphores[tool.name] = asyncio.Semaphore(tool.max_concurrency or settings.TOOL_MAX_CONCURRENCY)
+
+    def tools_key(self) -> Tuple[str, ...]:
+        """已注册工具的名称集合, 用作预编译提示词的键"""
+        return tuple(sorted(self._tools))
 
     def get_tool(self, name: str) -> FunctionTool:
         return self._tools.get(name)
@@ -38,4 +67,34 @@ class ToolRegistry:
             raise ValueError(f"Tool {name} not found")
 
         args = json.loads(arguments)
-        return await tool.handler(**args)
\ No newline at end of file
+        return await tool.handler(**args)
+
+    async def execute_tool_calls(self, calls: Sequence[ToolCall]) -> List[ToolCallResult]:
+        """并发执行一轮中的所有工具调用, 结果按调用顺序返回
+
+        每个工具有独立的超时和并发上限; 单个调用失败或超时不影响其他调用
+        """
+        return list(await asyncio.gather(*(self._execute_call(call) for call in calls)))
+
+    async def _execute_call(self, call: ToolCall) -> ToolCallResult:
+        start_time = time.perf_counter()
+        args: Dict = {}
+        try:
+            tool = self.get_tool(call.name)
+            if not tool:
+                raise ValueError(f"Tool {call.name} not found")
+            args = json.loads(call.arguments or "{}")
+            async with self._semaphores[call.name]:
+                result = await asyncio.wait_for(tool.handler(**args), tool.timeout or settings.TOOL_TIMEOUT)
+            error = None
+        except asyncio.TimeoutError:
+            result, error = None, "timeout"
+            metrics.inc(f"tool.{call.name}.timeouts")
+            logger.warning(f"Tool {call.name} timed out, arguments: {call.arguments}")
+        except Exception as e:
+            result, error = None, str(e)
+            metrics.inc(f"tool.{call.name}.errors")
+            logger.error(f"Tool {call.name} failed: {str(e)}", exc_info=True)
+        seconds = time.perf_counter() - start_time
+        metrics.observe(f"tool.{call.name}.seconds", seconds)
+        return ToolCallResult(call, args, result, error, seconds)
@@ -1,31 +1,68 @@
+from typing import Dict, Type
 from app.core.config import settings, ServiceType
+from app.core.http_client import close_http_clients
+from app.core.logger import get_logger
 from app.services.deepseek_service import DeepseekService
 from app.services.ollama_service import OllamaService
 from app.services.search_service import SearchService
 
+logger = get_logger(service="llm_factory")
+
 
 class LLMFactory:
-    @staticmethod
-    def create_chat_service():
-        """创建聊天服务实例"""
+    """按服务类型返回进程内共享的服务实例
+
+    实例在 lifespan 启动时由 startup() 创建, 之后每个请求直接复用,
+    不再为每个请求新建客户端、工具注册中心和连接
+    """
+    _services: Dict[Type, object] = {}
+
+    @classmethod
+    def _get(cls, service_class: Type):
+        service = cls._services.get(service_class)
+        if service is None:
+            service = cls._services[service_class] = service_class()
+        return service
+
+    @classmethod
+    def startup(cls):
+        """创建所有配置中用到的服务实例, 在应用启动时调用"""
+        cls.create_chat_service()
+        cls.create_reasoner_service()
+        cls.create_search_service()
+        logger.info(f"LLM services ready: {', '.join(service.__name__ for service in cls._services)}")
+
+    @classmethod
+    async def shutdown(cls):
+        """释放服务实例和共享的 HTTP 连接池, 在应用退出时调用"""
+        for service in cls._services.values():
+            close = getattr(service, "close", None)
+            if close is not None:
+                await close()
+        cls._services.clear()
+        await close_http_clients()
+
+    @classmethod
+    def create_chat_service(cls):
+        """获取聊天服务实例"""
         if settings.CHAT_SERVICE == ServiceType.DEEPSEEK:
             # 如果.env文件中CHAT_SERVICE设置为DEEPSEEK，则使用DeepseekService
-            return DeepseekService()
+            return cls._get(DeepseekService)
         else:
             # 否则使用OllamaService
-            return OllamaService()
+            return cls._get(OllamaService)
 
-    @staticmethod
-    def create_reasoner_service():
-        """创建推理服务实例"""
+    @classmethod
+    def create_reasoner_service(cls):
+        """获取推理服务实例"""
         # 如果.env文件中REASON_SERVICE设置为DEEPSEEK，则使用DeepseekService
         if settings.REASON_SERVICE == ServiceType.DEEPSEEK:
-            return DeepseekService()
+            return cls._get(DeepseekService)
         else:
             # 否则使用OllamaService
-            return OllamaService()
+            return cls._get(OllamaService)
 
-    @staticmethod
-    def create_search_service():
-        """创建搜索服务实例"""
-        return SearchService()
\ No newline at end of file
+    @classmethod
+    def create_search_service(cls):
+        """获取搜索服务实例"""
+        return cls._get(SearchService)
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import case, func, insert, update
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.logger import get_logger
+from app.core.metrics import metrics
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.conversation_service import ConversationService
+
+logger = get_logger(service="message_writer")
+
+_STOP = object() # 停止信号
+
+class PendingTurn(NamedTuple):
+    """等待写入的一轮对话: 用户问题和模型回复"""
+    user_id: int
+    conversation_id: int
+    user_content: str
+    response: str
+
+class MessageWriter:
+    """对话消息的异步批量写入
+
+    流式回复结束后只把这一轮对话放进有界队列, 由后台任务按批次用一条多行 INSERT 写入数据库,
+    数据库往返不再占用 SSE 连接. 队列满时 enqueue 会等待(背压), 应用退出时写完队列中剩余的消息
+    """
+
+    def __init__(self, max_queue_size: int = None, batch_size: int = None, flush_interval: float = None):
+        self.batch_size = batch_size or settings.MESSAGE_WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.MESSAGE_WRITER_FLUSH_INTERVAL
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size or settings.MESSAGE_WRITER_QUEUE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动后台写入任务, 重复调用不会创建多个任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台任务, 等待队列中剩余的消息全部写入"""
+        if self._task is not None and not self._task.done():
+            await self._queue.put(_STOP) # 排在已有消息之后, 后台任务写完前面的消息后退出
+            await self._task
+        self._task = None
+        logger.info("Message writer stopped, queue flushed")
+
+    async def enqueue(self, user_id: int, conversation_id: int, messages: List[Dict], response: str):
+        """加入一轮对话, 签名与 on_complete 回调一致"""
+        # 获取用户的问题内容
+        user_content = next((msg["content"] for msg in messages if msg["role"] == "user"), "")
+        turn = PendingTurn(user_id, conversation_id, user_content, response)
+        if self._task is None or self._task.done():
+            # 后台任务未运行(如脚本中调用)时直接写入
+            await self._write_batch([turn])
+            return
+        if self._queue.full():
+            metrics.inc("message_writer.backpressure")
+        await self._queue.put(turn)
+        metrics.set_gauge("message_writer.queue_depth", self._queue.qsize())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            turn = await self._queue.get()
+            if turn is _STOP:
+                break
+            batch = [turn]
+            # 从第一条消息到达起最多等待 flush_interval, 凑够 batch_size 条就提前写入
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        turn = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    turn = self._queue.get_nowait()
+                if turn is _STOP:
+                    stopping = True
+                    break
+                batch.append(turn)
+            await self._write_batch(batch)
+            metrics.set_gauge("message_writer.queue_depth", self._queue.qsize())
+
+    async def _write_batch(self, batch: List[PendingTurn]):
+        """写入一批对话; 失败时按指数退避重试, 重试用尽后逐条写入, 一条坏数据不影响同批的其他对话"""
+        if not batch:
+            return
+        max_retries = settings.MESSAGE_WRITER_MAX_RETRIES
+        delay = settings.MESSAGE_WRITER_RETRY_BACKOFF
+        for attempt in range(max_retries + 1):
+            try:
+                await self._insert_batch(batch)
+                return
+            except Exception as e:
+                metrics.inc("message_writer.errors")
+                if attempt == max_retries:
+                    logger.error(f"Error saving {len(batch)} conversation turns after {attempt + 1} attempts: {str(e)}", exc_info=True)
+                    break
+                logger.warning(f"Error saving {len(batch)} conversation turns, retrying in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        if len(batch) == 1:
+            metrics.inc("message_writer.dropped")
+            logger.error(f"Dropped conversation turn for conversation {batch[0].conversation_id}")
+            return
+        # 整批仍然失败(如某一行数据有问题)时逐条写入, 只丢弃写不进去的那一轮
+        for turn in batch:
+            try:
+                await self._insert_batch([turn])
+                metrics.inc("message_writer.fallback_writes")
+            except Exception as e:
+                metrics.inc("message_writer.dropped")
+                logger.error(f"Dropped conversation turn for conversation {turn.conversation_id}: {str(e)}")
+
+    async def _insert_batch(self, batch: List[PendingTurn]):
+        """一个事务写入一批对话, 所有消息合并成一条多行 INSERT"""
+        start_time = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            # 每个会话在本批次中的第一条问题和消息条数
+            first_turns: Dict[int, PendingTurn] = {}
+            counts: Dict[int, int] = {}
+            for turn in batch:
+                first_turns.setdefault(turn.conversation_id, turn)
+                counts[turn.conversation_id] = counts.get(turn.conversation_id, 0) + 2
+
+            # 原子地更新计数器; 计数为 0 说明是第一轮对话, 顺带设置标题.
+            # MySQL 按顺序执行 SET, 标题必须在计数器之前赋值, 才能看到更新前的计数
+            existing = set()
+            for conversation_id, count in counts.items():
+                title = ConversationService.get_conversation_title(first_turns[conversation_id].user_content)
+                result = await db.execute(
+                    update(Conversation)
+                    .where(Conversation.id == conversation_id)
+                    .ordered_values(
+                        (Conversation.title, case((Conversation.message_count == 0, title), else_=Conversation.title)),
+                        (Conversation.message_count, Conversation.message_count + count),
+                        (Conversation.last_message_at, func.now()),
+                    )
+                )
+                if result.rowcount:
+                    existing.add(conversation_id)
+
+            rows = []
+            for turn in batch:
+                if turn.conversation_id not in existing:
+                    logger.error(f"Conversation {turn.conversation_id} not found")
+                    continue
+                rows.append({"conversation_id": turn.conversation_id, "sender": "user", "content": turn.user_content})
+                rows.append({"conversation_id": turn.conversation_id, "sender": "assistant", "content": turn.response})
+            if rows:
+                await db.execute(insert(Message).values(rows))
+            await db.commit()
+        metrics.inc("message_writer.messages_written", len(rows))
+        metrics.observe("message_writer.flush_seconds", time.perf_counter() - start_time)
+
+
+_message_writer: Optional[MessageWriter] = None
+
+def get_message_writer() -> MessageWriter:
+    """获取进程内共享的消息写入器"""
+    global _message_writer
+    if _message_writer is None:
+        _message_writer = MessageWriter()
+    return _message_writer
@@ -1,8 +1,12 @@
+import asyncio
+from contextlib import aclosing
+from app.core import sse
 from app.core.logger import get_logger
 from app.core.config import settings
+from app.core.ndjson import NDJSONParser
+from app.core.streaming import handle_disconnect
 from typing import List, Dict, Optional, Callable, AsyncGenerator
 import aiohttp
-import json
 
 logger = get_logger(service="ollama")
 
@@ -12,6 +16,49 @@ class OllamaService:
         self.base_url = settings.OLLAMA_BASE_URL
         self.chat_model = settings.OLLAMA_CHAT_MODEL
         self.reason_model = settings.OLLAMA_REASON_MODEL
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """进程内共用一个会话, 连接数上限与 Ollama 的并行数一致, 多余的请求在本地排队"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector = aiohttp.TCPConnector(limit=settings.OLLAMA_NUM_PARALLEL),
+                timeout = aiohttp.ClientTimeout(
+                    total = None, # 流式生成的总时长不设上限
+                    # connect 同时限制等待空闲连接的时间, 设为 None 让超出并行数的请求排队;
+                    # 只限制建立 TCP 连接本身的耗时
+                    connect = None,
+                    sock_connect = settings.OLLAMA_CONNECT_TIMEOUT,
+                    sock_read = settings.OLLAMA_READ_TIMEOUT # 两次收到数据之间的最长间隔
+                )
+            )
+        return self._session
+
+    async def close(self):
+        """关闭会话, 在应用退出时调用"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _iter_content(self, response: aiohttp.ClientResponse) -> AsyncGenerator[str, None]:
+        """按大块读取响应体, 增量解析 NDJSON 并取出文本增量
+
+        生成器被提前关闭或取消时(如客户端断开)直接关闭连接, Ollama 随之停止生成
+        """
+        parser = NDJSONParser()
+        finished = False
+        try:
+            async for data in response.content.iter_chunked(65536):
+                for chunk in parser.feed(data):
+                    if content := chunk.get("message", {}).get("content"):
+                        yield content
+            for chunk in parser.flush():
+                if content := chunk.get("message", {}).get("content"):
+                    yield content
+            finished = True
+        finally:
+            if not finished:
+                response.close()
 
     async def generate_stream(
             self,
@@ -19,37 +66,40 @@ class OllamaService:
             user_id: Optional[int] = None,
             conversation_id: Optional[int] = None,
             on_complete: Optional[Callable] = None
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         # 生成流式回复
         try:
             model = self.reason_model
             logger.info(f"Using model: {model}")
 
             full_response = [] # 存储完整回复
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/api/chat",
-                    json = {
-                        "model": model,
-                        "messages": messages,
-                        "stream": True,
-                        "keep_alive": -1,
-                        "options": {
-                            "temperature": 0.7,
-                        }
+            async with self._get_session().post(
+                f"{self.base_url}/api/chat",
+                json = {
+                    "model": model,
+                    "messages": messages,
+                    "stream": True,
+                    "keep_alive": -1,
+                    "options": {
+                        "temperature": 0.7,
                     }
-                ) as response:
-                    async for line in response.content:
-                        if line:
-                            try:
-                                chunk = json.loads(line)
-                                if content := chunk.get("message", {}).get("content"):
-                                    full_response.append(content)
-                                    content = json.dumps(content, ensure_ascii=False) # ensure_ascii=False 处理中文
-                                    yield f"data: {content}\n\n" # 返回流式数据
-                            except json.JSONDecodeError as e:
-                                logger.error(f"JSON decode error: {str(e)}")
-                                continue
+                }
+            ) as response:
+                response.raise_for_status()
+                try:
+                    # 时间窗口内到达的 token 合并成一帧; aclosing 保证提前退出时上游连接被关闭
+                    async with aclosing(sse.coalesce(self._iter_content(response), settings.SSE_COALESCE_WINDOW_MS / 1000)) as stream:
+                        async for content in stream:
+                            full_response.append(content)
+                            yield sse.encode_data(content) # 返回流式数据
+                except (asyncio.CancelledError, GeneratorExit):
+                    # 客户端断开: 上游连接已关闭, 部分回答照常保存
+                    partial_response = "".join(full_response)
+                    save = None
+                    if on_complete:
+                        save = lambda: on_complete(user_id, conversation_id, messages, partial_response)
+                    await handle_disconnect("ollama", partial_response, save)
+                    raise
             # 调用回调函数
             if on_complete:
                 complete_response = "".join(full_response) # 拼接完整回复, 不直接用 full_response 避免列表格式
@@ -57,8 +107,7 @@ class OllamaService:
 
         except Exception as e:
             logger.error(f"Error in generate_stream: {str(e)}", exc_info=True)
-            error_msg = json.dumps(f"生成回复时出错: {str(e)}", ensure_ascii=False)
-            yield f"data: {error_msg}\n\n"
+            yield sse.encode_data(f"生成回复时出错: {str(e)}")
             raise
 
     async def generate(self, message: List[Dict]) -> str:
@@ -67,20 +116,20 @@ class OllamaService:
             model = self.chat_model
             logger.info(f"Using model: {model}")
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/api/chat",
-                    json = {
-                        "model": model,
-                        "messages": message,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.7,
-                        }
+            async with self._get_session().post(
+                f"{self.base_url}/api/chat",
+                json = {
+                    "model": model,
+                    "messages": message,
+                    "stream": False,
+                    "options": {
+                        "temperature": 0.7,
                     }
-                ) as response:
-                    result = await response.json()
-                    return result["message"]["content"]
+                }
+            ) as response:
+                response.raise_for_status()
+                result = await response.json()
+                return result["message"]["content"]
         except Exception as e:
             logger.error(f"Error in generate: {str(e)}", exc_info=True)
             raise
@@ -1,60 +1,145 @@
 
-from typing import Optional, List, Dict
-import redis
+from typing import Optional, List, Dict, NamedTuple
 import asyncio
-import aiohttp
 import hashlib
-import json
+import time
+import weakref
 from app.core import math_utils
 from app.core.logger import get_logger
+from app.core.metrics import metrics
 from app.core.config import settings
-from datetime import datetime
+from app.core.redis_client import get_redis
+from app.core.vector_codec import decode_vector, encode_vector, is_legacy
+from app.services.embedding_service import EmbeddingService, get_embedding_service
+from app.services.vector_index import create_vector_index
 
 logger = get_logger(service="redis_cache")
 
+# 写入 + 淘汰脚本, 在 Redis 中原子执行
+# KEYS: 1 LRU 有序集合(分数为最后访问时间), 2 LFU 有序集合(分数为访问次数),
+#       3 过期有序集合(分数为过期时间), 4 条目字节数哈希, 5 总字节数, 6 用户前缀集合
+# ARGV: 1 键前缀, 2 最大条目数, 3 最大字节数(<=0 不限), 4 当前时间, 5 淘汰策略 lru/lfu,
+#       可选 6 条目 id, 7 向量, 8 响应, 9 过期秒数, 10 预编码的 SSE 帧
+# 条目键由前缀拼出, 不兼容 Redis Cluster
+_STORE_AND_TRIM_SCRIPT = """
+local prefix = ARGV[1]
+local now = tonumber(ARGV[4])
+
+local function drop(id)
+    local size = tonumber(redis.call('HGET', KEYS[4], id) or '0')
+    redis.call('DEL', prefix .. 'vec:' .. id, prefix .. 'response:' .. id, prefix .. 'frames:' .. id)
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('ZREM', KEYS[3], id)
+    redis.call('HDEL', KEYS[4], id)
+    if size > 0 then
+        redis.call('DECRBY', KEYS[5], size)
+    end
+end
+
+if ARGV[6] then
+    local id = ARGV[6]
+    local ttl = tonumber(ARGV[9])
+    local old_size = tonumber(redis.call('HGET', KEYS[4], id) or '0')
+    local size = string.len(ARGV[7]) + string.len(ARGV[8])
+    redis.call('SET', prefix .. 'vec:' .. id, ARGV[7], 'EX', ttl)
+    redis.call('SET', prefix .. 'response:' .. id, ARGV[8], 'EX', ttl)
+    if ARGV[10] then
+        size = size + string.len(ARGV[10])
+        redis.call('SET', prefix .. 'frames:' .. id, ARGV[10], 'EX', ttl)
+    else
+        redis.call('DEL', prefix .. 'frames:' .. id)
+    end
+    redis.call('ZADD', KEYS[1], now, id)
+    redis.call('ZADD', KEYS[2], 'NX', 1, id)
+    redis.call('ZADD', KEYS[3], now + ttl, id)
+    redis.call('HSET', KEYS[4], id, size)
+    redis.call('INCRBY', KEYS[5], size - old_size)
+    redis.call('SADD', KEYS[6], string.sub(prefix, 1, -2))
+end
+
+local evicted = {}
+-- 先清掉已经过期的条目, 保证计数和字节数准确
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', now)) do
+    drop(id)
+    table.insert(evicted, id)
+end
+
+local order = KEYS[1]
+if ARGV[5] == 'lfu' then
+    order = KEYS[2]
+end
+local max_entries = tonumber(ARGV[2])
+local max_bytes = tonumber(ARGV[3])
+while true do
+    local count = redis.call('ZCARD', order)
+    local bytes = tonumber(redis.call('GET', KEYS[5]) or '0')
+    if count == 0 or (count <= max_entries and (max_bytes <= 0 or bytes <= max_bytes)) then
+        break
+    end
+    local victim = redis.call('ZRANGE', order, 0, 0)[1]
+    drop(victim)
+    table.insert(evicted, victim)
+end
+return evicted
+"""
+
+class CachedResponse(NamedTuple):
+    """缓存命中的结果: 原始文本和写入时预编码好的 SSE 帧(旧条目没有帧)"""
+    text: str
+    frames: Optional[bytes]
+
 class RedisSemanticCache:
     def __init__(
             self,
-            redis_url: str = None,
             model_name: str = None,
             score_threshold: float = None,
             prefix: str = "ai-assist",
-            user_id: Optional[int] = None,  # 添加用户ID
-            max_cache_size: int = 1000,  # 每个用户最大缓存条数
+            max_cache_size: int = None,  # 每个用户最大缓存条数
+            max_cache_bytes: int = None,  # 每个用户最大缓存字节数
             cleanup_interval: int = 3600  # 清理间隔(秒)
     ):
-        self.redis = redis.from_url(redis_url or settings.REDIS_URL)
+        self.redis = get_redis() # 进程内共享的异步客户端和连接池
         self.model_name = model_name or settings.OLLAMA_EMBEDDING_MODEL
+        # 默认模型共用进程内的向量服务
+        if self.model_name == settings.OLLAMA_EMBEDDING_MODEL:
+            self.embedder = get_embedding_service()
+        else:
+            self.embedder = EmbeddingService(model_name=self.model_name)
         self.score_threshold = score_threshold or settings.REDIS_CACHE_THRESHOLD
-        self.prefix = f"{prefix}:{user_id}" if user_id else prefix
-        self.max_cache_size = max_cache_size
+        self.prefix = prefix
+        self.max_cache_size = max_cache_size or settings.CACHE_MAX_ENTRIES_PER_USER
+        self.max_cache_bytes = max_cache_bytes if max_cache_bytes is not None else settings.CACHE_MAX_BYTES_PER_USER
+        self.eviction_policy = settings.CACHE_EVICTION_POLICY
+        self._store_and_trim = self.redis.register_script(_STORE_AND_TRIM_SCRIPT)
         self.cleanup_interval = cleanup_interval
+        # 近邻索引, 替代逐条 GET + 余弦相似度的全量扫描
+        self.index = create_vector_index(settings.REDIS_CACHE_INDEX_BACKEND, self.redis)
+        # 每个前缀一把预热锁, 同一用户的并发首次查询只扫描和构建一次; 锁不再使用时自动回收
+        self._warmup_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        # 整个进程只有一个清理任务, 由 start() / stop() 管理
+        self._cleanup_task: Optional[asyncio.Task] = None
 
-        # 启动自动清理任务
-        asyncio.create_task(self._auto_cleanup())
+    def start(self):
+        """启动后台清理任务, 重复调用不会创建多个任务"""
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.create_task(self._auto_cleanup())
 
-    async def _get_ollama_embedding(self, text: str) -> List[float]: #  获取文本向量
-        # 使用 Ollama 生成文本向量
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{settings.OLLAMA_BASE_URL}/api/embed",
-                    json = {
-                        "model": self.model_name,
-                        "input": text  # 使用 input 而不是 prompt, 符合 Ollama API 规范
-                    }
-                ) as response:
-                    result = await response.json()
-                    return result["embeddings"][0]  # 返回第一个向量
-        except Exception as e:
-            logger.error(f"Error getting Ollama embedding: {str(e)}", exc_info=True) #exc_info=True 用于打印堆栈信息
-            raise
+    async def stop(self):
+        """停止后台清理任务"""
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
 
     async def _get_embedding(self, text: str) -> List[float]:
         """获取文本向量"""
         try:
-            # 直接使用 ollama 的 embedding 接口
-            embedding = await self._get_ollama_embedding(text)
+            # 共享的向量服务, 自带连接复用、结果缓存和微批处理
+            embedding = await self.embedder.embed(text)
             if not embedding: # 如果没有获取到向量
                 raise ValueError("Failed to get embedding")
             return embedding
@@ -62,20 +147,48 @@ class RedisSemanticCache:
             logger.error(f"Error in get_embedding: {str(e)}", exc_info=True)
             raise
 
-    def _get_vector_key(self, message: str) -> str:
-        """生成 Redis 键"""
-        message_hash = hashlib.md5(message.encode()).hexdigest()
-        return f"{self.prefix}:{message_hash}"
+    def _get_message_hash(self, message: str) -> str:
+        """消息内容的哈希"""
+        return hashlib.md5(message.encode()).hexdigest()
+
+    def _get_exact_hash(self, messages: List[dict], user_message: str, model: Optional[str] = None) -> str:
+        """精确匹配用的哈希, 同时作为缓存条目 id
+
+        用户消息先折叠空白并忽略大小写; 按配置可把系统提示词和模型名一起纳入哈希
+        """
+        parts = [" ".join(user_message.split()).casefold()]
+        if settings.CACHE_EXACT_INCLUDE_SYSTEM:
+            parts.extend(msg.get("content", "") for msg in messages if msg.get("role") == "system")
+        if settings.CACHE_EXACT_INCLUDE_MODEL and model:
+            parts.append(model)
+        return self._get_message_hash("\0".join(parts))
+
+    def _get_user_prefix(self, user_id: Optional[int]) -> str:
+        """每个用户独立的键前缀, 实现多用户缓存隔离"""
+        return f"{self.prefix}:{user_id}" if user_id else self.prefix
 
-    def _get_response_key(self, message: str) -> str:
+    def _get_namespaces_key(self) -> str:
+        """记录所有写入过缓存的用户前缀, 供清理任务遍历"""
+        return f"{self.prefix}:namespaces"
+
+    def _get_response_key(self, prefix: str, hash_id: str) -> str:
         """生成响应存储的键名"""
-        message_hash = hashlib.md5(message.encode()).hexdigest()
-        return f"{self.prefix}:response:{message_hash}"
+        return f"{prefix}:response:{hash_id}"
+
+    def _get_frames_key(self, prefix: str, hash_id: str) -> str:
+        """预编码 SSE 帧的键名"""
+        return f"{prefix}:frames:{hash_id}"
 
-    def _get_metadata_key(self, message: str) -> str:
-        """生成元数据存储的键名"""
-        message_hash = hashlib.md5(message.encode()).hexdigest()
-        return f"{self.prefix}:metadata:{message_hash}"
+    def _get_eviction_keys(self, prefix: str) -> List[str]:
+        """淘汰脚本用到的键, 顺序与脚本中的 KEYS 对应"""
+        return [
+            f"{prefix}:lru",
+            f"{prefix}:lfu",
+            f"{prefix}:expiry",
+            f"{prefix}:sizes",
+            f"{prefix}:bytes",
+            self._get_namespaces_key(),
+        ]
 
     def _get_last_user_message(self, messages: List[dict]) -> str:
         """获取用户的最后一条消息内容"""
@@ -85,122 +198,194 @@ class RedisSemanticCache:
         return ""
 
     async def _auto_cleanup(self):
-        """自动清理过期缓存"""
+        """自动清理过期缓存, 依次处理每个用户前缀"""
         while True: # 不停循环
             try:
-                # 获取所有缓存键
-                pattern = f"{self.prefix}:metadata:*"
-                all_keys = [key.decode("utf-8") for key in self.redis.keys(pattern)]
-
-                if len(all_keys) > self.max_cache_size:
-                    cache_items = []
-                    for key in all_keys:
-                        metadata = json.loads(self.redis.get(key.encode("utf-8")).decode("utf-8")) # 编码再解码, 确保正确处理
-                        cache_items.append((key, metadata.get("last_access", 0))) # 获取最后访问时间
-
-                    # 按访问时间排序
-                    cache_items.sort(key=lambda x: x[1])
-
-                    # 删除最旧的条目直到达到限制
-                    items_to_remove = len(all_keys) - self.max_cache_size
-                    for key, _ in cache_items[:items_to_remove]:
-                        hash_id = key.split(":")[-1]
-                        await self._remove_cache_item(hash_id)
-                logger.info(f"Cache cleanup completed for prefix {self.prefix}")
+                namespaces = await self.redis.smembers(self._get_namespaces_key())
+                for namespace in namespaces:
+                    await self._cleanup_prefix(namespace.decode("utf-8"))
+                logger.info(f"Cache cleanup completed for {len(namespaces)} prefixes under {self.prefix}")
             except Exception as e:
                 logger.error(f"Error during cache cleanup: {str(e)}", exc_info=True)
             await asyncio.sleep(self.cleanup_interval)  # 等待下一个清理周期
 
+    async def _cleanup_prefix(self, prefix: str):
+        """清理单个用户前缀: 删除过期条目, 并按淘汰策略裁剪到条目数和字节数上限以内"""
+        await self._run_store_and_trim(prefix)
 
-    async def _remove_cache_item(self, hash_id: str):
-        """删除一个缓存项的所有相关键"""
-        try:
-            # 所有key都需要编码
-            self.redis.delete(
-                f"{self.prefix}:vec:{hash_id}".encode('utf-8'),
-                f"{self.prefix}:resp:{hash_id}".encode('utf-8'),
-                f"{self.prefix}:meta:{hash_id}".encode('utf-8')
-            )
-        except Exception as e:
-            logger.error(f"Error removing cache item: {str(e)}", exc_info=True)
+    async def _run_store_and_trim(self, prefix: str, entry: Optional[tuple] = None):
+        """执行写入 + 淘汰脚本, entry 为 (条目 id, 向量字节, 响应字节, 过期秒数[, SSE 帧字节])"""
+        args = [
+            f"{prefix}:",
+            self.max_cache_size,
+            self.max_cache_bytes,
+            time.time(),
+            self.eviction_policy,
+        ]
+        if entry:
+            args.extend(entry)
+        evicted = await self._store_and_trim(keys=self._get_eviction_keys(prefix), args=args)
+        if evicted:
+            evicted = [item.decode("utf-8") for item in evicted]
+            await self.index.remove(prefix, evicted)
+            metrics.inc("semantic_cache.evictions", len(evicted))
+            logger.info(f"Evicted {len(evicted)} cache entries for prefix {prefix}")
 
-    async def _update_metadata(self, message: str):
-        """更新缓存元数据的访问时间"""
+    async def _ensure_index_warm(self, prefix: str):
+        """进程内索引首次使用某个前缀时, 用 SCAN 从 Redis 载入已有向量"""
+        if not self.index.needs_warmup(prefix):
+            return
+        lock = self._warmup_locks.get(prefix)
+        if lock is None:
+            lock = self._warmup_locks[prefix] = asyncio.Lock()
+        async with lock:
+            # 等待锁期间其他请求可能已经完成预热
+            if self.index.needs_warmup(prefix):
+                await self._warmup(prefix)
+
+    async def _warmup(self, prefix: str):
+        vec_prefix = f"{prefix}:vec:"
+        items = []
+        batch = []
+        async for key in self.redis.scan_iter(match=f"{vec_prefix}*", count=1000): # SCAN 不会像 KEYS 一样阻塞 Redis
+            batch.append(key)
+            if len(batch) >= 500:
+                items.extend(await self._load_vectors(prefix, batch))
+                batch = []
+        if batch:
+            items.extend(await self._load_vectors(prefix, batch))
+        await self.index.warmup(prefix, items)
+        logger.info(f"Vector index warmed up for prefix {prefix} with {len(items)} entries")
+
+    async def _load_vectors(self, prefix: str, keys: List[bytes]) -> List[tuple]:
+        """批量读取向量, 顺带把旧的 JSON 格式迁移为二进制格式"""
+        prefix_len = len(f"{prefix}:vec:")
+        items = []
+        legacy = []
+        for key, raw in zip(keys, await self.redis.mget(keys)):
+            if raw:
+                vector = decode_vector(raw)
+                items.append((key.decode("utf-8")[prefix_len:], vector))
+                if is_legacy(raw):
+                    legacy.append((key, vector))
+        if legacy:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, vector in legacy:
+                    # keepttl 保留原有的过期时间
+                    pipe.set(key, encode_vector(math_utils.normalize(vector), settings.REDIS_CACHE_VECTOR_DTYPE), keepttl=True)
+                await pipe.execute()
+            logger.info(f"Migrated {len(legacy)} JSON vectors to binary format for prefix {prefix}")
+        return items
+
+    async def _touch(self, prefix: str, hash_id: str):
+        """记录一次访问: LRU 分数更新为当前时间, LFU 分数加一, 一次往返完成"""
         try:
-            meta_key = self._get_metadata_key(message)
-            current_meta = self.redis.get(meta_key)
-            if current_meta:
-                current_meta = json.loads(current_meta.decode("utf-8"))
-            else:
-                current_meta = {"access_count": 0}
-
-            metadata = {
-                "last_access": datetime.now().timestamp(),
-                "access_count": current_meta["access_count"] + 1
-            }
-            self.redis.set(meta_key, json.dumps(metadata), ex=settings.REDIS_CACHE_EXPIRE)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                # xx 保证已被淘汰的条目不会被重新加回来
+                pipe.zadd(f"{prefix}:lru", {hash_id: time.time()}, xx=True)
+                pipe.zadd(f"{prefix}:lfu", {hash_id: 1}, xx=True, incr=True)
+                await pipe.execute()
         except Exception as e:
-            logger.error(f"Error updating metadata: {str(e)}", exc_info=True)
+            logger.error(f"Error updating access score: {str(e)}", exc_info=True)
+
+    async def _get_cached(self, prefix: str, hash_id: str) -> Optional[CachedResponse]:
+        """一次 MGET 同时取回响应文本和预编码的 SSE 帧"""
+        response, frames = await self.redis.mget(
+            self._get_response_key(prefix, hash_id).encode("utf-8"),
+            self._get_frames_key(prefix, hash_id).encode("utf-8")
+        )
+        if not response:
+            return None
+        return CachedResponse(response.decode("utf-8"), frames)
 
-    async def lookup(self, messages: List[dict]) -> Optional[str]:
-        """查找缓存的响应"""
+    async def lookup(self, messages: List[dict], user_id: Optional[int] = None, model: Optional[str] = None) -> Optional[CachedResponse]:
+        """查找缓存的响应: 先按规范化后的提示词精确匹配, 未命中再做语义匹配"""
         try:
+            prefix = self._get_user_prefix(user_id)
             user_message = self._get_last_user_message(messages)
             if not user_message:
                 return None
 
-            current_vector = await self._get_embedding(user_message)
-
-            # 遍历所有缓存项，计算相似度
-            pattern = f"{self.prefix}:vec:*"
-            all_vectors = [key.decode('utf-8') for key in self.redis.keys(pattern)]
-            max_similarity = 0 # 最大相似度
-            most_similar_key = None # 最相似的键
-
-            for vec_key in all_vectors:
-                cached_vector = json.loads(self.redis.get(vec_key.encode("utf-8")).decode("utf-8"))
-                similarity = math_utils.cosine_similarity(current_vector, cached_vector)
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    most_similar_key = vec_key
-            if max_similarity >= self.score_threshold and most_similar_key:
-                hash_id = most_similar_key.split(":")[-1]
-                resp_key = self._get_response_key(user_message)
-                cached_response = self.redis.get(resp_key.encode("utf-8"))
-
-                if cached_response:
-                    await self._update_metadata(user_message)
-                    logger.info(f"Cache hit with similarity {max_similarity:.4f}")
-                    return cached_response.decode("utf-8")
-            return None
+            # 第一层: 精确匹配, 命中时不需要计算向量
+            start_time = time.perf_counter()
+            exact_id = self._get_exact_hash(messages, user_message, model)
+            cached_response = await self._get_cached(prefix, exact_id)
+            metrics.observe("semantic_cache.exact.latency_seconds", time.perf_counter() - start_time)
+            if cached_response:
+                metrics.inc("semantic_cache.exact.hits")
+                await self._touch(prefix, exact_id)
+                logger.info("Cache hit with exact match")
+                return cached_response
+            metrics.inc("semantic_cache.exact.misses")
+
+            # 第二层: 语义匹配
+            start_time = time.perf_counter()
+            cached_response = await self._semantic_lookup(prefix, user_message)
+            metrics.observe("semantic_cache.semantic.latency_seconds", time.perf_counter() - start_time)
+            metrics.inc("semantic_cache.semantic.hits" if cached_response else "semantic_cache.semantic.misses")
+            return cached_response
         except Exception as e:
             logger.error(f"Error in lookup: {str(e)}", exc_info=True)
             return None
 
+    async def _semantic_lookup(self, prefix: str, user_message: str) -> Optional[CachedResponse]:
+        current_vector = math_utils.normalize(await self._get_embedding(user_message)) # 只归一化查询向量, 缓存中已是单位向量
+
+        # 通过向量索引查找最相似的缓存项
+        await self._ensure_index_warm(prefix)
+        matches = await self.index.search(prefix, current_vector, k=1)
+        if matches and matches[0][1] >= self.score_threshold:
+            hash_id, max_similarity = matches[0]
+            cached_response = await self._get_cached(prefix, hash_id)
+
+            if cached_response:
+                await self._touch(prefix, hash_id)
+                logger.info(f"Cache hit with similarity {max_similarity:.4f}")
+                return cached_response
+            # 响应已过期, 从索引中移除
+            await self.index.remove(prefix, [hash_id])
+        return None
 
-    async def update(self, messages: List[Dict], response: str, expire: int = None):
+
+    async def update(
+            self,
+            messages: List[Dict],
+            response: str,
+            user_id: Optional[int] = None,
+            model: Optional[str] = None,
+            expire: int = None,
+            frames: Optional[bytes] = None  # 预编码好的 SSE 帧, 命中时直接回放
+    ):
         try:
+            prefix = self._get_user_prefix(user_id)
             user_message = self._get_last_user_message(messages)
             if not user_message:
                 return
 
-            vector = await self._get_embedding(user_message)
-
-            vec_key = self._get_vector_key(user_message)
-            resp_key = self._get_response_key(user_message)
-            meta_key = self._get_metadata_key(user_message)
+            # 写入时归一化, 查询时不必再对每个缓存项计算范数
+            vector = math_utils.normalize(await self._get_embedding(user_message))
 
+            # 条目 id 即精确匹配哈希, 两层查找共用同一份响应
+            hash_id = self._get_exact_hash(messages, user_message, model)
             expire = expire or settings.REDIS_CACHE_EXPIRE
 
-            self.redis.set(vec_key.encode('utf-8'), json.dumps(vector), ex=expire)
-            self.redis.set(resp_key.encode('utf-8'), response.encode('utf-8'), ex=expire)
-
-            metadata = {
-                "created_at": datetime.now().timestamp(), # 创建时间
-                "last_access": datetime.now().timestamp(), # 最后访问时间
-                "access_count": 1 # 访问次数
-            }
-            self.redis.set(meta_key.encode('utf-8'), json.dumps(metadata), ex=expire)
+            # 写入向量和响应、更新淘汰用的有序集合和字节数, 再按上限裁剪, 全部在一个脚本里原子完成
+            entry = [hash_id, encode_vector(vector, settings.REDIS_CACHE_VECTOR_DTYPE), response.encode('utf-8'), expire]
+            if frames:
+                entry.append(frames)
+            await self._run_store_and_trim(prefix, tuple(entry))
+            # 先写入 Redis 再加入索引: 尚未预热的前缀跳过添加, 预热时会从 Redis 载入这一条
+            await self.index.add(prefix, hash_id, vector)
             logger.info(f"Cache update for message: {user_message[:10]}...")
         except Exception as e:
             logger.error(f"Error in update: {str(e)}", exc_info=True)
+
+
+_semantic_cache: Optional[RedisSemanticCache] = None
+
+def get_semantic_cache() -> RedisSemanticCache:
+    """获取进程内共享的语义缓存, 用户 ID 在每次调用时传入"""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = RedisSemanticCache(prefix="deepseek_cache")
+    return _semantic_cache
@@ -0,0 +1,130 @@
+import re
+from typing import Dict, List, NamedTuple, Set
+from urllib.parse import urlsplit
+from app.core.config import settings
+from app.core.tokens import estimate_tokens
+
+# 中日韩字符按字切分, 其余按单词切分
+_TERM_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]|[0-9A-Za-z]+")
+_CONTEXT_SEPARATOR = "\n---\n"
+_MIN_SNIPPET_TOKENS = 32 # 预算剩余不足以放下这么多内容时不再截断加入
+
+class SearchContext(NamedTuple):
+    """发送给模型的搜索上下文"""
+    results: List[Dict]  # 实际放入上下文的结果, 按相关度排序
+    text: str
+    tokens: int  # 估算的 token 数
+    duplicates: int  # 按链接或内容去重丢弃的结果数
+    dropped: int  # 超出预算未放入的结果数
+
+def _normalize_url(url: str) -> str:
+    """忽略协议、www 前缀、锚点和末尾斜杠"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    return f"{host}{path}?{parts.query}" if parts.query else f"{host}{path}"
+
+def _terms(text: str) -> List[str]:
+    return [term.lower() for term in _TERM_PATTERN.findall(text)]
+
+def _grams(terms: List[str]) -> Set[str]:
+    """相邻两个词组成的片段, 中文按字切分后相当于二元组"""
+    if len(terms) < 2:
+        return set(terms)
+    return {terms[i] + terms[i + 1] for i in range(len(terms) - 1)}
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _format_result(result: Dict) -> str:
+    return (
+        f"来源: {result['title']}\n"
+        f"链接: {result['url']}\n"
+        f"内容: {result['snippet']}\n"
+    )
+
+def _truncate(result: Dict, budget: int) -> Dict:
+    """截断摘要, 使格式化后的结果不超过 budget 个 token"""
+    snippet = result["snippet"]
+    while snippet:
+        truncated = dict(result, snippet=snippet + "…")
+        tokens = estimate_tokens(_format_result(truncated))
+        if tokens <= budget:
+            return truncated
+        # 按超出的比例缩短, 至少缩短一个字符
+        snippet = snippet[:min(len(snippet) - 1, len(snippet) * budget // tokens)]
+    return dict(result, snippet="")
+
+def build_search_context(
+        query: str,
+        results: List[Dict],
+        token_budget: int = None,
+        dedup_threshold: float = None
+) -> SearchContext:
+    """去重、按与问题的相关度排序, 并截断到 token 预算以内
+
+    - 链接相同(忽略协议、www 和末尾斜杠)或摘要高度相似的结果只保留排名靠前的一条
+    - 相关度为问题的二元组在标题和摘要中出现的比例, 相同时保持搜索引擎的原始顺序
+    - 预算用本地估算的 token 数计算, 最后一条放不下时截断摘要
+    """
+    token_budget = token_budget or settings.SEARCH_CONTEXT_TOKEN_BUDGET
+    dedup_threshold = dedup_threshold or settings.SEARCH_SNIPPET_DEDUP_THRESHOLD
+
+    unique = []
+    seen_urls = set()
+    seen_snippets: List[Set[str]] = []
+    for result in results:
+        url = _normalize_url(result.get("url", ""))
+        if url and url in seen_urls:
+            continue
+        snippet_grams = _grams(_terms(result.get("snippet", "")))
+        if any(_jaccard(snippet_grams, grams) >= dedup_threshold for grams in seen_snippets):
+            continue
+        seen_urls.add(url)
+        seen_snippets.append(snippet_grams)
+        unique.append((result, snippet_grams))
+    duplicates = len(results) - len(unique)
+
+    query_grams = _grams(_terms(query))
+
+    def relevance(item) -> float:
+        result, snippet_grams = item
+        if not query_grams:
+            return 0.0
+        title_grams = _grams(_terms(result.get("title", "")))
+        return (len(query_grams & snippet_grams) + 0.5 * len(query_grams & title_grams)) / len(query_grams)
+
+    ranked = sorted(unique, key=relevance, reverse=True) # sorted 是稳定排序, 相关度相同时保持原始顺序
+
+    selected = []
+    parts = []
+    tokens = 0
+    separator_tokens = estimate_tokens(_CONTEXT_SEPARATOR)
+    for result, _ in ranked:
+        remaining = token_budget - tokens - (separator_tokens if parts else 0)
+        entry = _format_result(result)
+        entry_tokens = estimate_tokens(entry)
+        if entry_tokens > remaining:
+            if remaining < _MIN_SNIPPET_TOKENS:
+                break
+            result = _truncate(result, remaining)
+            entry = _format_result(result)
+            entry_tokens = estimate_tokens(entry)
+            if entry_tokens > remaining: # 标题和链接本身已超出预算
+                break
+        if parts:
+            tokens += separator_tokens
+        selected.append(result)
+        parts.append(entry)
+        tokens += entry_tokens
+    return SearchContext(
+        results=selected,
+        text=_CONTEXT_SEPARATOR.join(parts),
+        tokens=tokens,
+        duplicates=duplicates,
+        dropped=len(unique) - len(selected),
+    )
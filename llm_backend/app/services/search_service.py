@@ -1,14 +1,22 @@
 import asyncio
+from contextlib import aclosing
 from typing import List, Dict, Optional, Callable, AsyncGenerator
+from app.core import sse
+from app.core.http_client import get_http_client
 from app.core.logger import get_logger
-from app.prompts.search_prompts import SEARCH_SYSTEM_PROMPT, SEARCH_SUMMARY_PROMPT
-from app.services.function_tools import ToolRegistry, FunctionTool
+from app.core.metrics import metrics
+from app.core.streaming import handle_disconnect, run_detached
+from app.core.tokens import estimate_tokens
+from app.prompts.registry import get_compiled_prompts
+from app.prompts.search_prompts import SEARCH_SUMMARY_PROMPT
+from app.services.function_tools import ToolRegistry, FunctionTool, ToolCall
+from app.services.search_context import build_search_context
 from app.tools.definitions import SEARCH_TOOL
 from app.tools.search import SearchTool
 from openai import AsyncOpenAI
 from app.core.config import settings
 import datetime
-import json
+import time
 
 logger = get_logger(service="search")
 
@@ -16,9 +24,11 @@ logger = get_logger(service="search")
 class SearchService:
     def __init__(self):
         logger.info("Search Service Initiated")
+        base_url = "http://localhost:11434/v1/"
         self.client = AsyncOpenAI(
             api_key =  "ollama",
-            base_url = "http://localhost:11434/v1/"
+            base_url = base_url,
+            http_client = get_http_client(base_url) # 共享连接池
         )
         self.model = "qwen2.5:7b"
         self.search_tool = SearchTool()
@@ -34,54 +44,141 @@ class SearchService:
             )
         )
 
-        # 生成工具描述
-        self.tools_description = self.generate_tools_description()
+        # 系统提示词和工具定义按工具集合预编译, 所有请求共用同一份
+        self.prompts = get_compiled_prompts(self.tool_registry)
 
-    def generate_tools_description(self) -> str:
-        tool_description = []
-
-        for tool_def in self.tool_registry.get_tools_definition():
-            func = tool_def.get("function")
-            name = func["name"]
-            desc = func["description"]
-            params = []
-
-            # 获取必须参数和描述
-            for param_name, param_info in func["parameters"]["properties"].items():
-                if param_name in func["parameters"].get("required", []):
-                    params.append(f"{param_name}, 作用是: {param_info['description']}")
-
-            tool_desc = (
-                f"{name},{desc}"
-                f", 必须参数有: " if params else ""
-                                                 f"{', '.join(params)}"
-            )
-            tool_description.append(tool_desc)
-        return "当前可用的工具有: " + " ; ".join(tool_description)
+    async def close(self):
+        """关闭搜索客户端的连接池, 在应用退出时调用"""
+        await self.search_tool.close()
 
     async def _handle_search(self, query: str) -> List[Dict]:
-        return await asyncio.to_thread(  # 将同步方法放到线程池中执行
-            self.search_tool.search, query
-        )
-
-    async def _call_with_tool(self, query: str) -> Dict:
-        # 调用模型并获取工具调用结果
-        try:
-            logger.info(f"Call model with query: {query}")
-
-            response = await self.client.chat.completions.create(
-                model = self.model,
-                messages = query,
-                tools = self.tool_registry.get_tools_definition(),
-                tool_choice = "auto"
-                # 自动选择工具, 其他选项: "none", "always", "manual", 表示不使用工具,"总是使用工具", "手动选择"
+        return await self.search_tool.search(query)
+
+    async def _iter_content(self, stream, tool_calls: Optional[Dict[int, Dict]] = None) -> AsyncGenerator[str, None]:
+        """从流式响应中取出文本增量, 时间窗口内到达的 token 合并成一段
+
+        传入 tool_calls 时同时按 index 累积工具调用的增量(id、名称和参数片段).
+        提前结束时关闭上游 HTTP 流, 模型随之停止生成
+        """
+        async def deltas():
+            finished = False
+            try:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if tool_calls is not None and delta.tool_calls:
+                        for tool_call_delta in delta.tool_calls:
+                            parts = tool_calls.setdefault(tool_call_delta.index, {"id": "", "name": "", "arguments": []})
+                            if tool_call_delta.id:
+                                parts["id"] = tool_call_delta.id
+                            if tool_call_delta.function is not None:
+                                if tool_call_delta.function.name:
+                                    parts["name"] = tool_call_delta.function.name
+                                if tool_call_delta.function.arguments:
+                                    parts["arguments"].append(tool_call_delta.function.arguments)
+                    if delta.content:
+                        yield delta.content
+                finished = True
+            finally:
+                if not finished:
+                    await asyncio.shield(run_detached(stream.close()))
+
+        async with aclosing(sse.coalesce(deltas(), settings.SSE_COALESCE_WINDOW_MS / 1000)) as contents:
+            async for content in contents:
+                yield content
+
+    async def _answer_with_search(self, query: str, calls: List[ToolCall]) -> AsyncGenerator[bytes, None]:
+        """执行模型请求的工具调用, 再根据搜索结果流式生成回答"""
+        # 告诉前端开始搜索
+        yield sse.encode_data({'type': 'search_start'})
+
+        # 并发执行本轮所有工具调用, 结果按调用顺序返回
+        start_time = time.perf_counter()
+        call_results = await self.tool_registry.execute_tool_calls(calls)
+        yield sse.encode_data({
+            "type": "tool_timings",
+            "total_seconds": round(time.perf_counter() - start_time, 3),
+            "tools": [
+                {
+                    "name": call_result.call.name,
+                    "arguments": call_result.arguments,
+                    "seconds": round(call_result.seconds, 3),
+                    "error": call_result.error
+                }
+                for call_result in call_results
+            ]
+        })
+
+        queries = []
+        search_results = []
+        for call_result in call_results:
+            if call_result.call.name == "search" and call_result.result:
+                queries.append(call_result.arguments.get("query", ""))
+                search_results.extend(call_result.result)
+        logger.info(f"Got {len(search_results)} search results")
+
+        if search_results:
+            # 去重、按相关度排序并截断到 token 预算, 控制本地模型的预填充耗时
+            context = build_search_context(query, search_results)
+
+            # 构建带上下文的提示
+            context_prompt = SEARCH_SUMMARY_PROMPT.format(
+                context=context.text,
+                query=query,
+                cur_date=datetime.datetime.now().strftime("%Y-%m-%d")
+            )
+            prompt_tokens = estimate_tokens(self.prompts.summary_system_message["content"]) + estimate_tokens(context_prompt)
+            metrics.inc("search.context_tokens", context.tokens)
+            metrics.inc("search.prompt_tokens", prompt_tokens)
+            metrics.inc("search.context_duplicates", context.duplicates)
+            metrics.inc("search.context_dropped", context.dropped)
+            logger.info(
+                f"Search context: {len(context.results)}/{len(search_results)} results, ~{context.tokens} tokens, "
+                f"{context.duplicates} duplicates, {context.dropped} over budget"
             )
 
-            logger.info(f"Model response: {response.choices[0]}")
-            return response.choices[0]
-        except Exception as e:
-            logger.error(f"Error in _call_with_tool: {str(e)}", exc_info=True)
-            raise
+            search_data = {
+                "type": "search_results",
+                "total": len(context.results),
+                "query": "、".join(dict.fromkeys(queries)),
+                "context_tokens": context.tokens,
+                "prompt_tokens": prompt_tokens,
+                "results": [
+                    {
+                        "title": result["title"],
+                        "url": result["url"],
+                        "snippet": result["snippet"]
+                    }
+                    for result in context.results
+                ]
+            }
+
+            yield sse.encode_data(search_data)
+
+            logger.info(f"final message to model: {context_prompt}")
+            # 最后一个工具返回后立即用上下文重新调用模型, 流式生成最终回答
+            stream_response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        self.prompts.summary_system_message,
+                        {
+                            "role": "user",
+                            "content": context_prompt
+                        }
+                    ],
+                    stream=True
+            )
+            generated = []
+            try:
+                async with aclosing(self._iter_content(stream_response)) as contents:
+                    async for content in contents:
+                        generated.append(content)
+                        yield sse.encode_data(content)
+            except (asyncio.CancelledError, GeneratorExit):
+                # 客户端断开, 上游连接已关闭
+                await handle_disconnect("search", "".join(generated))
+                raise
 
     async def generate(
             self,
@@ -89,122 +186,64 @@ class SearchService:
             user_id: Optional[int] = None,
             conversation_id: Optional[int] = None,
             on_complete: Optional[Callable] = None
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         try:
             logger.info(f"Starting search generation for query: {query}")
 
             messages = [
-                {
-                    "role": "system",
-                    "content": SEARCH_SYSTEM_PROMPT.format(
-                        tools_description=self.tools_description
-                    )
-                },
+                self.prompts.system_message,
                 {
                     "role": "user",
                     "content": query
                 }
             ]
 
-            choice = await self._call_with_tool(messages)
-            logger.info(f"Tool call response: {choice}")
-
-            # 根据 finish_reason 处理不同情况
-            finish_reason = choice.finish_reason
-            if finish_reason == "tool_call":  # 需要调用工具
-                tool_calls = choice.message.tool_calls
-                if tool_calls:
-                    tool_call = tool_calls[0]
-                    logger.info(f"Processing tool call: {tool_call}")
-
-                    try:
-                        # 执行工具调用
-                        search_results = await self.tool_registry.execute_tool(
-                            tool_call.function.name,
-                            tool_call.function.arguments
-                        )
-                        logger.info(f"Got {len(search_results)} search results")
-
-                        if search_results:
-                            # 构建上下文内容
-                            context = []
-                            for result in search_results:
-                                context.append(
-                                    f"来源: {result['title']}\n"
-                                    f"链接: {result['url']}\n"
-                                    f"内容: {result['snippet']}\n"
-                                )
-
-                            # 构建带上下文的提示
-                            context_prompt = SEARCH_SUMMARY_PROMPT.format(
-                                context="\n---\n".join(context),
-                                query=query,
-                                cur_data=datetime.now().strftime("%Y-%m-%d")
-                            )
-
-                            # 告诉前端是搜索结果
-                            yield f"data: {json.dumps({'type': 'search_start'}, ensure_ascii=False)}\n\n"
-
-                            search_data = {
-                                "type": "search_results",
-                                "total": len(search_results),
-                                "query": json.loads(tool_call.function.arguments)[
-                                    "query"],
-                                "results": [
-                                    {
-                                        "title": result["title"],
-                                        "url": result["url"],
-                                        "snippet": result["snippet"]
-                                    }
-                                    for result in search_results
-                                ]
-                            }
-
-                            yield f"data: {json.dumps(search_data, ensure_ascii=False)}\n\n"
-
-                            logger.info(f"final message to model: {context_prompt}")
-                            # 使用上下文重新调用模型生成最终回答
-                            async for chunk in await self.client.chat.completions.create(
-                                    model=self.model,
-                                    messages=[
-                                        {
-                                            "role": "system",
-                                            "content": context_prompt
-                                        }
-                                    ],
-                                    stream=True
-                            ):
-                                if chunk.choices[0].delta.content:
-                                    content = json.dumps(chunk.choices[0].delta.content,
-                                                         ensure_ascii=False)
-                                    yield f"data: {content}\n\n"
-
-                    except Exception as e:
-                        pass
-            elif choice.finish_reason == "stop":  # 正常完成
-                logger.info(f"Stopping search generation for query: {query}")
-                # 告诉前端是正常回答
-                yield f"data: {json.dumps({'type': 'normal_start'}, ensure_ascii = False)}\n\n"
-                # 使用流式 API 重新生成回答
-                stream_response = await self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    stream=True
-                )
+            # 带工具的调用直接使用流式: 没有工具调用时 token 直接发给前端, 不再重新生成一遍;
+            # 出现工具调用时在流结束后转入搜索流程
+            stream_response = await self.client.chat.completions.create(
+                model = self.model,
+                messages = messages,
+                tools = self.prompts.tools,
+                tool_choice = "auto",
+                # 自动选择工具, 其他选项: "none", "always", "manual", 表示不使用工具,"总是使用工具", "手动选择"
+                stream = True
+            )
 
-                full_response = []
-                async for chunk in stream_response:
-                    if chunk.choices and chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
+            tool_call_parts: Dict[int, Dict] = {}
+            full_response = []
+            try:
+                async with aclosing(self._iter_content(stream_response, tool_call_parts)) as contents:
+                    async for content in contents:
+                        if not full_response:
+                            # 告诉前端是正常回答
+                            yield sse.encode_data({'type': 'normal_start'})
                         full_response.append(content)
-                        yield f"data: {json.dumps({'type': 'direct_content', 'content': content}, ensure_ascii = False)}\n\n"
-
-                # 如果有回调函数，调用它
+                        yield sse.encode_data({'type': 'direct_content', 'content': content})
+            except (asyncio.CancelledError, GeneratorExit):
+                # 客户端断开: 上游连接已关闭, 部分回答照常保存
+                partial_response = "".join(full_response)
+                save = None
                 if on_complete and user_id is not None and conversation_id is not None:
-                    complete_response = "".join(full_response)
-                    await on_complete(user_id, conversation_id, [{"role": "user", "content": query}], complete_response)
-
-
+                    save = lambda: on_complete(user_id, conversation_id, [{"role": "user", "content": query}], partial_response)
+                await handle_disconnect("search", partial_response, save)
+                raise
+
+            if tool_call_parts:  # 需要调用工具
+                calls = [
+                    ToolCall(parts["id"], parts["name"], "".join(parts["arguments"]))
+                    for _, parts in sorted(tool_call_parts.items())
+                ]
+                logger.info(f"Processing {len(calls)} tool calls: {calls}")
+                async with aclosing(self._answer_with_search(query, calls)) as frames:
+                    async for frame in frames:
+                        yield frame
+                return
+
+            logger.info(f"Stopping search generation for query: {query}")
+            # 如果有回调函数，调用它
+            if on_complete and user_id is not None and conversation_id is not None:
+                complete_response = "".join(full_response)
+                await on_complete(user_id, conversation_id, [{"role": "user", "content": query}], complete_response)
 
         except Exception as e:
             logger.error(f"Error in generate: {str(e)}", exc_info=True)
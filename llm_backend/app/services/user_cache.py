@@ -0,0 +1,210 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import NamedTuple, Optional, Tuple
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.metrics import metrics
+from app.core.redis_client import get_redis
+from app.core.sse import json_dumps, json_loads
+from app.models.user import User
+
+logger = get_logger(service="user_cache")
+
+class UserPrincipal(NamedTuple):
+    """已认证用户的只读信息, 不包含密码哈希"""
+    id: int
+    username: str
+    email: str
+    created_at: datetime
+    updated_at: Optional[datetime]
+    last_login: Optional[datetime]
+    status: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+            last_login=user.last_login,
+            status=user.status,
+        )
+
+    def to_json(self) -> bytes:
+        data = self._asdict()
+        for field in ("created_at", "updated_at", "last_login"):
+            if data[field] is not None:
+                data[field] = data[field].isoformat()
+        return json_dumps(data)
+
+    @classmethod
+    def from_json(cls, raw) -> "UserPrincipal":
+        data = json_loads(raw)
+        for field in ("created_at", "updated_at", "last_login"):
+            if data[field] is not None:
+                data[field] = datetime.fromisoformat(data[field])
+        return cls(**data)
+
+class UserCache:
+    """以 JWT 的 sub(邮箱) 为键的用户信息缓存, 同时保存已撤销令牌的 jti
+
+    进程内 TTL + LRU; backend 为 redis 时进程内未命中再查 Redis, 多个进程共享.
+    用户状态变化时调用 invalidate, 退出登录时调用 revoke_token. redis 后端通过
+    pub/sub 把失效和撤销广播给所有进程, 订阅断开期间其他进程的副本最多在 ttl 秒后过期.
+    memory 后端只作用于当前进程, 仅适用于单进程部署
+    """
+
+    CHANNEL = "auth:invalidations" # 广播用户失效和令牌撤销的频道
+    REVOKED_KEY = "auth:revoked" # 已撤销令牌的有序集合, 分数为令牌过期时间
+    RECONNECT_DELAY = 1.0 # 订阅断开后重连的间隔(秒)
+
+    def __init__(self, max_size: int = None, ttl: float = None, backend: str = None):
+        self.max_size = max_size or settings.USER_CACHE_SIZE
+        self.ttl = ttl or settings.USER_CACHE_TTL
+        self.backend = backend or settings.USER_CACHE_BACKEND
+        self._entries: "OrderedDict[str, Tuple[float, UserPrincipal]]" = OrderedDict() # 键 -> (过期时间, 用户)
+        self._revoked: "OrderedDict[str, float]" = OrderedDict() # jti -> 令牌过期时间(Unix 时间戳)
+        self._listener: Optional[asyncio.Task] = None
+
+    def start(self):
+        """redis 后端时启动订阅任务, 接收其他进程发出的失效和撤销消息"""
+        if self.backend == "redis" and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """停止订阅任务"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    @staticmethod
+    def _redis_key(email: str) -> str:
+        return f"user_principal:{email}"
+
+    async def get(self, email: str) -> Optional[UserPrincipal]:
+        entry = self._entries.get(email)
+        if entry is not None:
+            expires_at, principal = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(email) # 标记为最近使用
+                metrics.inc("user_cache.hits")
+                return principal
+            del self._entries[email]
+
+        if self.backend == "redis":
+            try:
+                raw = await get_redis().get(self._redis_key(email))
+                if raw is not None:
+                    principal = UserPrincipal.from_json(raw)
+                    self._store_local(principal)
+                    metrics.inc("user_cache.hits")
+                    metrics.inc("user_cache.redis_hits")
+                    return principal
+            except Exception as e:
+                # Redis 不可用时退回数据库, 不影响认证
+                logger.warning(f"Error reading user cache from redis: {str(e)}")
+
+        metrics.inc("user_cache.misses")
+        return None
+
+    async def set(self, principal: UserPrincipal):
+        self._store_local(principal)
+        if self.backend == "redis":
+            try:
+                await get_redis().set(self._redis_key(principal.email), principal.to_json(), ex=max(1, int(self.ttl)))
+            except Exception as e:
+                logger.warning(f"Error writing user cache to redis: {str(e)}")
+
+    async def invalidate(self, email: str):
+        """删除缓存的用户信息, 所有进程下次请求时重新从数据库读取"""
+        self._entries.pop(email, None)
+        metrics.inc("user_cache.invalidations")
+        if self.backend == "redis":
+            try:
+                await get_redis().delete(self._redis_key(email))
+                await get_redis().publish(self.CHANNEL, json_dumps({"email": email}))
+            except Exception as e:
+                logger.warning(f"Error invalidating user cache in redis: {str(e)}")
+
+    def is_revoked(self, jti: str) -> bool:
+        expires_at = self._revoked.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    async def revoke_token(self, jti: str, expires_at: float):
+        """撤销令牌直到其过期, 之后令牌本身已失效, 不再需要记录"""
+        self._store_revoked(jti, expires_at)
+        metrics.inc("user_cache.revocations")
+        if self.backend == "redis":
+            try:
+                redis = get_redis()
+                await redis.zadd(self.REVOKED_KEY, {jti: expires_at})
+                await redis.zremrangebyscore(self.REVOKED_KEY, "-inf", time.time())
+                await redis.publish(self.CHANNEL, json_dumps({"jti": jti, "exp": expires_at}))
+            except Exception as e:
+                logger.warning(f"Error revoking token in redis: {str(e)}")
+
+    async def _load_revoked(self):
+        """从 Redis 加载仍未过期的撤销记录"""
+        entries = await get_redis().zrangebyscore(self.REVOKED_KEY, time.time(), "+inf", withscores=True)
+        for jti, expires_at in entries:
+            self._store_revoked(jti.decode() if isinstance(jti, bytes) else jti, expires_at)
+
+    async def _listen(self):
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.subscribe(self.CHANNEL)
+                # 先订阅再加载撤销记录, 断开期间的撤销不会丢失; 错过的用户失效无法补回, 清空进程内副本
+                await self._load_revoked()
+                self._entries.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._apply(json_loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"User cache subscription lost: {str(e)}")
+                await asyncio.sleep(self.RECONNECT_DELAY)
+            finally:
+                await pubsub.aclose()
+
+    def _apply(self, message: dict):
+        """应用其他进程(也包括本进程)广播的消息"""
+        if "email" in message:
+            self._entries.pop(message["email"], None)
+        elif "jti" in message:
+            self._store_revoked(message["jti"], message["exp"])
+
+    def _store_revoked(self, jti: str, expires_at: float):
+        self._revoked[jti] = expires_at
+        # 令牌有效期相同, 按加入顺序基本就是按过期时间, 从头部清理已过期的记录
+        now = time.time()
+        while self._revoked:
+            oldest = next(iter(self._revoked))
+            if self._revoked[oldest] > now:
+                break
+            del self._revoked[oldest]
+
+    def _store_local(self, principal: UserPrincipal):
+        self._entries[principal.email] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(principal.email)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+_user_cache: Optional[UserCache] = None
+
+def get_user_cache() -> UserCache:
+    """获取进程内共享的用户信息缓存"""
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = UserCache()
+    return _user_cache
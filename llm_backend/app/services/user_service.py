@@ -6,6 +6,7 @@ from app.core.hashing import get_password_hash, verify_password
 from datetime import datetime
 from typing import Optional
 from app.core.logger import get_logger
+from app.services.user_cache import get_user_cache
 
 logger = get_logger(service = "user_service")
 
@@ -61,8 +62,13 @@ class UserService:
             logger.warning(f"Authenticate failed! Password error")
             return None
 
+        if user.status != "active":
+            logger.warning(f"Authenticate failed! User {email} is not active, status: {user.status}")
+            return None
+
         user.last_login = datetime.utcnow()
         await self.db.commit()
+        await get_user_cache().invalidate(user.email) # last_login 已变化
 
         return user
 
@@ -78,4 +84,15 @@ class UserService:
             User.email == email
         )
         result = await self.db.execute(query)
-        return result.scalar_one_or_none()
\ No newline at end of file
+        return result.scalar_one_or_none()
+
+    async def update_status(self, user_id: int, status: str) -> Optional[User]:
+        user = await self.get_user_by_id(user_id)
+        if not user:
+            return None
+        user.status = status
+        await self.db.commit()
+        await self.db.refresh(user)
+        # 状态变化后立即失效缓存, 不等待过期
+        await get_user_cache().invalidate(user.email)
+        return user
@@ -1,48 +1,116 @@
-from typing import List, Dict
-import requests
+import asyncio
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+import aiohttp
 from app.core.logger import get_logger
 from app.core.config import settings
+from app.core.metrics import metrics
 
 logger = get_logger(service = "search_tool")
 
 class SearchTool:
-    def __init__(self):
+    """SerpAPI 异步搜索客户端
+
+    - 复用同一个 aiohttp 会话及其连接池
+    - 相同查询的并发请求只发送一次(single-flight)
+    - 以 规范化查询 + 语言/地区 为键的 TTL 结果缓存
+    """
+
+    def __init__(self, cache_size: int = None, cache_ttl: float = None):
         self.api_key = settings.SERPAPI_KEY
         if not self.api_key:
             raise ValueError("SERPAPI_KEY is not set in settings.")
+        self.cache_size = cache_size or settings.SEARCH_CACHE_SIZE
+        self.cache_ttl = cache_ttl if cache_ttl is not None else settings.SEARCH_CACHE_TTL
 
-    def search(self, query: str, num_results: int = 5) -> List[Dict]:
-        try:
-            num_results = settings.SEARCH_RESULT_COUNT or num_results
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._cache: "OrderedDict[Tuple, Tuple[float, List[Dict]]]" = OrderedDict() # 键 -> (过期时间, 结果)
+        self._inflight: Dict[Tuple, asyncio.Task] = {} # 正在进行的查询, 相同查询的并发请求共用一个结果
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.SERPAPI_MAX_CONNECTIONS),
+                timeout=aiohttp.ClientTimeout(total=settings.SERPAPI_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self):
+        """关闭会话, 在应用退出时调用"""
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """统一全角/半角字符并合并空白, 作为缓存键和实际发送的查询"""
+        return " ".join(unicodedata.normalize("NFKC", query).split())
 
+    async def search(self, query: str, num_results: int = 5) -> List[Dict]:
+        num_results = settings.SEARCH_RESULT_COUNT or num_results
+        query = self.normalize_query(query)
+        key = (query.casefold(), settings.SEARCH_LANGUAGE, settings.SEARCH_COUNTRY, num_results)
+
+        entry = self._cache.get(key)
+        if entry is not None:
+            expires_at, results = entry
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(key) # 标记为最近使用
+                metrics.inc("search.cache_hits")
+                return results
+            del self._cache[key]
+        metrics.inc("search.cache_misses")
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, query, num_results))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            metrics.inc("search.coalesced")
+        # shield 避免某个调用方被取消时把共享的请求一起取消
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Tuple, query: str, num_results: int) -> List[Dict]:
+        start_time = time.perf_counter()
+        try:
             params = {
                 "engine": "google",
                 "q": query,
                 "api_key": self.api_key,
                 "num": num_results,
-                "hl": "zh-CN",
-                "gl": "cn"
+                "hl": settings.SEARCH_LANGUAGE,
+                "gl": settings.SEARCH_COUNTRY
             }
 
-            response = requests.get(
-                settings.SERPAPI_URL,
-                params = params,
-                timeout = settings.SERPAPI_TIMEOUT,
-            )
-
-            response.raise_for_status() # 检查请求是否成功, 否则抛出异常
-            return self._parse_results(response.json())
+            async with self._get_session().get(settings.SERPAPI_URL, params=params) as response:
+                response.raise_for_status() # 检查请求是否成功, 否则抛出异常
+                results = self._parse_results(await response.json())
+            metrics.observe("search.request_seconds", time.perf_counter() - start_time)
         except Exception as e:
+            # 失败的结果不缓存, 下次请求重试
+            metrics.inc("search.errors")
             logger.error(f"SearchTool error: {str(e)}", exc_info=True)
             return []
 
+        if self.cache_ttl > 0:
+            self._cache[key] = (time.monotonic() + self.cache_ttl, results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+
     def _parse_results(self, data: Dict) -> List[Dict]:
         results = []
         if "organic_results" in data:
             for item in data["organic_results"]:
                 result = {
                     "title": item.get("title", ""),
-                    "link": item.get("link", ""),
+                    "url": item.get("link", ""),
                     "snippet": item.get("snippet", "")
                 }
                 results.append(result)
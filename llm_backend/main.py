@@ -1,14 +1,45 @@
+from contextlib import asynccontextmanager
+
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api import api_router
 from app.core.logger import get_logger, log_structured
 from fastapi import FastAPI
 from app.core.middleware import LoggingMiddleware
+from app.core.metrics import metrics
+from app.core.redis_client import close_redis
+from app.services.embedding_service import close_embedding_service
+from app.services.llm_factory import LLMFactory
+from app.services.message_writer import get_message_writer
+from app.services.redis_semantic_cache import get_semantic_cache
+from app.services.user_cache import get_user_cache
 
 
 logger = get_logger(service = "main")
 
-app = FastAPI(title = "AI Assist REST API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时创建进程内唯一的语义缓存及其清理任务
+    semantic_cache = get_semantic_cache()
+    semantic_cache.start()
+    # 模型服务只创建一次, 所有请求共用
+    LLMFactory.startup()
+    # 对话消息由后台任务批量写入数据库
+    message_writer = get_message_writer()
+    message_writer.start()
+    # 订阅其他进程广播的用户失效和令牌撤销
+    user_cache = get_user_cache()
+    user_cache.start()
+    yield
+    # 关闭时停止清理任务并释放共享的连接池
+    await semantic_cache.stop()
+    await user_cache.stop()
+    await LLMFactory.shutdown()
+    await message_writer.stop() # 写完队列中剩余的消息
+    await close_embedding_service()
+    await close_redis()
+
+app = FastAPI(title = "AI Assist REST API", lifespan = lifespan)
 
 app.add_middleware(LoggingMiddleware)
 
@@ -19,10 +50,16 @@ app.add_middleware(
     allow_credentials=True, # 允许携带凭证
     allow_methods=["*"],   # 允许所有方法
     allow_headers=["*"],   # 允许所有头信息
+    expose_headers=["X-Before-Cursor", "X-After-Cursor"], # 跨域时前端可以读取消息分页游标
 )
 
 app.include_router(api_router, prefix="/api")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def get_metrics():
+    # 进程内指标快照
+    return metrics.snapshot()
\ No newline at end of file
@@ -0,0 +1,95 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 PYTHONPATH, 作用是为了让脚本能够找到 app 模块
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.append(str(ROOT_DIR))
+
+import argparse
+import asyncio
+import time
+import httpx
+from openai import AsyncOpenAI
+from app.core.logger import get_logger
+from app.prompts.registry import describe_tools, get_compiled_prompts
+from app.prompts.search_prompts import SEARCH_SYSTEM_PROMPT
+from app.services.function_tools import FunctionTool, ToolRegistry
+from app.tools.definitions import SEARCH_TOOL
+
+logger = get_logger(service="bench_prompt_setup")
+
+# 固定的非流式响应, 只测量客户端构建和序列化请求的开销
+COMPLETION = {
+    "id": "bench", "object": "chat.completion", "created": 0, "model": "bench",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+}
+
+async def _noop_handler(query: str):
+    return []
+
+def build_registry() -> ToolRegistry:
+    registry = ToolRegistry()
+    registry.register(FunctionTool(**SEARCH_TOOL, handler=_noop_handler))
+    return registry
+
+async def legacy_request(client: AsyncOpenAI, query: str):
+    """改造前: 每个请求重建工具注册中心、工具说明和系统提示词"""
+    registry = build_registry()
+    system_prompt = SEARCH_SYSTEM_PROMPT.format(tools_description=describe_tools(registry.get_tools_definition()))
+    await client.chat.completions.create(
+        model="bench",
+        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": query}],
+        tools=registry.get_tools_definition(),
+        tool_choice="auto",
+    )
+
+async def compiled_request(client: AsyncOpenAI, query: str, registry: ToolRegistry):
+    """改造后: 使用预编译的系统消息和工具定义"""
+    prompts = get_compiled_prompts(registry)
+    await client.chat.completions.create(
+        model="bench",
+        messages=[prompts.system_message, {"role": "user", "content": query}],
+        tools=prompts.tools,
+        tool_choice="auto",
+    )
+
+async def measure(name: str, make_request, iterations: int) -> float:
+    for _ in range(min(100, iterations)): # 预热
+        await make_request()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await make_request()
+    per_request = (time.perf_counter() - start) / iterations * 1e6
+    logger.info(f"{name}: {per_request:.1f}us per request")
+    return per_request
+
+async def run(iterations: int):
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(request.content)
+        return httpx.Response(200, json=COMPLETION)
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client = AsyncOpenAI(api_key="bench", base_url="http://bench.local/v1/", http_client=http_client)
+    registry = build_registry()
+    query = "今天上海的天气怎么样?"
+    try:
+        legacy = await measure("legacy", lambda: legacy_request(client, query), iterations)
+        compiled = await measure("compiled", lambda: compiled_request(client, query, registry), iterations)
+        logger.info(f"Setup cost reduced by {(1 - compiled / legacy) * 100:.1f}%")
+
+        # 预编译后的请求体前缀(系统消息和工具定义)在请求之间逐字节相同
+        compiled_bodies = bodies[-iterations:]
+        logger.info(f"Compiled request bodies identical across requests: {len(set(compiled_bodies)) == 1}")
+    finally:
+        await client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="测量搜索服务每个请求构建提示词和工具定义的开销")
+    parser.add_argument("--iterations", type=int, default=2000, help="每种方式的请求次数")
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
+
+if __name__ == "__main__":
+    main()
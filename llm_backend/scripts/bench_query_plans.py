@@ -0,0 +1,160 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 PYTHONPATH, 作用是为了让脚本能够找到 app 模块
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.append(str(ROOT_DIR))
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select
+from app.core.database import engine
+from app.core.logger import get_logger
+from app.models.conversation import Conversation, DialogueType
+from app.models.message import Message
+from app.services.conversation_service import ConversationService
+
+logger = get_logger(service="bench_query_plans")
+
+# 基准数据使用的用户 id 区间, 与真实用户错开, 结束后按此区间清理
+BENCH_USER_BASE = 900_000_000
+
+async def seed(conn, total_messages: int, conversations: int, batch_size: int = 5000):
+    """写入基准数据: conversations 个会话, 共 total_messages 条消息"""
+    users = max(1, conversations // 10)
+    start = datetime(2024, 1, 1)
+    rows = [
+        {
+            "user_id": BENCH_USER_BASE + i % users,
+            "title": f"bench {i}",
+            "dialogue_type": DialogueType.NORMAL,
+            "created_at": start + timedelta(minutes=i),
+        }
+        for i in range(conversations)
+    ]
+    for i in range(0, len(rows), batch_size):
+        await conn.execute(insert(Conversation), rows[i : i + batch_size])
+    result = await conn.execute(
+        select(Conversation.id).where(Conversation.user_id >= BENCH_USER_BASE).order_by(Conversation.id)
+    )
+    conversation_ids = result.scalars().all()
+
+    batch = []
+    for i in range(total_messages):
+        batch.append({
+            "conversation_id": random.choice(conversation_ids),
+            "sender": "user" if i % 2 == 0 else "assistant",
+            "content": f"benchmark message {i}",
+            "created_at": start + timedelta(seconds=i),
+        })
+        if len(batch) >= batch_size:
+            await conn.execute(insert(Message), batch)
+            batch = []
+    if batch:
+        await conn.execute(insert(Message), batch)
+    await conn.exec_driver_sql("ANALYZE TABLE conversations, messages")
+    return conversation_ids
+
+async def cleanup(conn):
+    """删除基准数据, 消息由外键级联删除"""
+    await conn.execute(delete(Conversation).where(Conversation.user_id >= BENCH_USER_BASE))
+
+async def explain(conn, stmt):
+    """对语句执行 EXPLAIN, 返回每一行的字典"""
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    result = await conn.exec_driver_sql(f"EXPLAIN {compiled}", params)
+    return [dict(row._mapping) for row in result]
+
+async def timed(conn, stmt, repeat: int = 20) -> float:
+    """多次执行取平均耗时(毫秒)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = await conn.execute(stmt)
+        result.all()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def hot_queries(conversation_id: int, user_id: int):
+    """需要走索引的热点查询, 与服务中实际使用的语句保持一致"""
+    latest = ConversationService._messages_query(conversation_id) \
+        .order_by(Message.created_at.desc(), Message.id.desc()).limit(51)
+    cursor = ConversationService.encode_cursor(datetime(2024, 1, 6), 2 ** 31 - 1)
+    before = ConversationService._messages_query(conversation_id, before=cursor) \
+        .order_by(Message.created_at.desc(), Message.id.desc()).limit(51)
+    user_conversations = select(Conversation).where(
+        Conversation.user_id == user_id,
+        Conversation.title != "新会话"
+    ).order_by(Conversation.created_at.desc())
+    delete_messages = delete(Message).where(Message.conversation_id == conversation_id)
+    return {
+        "latest_messages": (latest, "ix_messages_conversation_created"),
+        "messages_before_cursor": (before, "ix_messages_conversation_created"),
+        "user_conversations": (user_conversations, "ix_conversations_user_created"),
+        "delete_conversation_messages": (delete_messages, "ix_messages_conversation_created"),
+    }
+
+async def run(total_messages: int, conversations: int, keep: bool) -> bool:
+    ok = True
+    try:
+        async with engine.begin() as conn:
+            await cleanup(conn)
+            logger.info(f"Seeding {conversations} conversations and {total_messages} messages...")
+            start = time.perf_counter()
+            conversation_ids = await seed(conn, total_messages, conversations)
+            logger.info(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+        async with engine.connect() as conn:
+            # 取消息最多的会话, 最能体现全表扫描和排序的代价
+            result = await conn.execute(
+                select(Message.conversation_id)
+                .where(Message.conversation_id.in_(conversation_ids[:100]))
+                .group_by(Message.conversation_id)
+                .order_by(func.count().desc())
+                .limit(1)
+            )
+            conversation_id = result.scalar_one()
+            result = await conn.execute(select(Conversation.user_id).where(Conversation.id == conversation_id))
+            user_id = result.scalar_one()
+
+            for name, (stmt, expected_index) in hot_queries(conversation_id, user_id).items():
+                plan = await explain(conn, stmt)
+                row = plan[0]
+                key = row.get("key")
+                extra = row.get("Extra") or ""
+                used = key == expected_index and "Using filesort" not in extra
+                ok = ok and used
+                line = f"{name}: key={key} type={row.get('type')} rows={row.get('rows')} extra={extra}"
+                if name.startswith("delete"):
+                    logger.info(line)
+                else:
+                    logger.info(f"{line} avg={await timed(conn, stmt):.2f}ms")
+                if not used:
+                    logger.error(f"{name} does not use {expected_index} without filesort")
+    finally:
+        if not keep:
+            async with engine.begin() as conn:
+                await cleanup(conn)
+        await engine.dispose()
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="写入基准数据并检查热点查询的执行计划是否使用索引")
+    parser.add_argument("--messages", type=int, default=1_000_000, help="写入的消息条数")
+    parser.add_argument("--conversations", type=int, default=10_000, help="写入的会话数")
+    parser.add_argument("--keep", action="store_true", help="结束后保留基准数据")
+    args = parser.parse_args()
+    try:
+        ok = asyncio.run(run(args.messages, args.conversations, args.keep))
+    except Exception as e:
+        logger.error(f"Benchmark failed: {str(e)}")
+        sys.exit(1)
+    if not ok:
+        logger.error("Some hot queries are not using the expected indexes")
+        sys.exit(1)
+    logger.info("All hot queries use the expected indexes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 PYTHONPATH, 作用是为了让脚本能够找到 app 模块
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.append(str(ROOT_DIR))
+
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+import aiohttp
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.tools.search import SearchTool
+
+logger = get_logger(service="bench_search")
+
+async def upstream_stats(method: str = "GET"):
+    """读取 fake_serpapi 的请求计数"""
+    parts = urlsplit(settings.SERPAPI_URL)
+    async with aiohttp.ClientSession() as session:
+        async with session.request(method, f"{parts.scheme}://{parts.netloc}/stats") as response:
+            return await response.json()
+
+async def run(concurrency: int, distinct: int, rounds: int):
+    tool = SearchTool()
+    await upstream_stats("DELETE")
+    try:
+        for round_index in range(rounds):
+            queries = [f"benchmark query {i % distinct}" for i in range(concurrency)]
+            start = time.perf_counter()
+            results = await asyncio.gather(*(tool.search(query) for query in queries))
+            elapsed = time.perf_counter() - start
+            empty = sum(1 for result in results if not result)
+            logger.info(
+                f"round {round_index + 1}: {concurrency} searches ({distinct} distinct) "
+                f"in {elapsed * 1000:.1f}ms, empty={empty}"
+            )
+        stats = await upstream_stats()
+        logger.info(f"Upstream requests: {stats['requests']} for {concurrency * rounds} searches")
+    finally:
+        await tool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="对 SearchTool 发起并发搜索, 统计实际到达上游的请求数; 先启动 scripts/fake_serpapi.py")
+    parser.add_argument("--concurrency", type=int, default=200, help="每轮并发的搜索数")
+    parser.add_argument("--distinct", type=int, default=10, help="每轮中不同查询的数量")
+    parser.add_argument("--rounds", type=int, default=3, help="轮数, 第二轮起应全部命中缓存")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.concurrency, args.distinct, args.rounds))
+    except Exception as e:
+        logger.error(f"Benchmark failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
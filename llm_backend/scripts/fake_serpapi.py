@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 PYTHONPATH, 作用是为了让脚本能够找到 app 模块
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.append(str(ROOT_DIR))
+
+import argparse
+import asyncio
+import hashlib
+from aiohttp import web
+from app.core.logger import get_logger
+
+logger = get_logger(service="fake_serpapi")
+
+def make_results(query: str, num: int):
+    """按查询生成固定的搜索结果, 相同查询每次返回相同内容"""
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:8]
+    return [
+        {
+            "position": i + 1,
+            "title": f"{query} - 结果 {i + 1}",
+            "link": f"https://example.com/{digest}/{i + 1}",
+            "snippet": f"关于 {query} 的第 {i + 1} 条摘要",
+        }
+        for i in range(num)
+    ]
+
+def create_app(latency: float, error_rate: int) -> web.Application:
+    """模拟 SerpAPI 的 google 搜索接口
+
+    latency: 每次请求的模拟耗时(秒); error_rate: 每 N 个请求返回一次 500, 0 表示不出错
+    """
+    stats = {"requests": 0, "queries": {}}
+
+    async def search(request: web.Request):
+        stats["requests"] += 1
+        query = request.query.get("q", "")
+        stats["queries"][query] = stats["queries"].get(query, 0) + 1
+        if not request.query.get("api_key"):
+            return web.json_response({"error": "Invalid API key"}, status=401)
+        await asyncio.sleep(latency)
+        if error_rate and stats["requests"] % error_rate == 0:
+            return web.json_response({"error": "Simulated failure"}, status=500)
+        num = int(request.query.get("num", 10))
+        return web.json_response({
+            "search_parameters": {"q": query, "hl": request.query.get("hl"), "gl": request.query.get("gl")},
+            "organic_results": make_results(query, num),
+        })
+
+    async def get_stats(request: web.Request):
+        return web.json_response(stats)
+
+    async def reset_stats(request: web.Request):
+        stats["requests"] = 0
+        stats["queries"] = {}
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_get("/search", search)
+    app.router.add_get("/search.json", search)
+    app.router.add_get("/stats", get_stats)
+    app.router.add_delete("/stats", reset_stats)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 SerpAPI 服务, 用于测试和基准测试; 将 SERPAPI_URL 设为 http://127.0.0.1:<port>/search")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="每次请求的模拟耗时(秒)")
+    parser.add_argument("--error-rate", type=int, default=0, help="每 N 个请求返回一次 500, 0 表示不出错")
+    args = parser.parse_args()
+    logger.info(f"Fake SerpAPI listening on http://{args.host}:{args.port}/search")
+    web.run_app(create_app(args.latency, args.error_rate), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
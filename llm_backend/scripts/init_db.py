@@ -6,6 +6,8 @@ ROOT_DIR = Path(__file__).parent.parent
 sys.path.append(str(ROOT_DIR))
 
 import asyncio # 导入 asyncio 模块, 用于处理异步操作
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import AddConstraint
 from app.core.database import Base, engine
 from app.models import user, conversation, message
 from app.core.logger import get_logger
@@ -18,7 +20,7 @@ async def init_db(): # 定义异步函数 init_db 用于初始化数据库
         async with engine.begin() as conn:
             # 删除所有表（如果存在）
             await conn.run_sync(Base.metadata.drop_all)
-            # 创建所有表
+            # 创建所有表, 模型中声明的索引和外键一并创建
             await conn.run_sync(Base.metadata.create_all)
         logger.info("Database initialization completed successfully!")
     except Exception as e:
@@ -31,9 +33,59 @@ async def init_db(): # 定义异步函数 init_db 用于初始化数据库
         except Exception:
             pass
 
+def _existing_schema(sync_conn):
+    """读取已有表上的索引名和外键名"""
+    inspector = inspect(sync_conn)
+    indexes = {}
+    foreign_keys = {}
+    for table in Base.metadata.sorted_tables:
+        indexes[table.name] = {index["name"] for index in inspector.get_indexes(table.name)}
+        foreign_keys[table.name] = {fk["name"] for fk in inspector.get_foreign_keys(table.name)}
+    return indexes, foreign_keys
+
+async def upgrade_db():
+    """在不删除数据的前提下, 为已有的表补建模型中声明的索引和外键"""
+    try:
+        logger.info("Upgrading database schema...")
+        async with engine.begin() as conn:
+            # 先创建缺失的表
+            await conn.run_sync(Base.metadata.create_all)
+            indexes, foreign_keys = await conn.run_sync(_existing_schema)
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    if index.name not in indexes[table.name]:
+                        await conn.run_sync(index.create)
+                        logger.info(f"Created index {index.name} on {table.name}")
+                for constraint in table.foreign_key_constraints:
+                    if constraint.name in foreign_keys[table.name]:
+                        continue
+                    if table.name == message.Message.__tablename__:
+                        # 外键要求没有孤立消息, 旧数据中会话已删除的消息先清理掉
+                        result = await conn.execute(text(
+                            "DELETE m FROM messages m LEFT JOIN conversations c ON c.id = m.conversation_id "
+                            "WHERE c.id IS NULL"
+                        ))
+                        if result.rowcount:
+                            logger.info(f"Removed {result.rowcount} orphaned messages")
+                    await conn.execute(AddConstraint(constraint))
+                    logger.info(f"Created foreign key {constraint.name} on {table.name}")
+        logger.info("Database upgrade completed successfully!")
+    except Exception as e:
+        logger.error(f"Database upgrade failed: {str(e)}")
+        raise
+    finally:
+        try:
+            await engine.dispose()
+        except Exception:
+            pass
+
 def main():
     try:
-        asyncio.run(init_db())
+        # --upgrade: 保留数据, 只补建索引和外键; 默认重建所有表
+        if "--upgrade" in sys.argv[1:]:
+            asyncio.run(upgrade_db())
+        else:
+            asyncio.run(init_db())
     except RuntimeError as e:
         logger.error(f"Runtime error: {str(e)}")
     except Exception as e:
@@ -0,0 +1,117 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 PYTHONPATH, 作用是为了让脚本能够找到 app 模块
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.append(str(ROOT_DIR))
+
+import asyncio
+import re
+from typing import List, Optional, Tuple
+from app.core import math_utils
+from app.core.config import settings
+from app.core.sse import json_loads
+from app.core.logger import get_logger
+from app.core.redis_client import close_redis
+from app.core.vector_codec import decode_vector, encode_vector, is_legacy
+from app.services.embedding_service import close_embedding_service
+from app.services.redis_semantic_cache import RedisSemanticCache, get_semantic_cache
+
+logger = get_logger(service="migrate_cache_vectors")
+
+# 需要迁移的两种旧布局, prefix 为 {缓存前缀} 或 {缓存前缀}:{user_id}:
+#   最早的布局: 向量为 JSON 文本, 与响应和元数据共用消息的 md5
+#       {prefix}:{md5}  {prefix}:response:{md5}  {prefix}:metadata:{md5}
+#   之后的布局: 向量移到 {prefix}:vec:{id}, 早期写入的仍为 JSON 文本
+# 两者都改写为二进制向量, 并登记到淘汰用的有序集合和向量索引中
+_MD5 = re.compile(r"[0-9a-f]{32}")
+
+def parse_vector_key(root: str, key: str) -> Optional[Tuple[str, str, bool]]:
+    """解析旧的向量键, 返回 (用户前缀, 条目 id, 是否为最早的布局); 其他键返回 None"""
+    if not key.startswith(f"{root}:"):
+        return None
+    rest = key[len(root) + 1:].split(":")
+    if len(rest) >= 2 and rest[-2] == "vec":
+        user, item_id, baseline = rest[:-2], rest[-1], False
+    elif _MD5.fullmatch(rest[-1]):
+        user, item_id, baseline = rest[:-1], rest[-1], True
+    else:
+        return None
+    # 用户前缀只可能是数字 id, 这样可以排除 response / metadata 等其他键
+    if len(user) > 1 or (user and not user[0].isdigit()):
+        return None
+    return ":".join([root, *user]), item_id, baseline
+
+async def _migrate_batch(cache: RedisSemanticCache, batch: List[Tuple[str, str, str, bool]]) -> int:
+    async with cache.redis.pipeline(transaction=False) as pipe:
+        for key, prefix, item_id, _ in batch:
+            pipe.get(key)
+            pipe.ttl(key)
+            pipe.get(cache._get_response_key(prefix, item_id))
+            pipe.get(cache._get_frames_key(prefix, item_id))
+            pipe.get(f"{prefix}:metadata:{item_id}")
+        results = await pipe.execute()
+
+    migrated = 0
+    for i, (key, prefix, item_id, baseline) in enumerate(batch):
+        raw, ttl, response, frames, metadata = results[i * 5:i * 5 + 5]
+        if not raw or not is_legacy(raw) or ttl == -2:
+            continue # 已是二进制格式, 或已过期
+        if not response:
+            # 响应已过期的向量无法命中, 直接删除
+            await cache.redis.delete(key, f"{prefix}:metadata:{item_id}")
+            continue
+        vector = math_utils.normalize(decode_vector(raw))
+        entry = [item_id, encode_vector(vector, settings.REDIS_CACHE_VECTOR_DTYPE), response, ttl if ttl > 0 else settings.REDIS_CACHE_EXPIRE]
+        if frames:
+            entry.append(frames)
+        # 与正常写入相同: 写入向量和响应, 登记到 LRU / LFU / 过期集合并按上限裁剪
+        await cache._run_store_and_trim(prefix, tuple(entry))
+        await cache.index.add(prefix, item_id, vector)
+        async with cache.redis.pipeline(transaction=False) as pipe:
+            if metadata:
+                # 沿用旧元数据中的访问时间和次数; xx 保证刚被裁剪掉的条目不会加回来
+                metadata = json_loads(metadata)
+                pipe.zadd(f"{prefix}:lru", {item_id: metadata.get("last_access", 0)}, xx=True)
+                pipe.zadd(f"{prefix}:lfu", {item_id: metadata.get("access_count", 1)}, xx=True)
+            if baseline:
+                pipe.delete(key, f"{prefix}:metadata:{item_id}")
+            await pipe.execute()
+        migrated += 1
+    return migrated
+
+async def migrate(cache: RedisSemanticCache = None, batch_size: int = 500) -> int:
+    """把语义缓存中的旧条目迁移到当前的键布局, 过期时间保持不变, 可重复执行"""
+    cache = cache or get_semantic_cache()
+    migrated = 0
+    batch = []
+    async for key in cache.redis.scan_iter(match=f"{cache.prefix}:*", count=1000):
+        key = key.decode("utf-8")
+        parsed = parse_vector_key(cache.prefix, key)
+        if parsed is None:
+            continue
+        batch.append((key, *parsed))
+        if len(batch) >= batch_size:
+            migrated += await _migrate_batch(cache, batch)
+            batch = []
+    if batch:
+        migrated += await _migrate_batch(cache, batch)
+    return migrated
+
+async def run() -> int:
+    try:
+        return await migrate()
+    finally:
+        await close_embedding_service()
+        await close_redis()
+
+def main():
+    try:
+        logger.info("Migrating semantic cache entries...")
+        migrated = asyncio.run(run())
+        logger.info(f"Migration completed, {migrated} entries rewritten")
+    except Exception as e:
+        logger.error(f"Migration failed: {str(e)}")
+
+if __name__ == "__main__":
+    main()
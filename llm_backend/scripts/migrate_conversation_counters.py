@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 PYTHONPATH, 作用是为了让脚本能够找到 app 模块
+ROOT_DIR = Path(__file__).parent.parent
+sys.path.append(str(ROOT_DIR))
+
+import asyncio
+from sqlalchemy import inspect, text
+from app.core.database import engine
+from app.core.logger import get_logger
+
+logger = get_logger(service="migrate_conversation_counters")
+
+# 需要新增的列, 与 Conversation 模型中的定义保持一致
+NEW_COLUMNS = {
+    "message_count": "ALTER TABLE conversations ADD COLUMN message_count INT NOT NULL DEFAULT 0",
+    "last_message_at": "ALTER TABLE conversations ADD COLUMN last_message_at DATETIME NULL",
+}
+
+# 按 messages 表回填计数和最后消息时间
+BACKFILL_SQL = """
+UPDATE conversations c
+LEFT JOIN (
+    SELECT conversation_id, COUNT(*) AS message_count, MAX(created_at) AS last_message_at
+    FROM messages
+    GROUP BY conversation_id
+) m ON m.conversation_id = c.id
+SET c.message_count = COALESCE(m.message_count, 0),
+    c.last_message_at = m.last_message_at
+"""
+
+async def migrate():
+    """为 conversations 表添加 message_count / last_message_at 列并回填, 可重复执行"""
+    try:
+        async with engine.begin() as conn:
+            columns = await conn.run_sync(
+                lambda sync_conn: {column["name"] for column in inspect(sync_conn).get_columns("conversations")}
+            )
+            for name, ddl in NEW_COLUMNS.items():
+                if name not in columns:
+                    await conn.execute(text(ddl))
+                    logger.info(f"Added column conversations.{name}")
+            result = await conn.execute(text(BACKFILL_SQL))
+            logger.info(f"Backfilled counters for {result.rowcount} conversations")
+    finally:
+        # 在事件循环关闭前显式释放引擎/连接池
+        await engine.dispose()
+
+def main():
+    try:
+        logger.info("Migrating conversation counters...")
+        asyncio.run(migrate())
+        logger.info("Migration completed")
+    except Exception as e:
+        logger.error(f"Migration failed: {str(e)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+
+# Settings 中没有默认值的字段, 测试不依赖 .env 文件
+for name, value in {
+    "DB_HOST": "localhost",
+    "DB_PORT": "3306",
+    "DB_USER": "test",
+    "DB_PASSWORD": "test",
+    "DB_NAME": "test",
+    "REDIS_HOST": "localhost",
+    "REDIS_PORT": "6379",
+    "OLLAMA_BASE_URL": "http://127.0.0.1:11434",
+    "OLLAMA_CHAT_MODEL": "chat",
+    "OLLAMA_REASON_MODEL": "reason",
+    "OLLAMA_EMBEDDING_MODEL": "embedding",
+    "OLLAMA_AGENT_MODEL": "agent",
+    "DEEPSEEK_API_KEY": "test",
+    "DEEPSEEK_BASE_URL": "http://127.0.0.1:1",
+    "DEEPSEEK_MODEL": "deepseek",
+    "SERPAPI_KEY": "test",
+    "SERPAPI_URL": "http://127.0.0.1:1/search",
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """用 fakeredis 替换进程内共享的 Redis 客户端, Lua 脚本需要 lupa"""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    from app.core import redis_client
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    monkeypatch.setattr(redis_client, "_client", client)
+    return client
+
+@pytest.fixture
+def sqlite_sessions(monkeypatch):
+    """内存 SQLite 数据库, 替换各服务使用的会话工厂; 需要 aiosqlite"""
+    pytest.importorskip("aiosqlite")
+    import asyncio
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.core.database import Base
+    from app.models import conversation, message, user  # noqa: F401 注册所有表
+    from app.core import security
+    from app.services import conversation_service, message_writer
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    sessions = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def create_all():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_all())
+    monkeypatch.setattr(conversation_service, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(message_writer, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(security, "AsyncSessionLocal", sessions)
+    yield sessions
+    asyncio.run(engine.dispose())
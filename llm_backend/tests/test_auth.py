@@ -0,0 +1,105 @@
+import asyncio
+import time
+from datetime import datetime
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.auth import router
+from app.core.database import get_db
+from app.services import user_cache, user_service
+from app.services.user_cache import UserCache, UserPrincipal
+
+@pytest.fixture
+def client(sqlite_sessions, monkeypatch):
+    # 当前环境的 bcrypt 不可用, 密码校验换成明文比较
+    monkeypatch.setattr(user_service, "get_password_hash", lambda password: f"hashed:{password}")
+    monkeypatch.setattr(user_service, "verify_password", lambda password, hashed: hashed == f"hashed:{password}")
+    monkeypatch.setattr(user_cache, "_user_cache", UserCache(backend="memory"))
+
+    async def get_test_db():
+        async with sqlite_sessions() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_db] = get_test_db
+    return TestClient(app)
+
+def login(client) -> dict:
+    client.post("/register", json={"username": "alice", "email": "alice@example.com", "password": "secret"})
+    response = client.post("/token", json={"email": "alice@example.com", "password": "secret"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_current_user_is_cached_after_first_lookup(client):
+    headers = login(client)
+    assert user_cache.get_user_cache()._entries == {}
+
+    response = client.get("/users/me", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["status"] == "active"
+    assert "alice@example.com" in user_cache.get_user_cache()._entries
+
+def test_deactivated_user_is_rejected_immediately(client):
+    headers = login(client)
+    assert client.get("/users/me", headers=headers).status_code == 200 # 写入缓存
+
+    response = client.post("/users/me/deactivate", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "inactive"
+
+    # 缓存已失效, 原令牌不能再使用, 也不能重新登录
+    assert client.get("/users/me", headers=headers).status_code == 403
+    response = client.post("/token", json={"email": "alice@example.com", "password": "secret"})
+    assert response.status_code == 401
+
+def test_logout_revokes_the_token(client):
+    headers = login(client)
+    assert client.get("/users/me", headers=headers).status_code == 200
+
+    assert client.post("/logout", headers=headers).status_code == 200
+
+    # 用户信息仍在缓存中, 但令牌已撤销
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert client.post("/logout", headers=headers).status_code == 401
+    # 重新登录得到新的令牌
+    assert client.get("/users/me", headers=login(client)).status_code == 200
+
+async def wait_for(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+@pytest.mark.anyio
+async def test_invalidations_reach_other_workers(fake_redis):
+    principal = UserPrincipal(1, "alice", "alice@example.com", datetime(2024, 1, 1), None, None, "active")
+    # 两个实例模拟两个进程, 各自有进程内副本
+    first, second = UserCache(backend="redis"), UserCache(backend="redis")
+    first.start()
+    second.start()
+    try:
+        # 等待两个实例完成订阅
+        while (await fake_redis.pubsub_numsub(UserCache.CHANNEL))[0][1] < 2:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05) # 订阅后还会加载撤销记录并清空进程内副本
+        await first.set(principal)
+        second._store_local(principal)
+        await asyncio.sleep(0.05)
+        assert principal.email in second._entries
+
+        await first.invalidate(principal.email)
+        await wait_for(lambda: principal.email not in second._entries)
+
+        await first.revoke_token("token-1", time.time() + 60)
+        await wait_for(lambda: second.is_revoked("token-1"))
+    finally:
+        await first.stop()
+        await second.stop()
+
+    # 之后启动的进程从 Redis 加载未过期的撤销记录
+    third = UserCache(backend="redis")
+    await third._load_revoked()
+    assert third.is_revoked("token-1")
+    assert not third.is_revoked("token-2")
@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from app.api.conversation import router
+from app.core.security import get_current_user
+from app.models.conversation import Conversation, DialogueType
+from app.models.message import Message
+from app.services.conversation_service import ConversationService
+from app.services.user_cache import UserPrincipal
+
+def principal(user_id: int) -> UserPrincipal:
+    now = datetime(2026, 1, 1)
+    return UserPrincipal(user_id, f"user{user_id}", f"user{user_id}@example.com", now, now, None, "active")
+
+@pytest.fixture
+def seeded(sqlite_sessions):
+    async def seed():
+        async with sqlite_sessions() as db:
+            # 用户 1 有 6 个会话, 用户 2 有 1 个会话, 每个会话 10 条消息
+            for i in range(7):
+                db.add(Conversation(user_id=1 if i < 6 else 2, title="t", dialogue_type=DialogueType.NORMAL))
+            await db.commit()
+            db.add_all([Message(conversation_id=1 + i % 7, sender="user", content="x") for i in range(70)])
+            await db.commit()
+
+    asyncio.run(seed())
+    return sqlite_sessions
+
+def counts(sessions):
+    async def count():
+        async with sessions() as db:
+            messages = (await db.execute(select(func.count()).select_from(Message))).scalar()
+            conversations = (await db.execute(select(func.count()).select_from(Conversation))).scalar()
+            return messages, conversations
+
+    return asyncio.run(count())
+
+def test_delete_conversation_removes_its_messages(seeded):
+    asyncio.run(ConversationService.delete_conversation(1))
+    assert counts(seeded) == (60, 6)
+
+def test_purge_user_history_in_batches(seeded):
+    deleted = asyncio.run(ConversationService.purge_user_history(1, conversation_batch=2, message_batch=1000))
+    assert deleted == {"conversations": 6, "messages": 60}
+    assert counts(seeded) == (10, 1) # 其他用户的数据不受影响
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+def test_purge_endpoint_requires_authentication(seeded, app):
+    assert TestClient(app).delete("/conversations/user/1").status_code == 401
+    assert counts(seeded) == (70, 7)
+
+def test_purge_endpoint_rejects_other_users(seeded, app):
+    app.dependency_overrides[get_current_user] = lambda: principal(2)
+    assert TestClient(app).delete("/conversations/user/1").status_code == 403
+    assert counts(seeded) == (70, 7)
+
+def test_purge_endpoint_deletes_own_history(seeded, app):
+    app.dependency_overrides[get_current_user] = lambda: principal(1)
+    response = TestClient(app).delete("/conversations/user/1")
+    assert response.status_code == 200
+    assert response.json()["conversations"] == 6
+    assert counts(seeded) == (10, 1)
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.conversation import router
+from app.models.conversation import Conversation, DialogueType
+from app.models.message import Message
+from app.services.conversation_service import ConversationService, InvalidCursorError
+
+@pytest.fixture
+def client(sqlite_sessions):
+    async def seed():
+        async with sqlite_sessions() as db:
+            db.add(Conversation(user_id=1, title="t", dialogue_type=DialogueType.NORMAL))
+            await db.commit()
+            start = datetime(2026, 1, 1)
+            # 每三条消息共用一个时间戳, 覆盖 created_at 相同时按 id 排序的情况
+            db.add_all([
+                Message(conversation_id=1, sender="user", content=f"m{i}", created_at=start + timedelta(seconds=i // 3))
+                for i in range(10)
+            ])
+            await db.commit()
+
+    asyncio.run(seed())
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+def contents(response):
+    return [message["content"] for message in response.json()]
+
+def test_without_limit_returns_full_history(client):
+    response = client.get("/conversations/1/messages", params={"user_id": 1})
+    assert response.status_code == 200
+    assert contents(response) == [f"m{i}" for i in range(10)]
+    assert "x-before-cursor" not in response.headers
+    assert "x-after-cursor" in response.headers
+
+def test_keyset_pages_backward_and_forward(client):
+    first = client.get("/conversations/1/messages", params={"user_id": 1, "limit": 4})
+    assert contents(first) == ["m6", "m7", "m8", "m9"]
+
+    second = client.get("/conversations/1/messages", params={"user_id": 1, "limit": 4, "before": first.headers["x-before-cursor"]})
+    assert contents(second) == ["m2", "m3", "m4", "m5"]
+
+    third = client.get("/conversations/1/messages", params={"user_id": 1, "limit": 4, "before": second.headers["x-before-cursor"]})
+    assert contents(third) == ["m0", "m1"]
+    assert "x-before-cursor" not in third.headers # 已经到最早的消息
+
+    forward = client.get("/conversations/1/messages", params={"user_id": 1, "limit": 3, "after": third.headers["x-after-cursor"]})
+    assert contents(forward) == ["m2", "m3", "m4"]
+
+def test_stream_mode_returns_ndjson(client):
+    response = client.get("/conversations/1/messages", params={"user_id": 1, "stream": "true"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(response.text.splitlines()) == 10
+
+def test_errors(client):
+    assert client.get("/conversations/1/messages", params={"user_id": 2}).status_code == 404
+    assert client.get("/conversations/1/messages", params={"user_id": 1, "before": "bad"}).status_code == 400
+    assert client.get("/conversations/1/messages", params={"user_id": 1, "before": "a", "after": "b"}).status_code == 400
+    assert client.get("/conversations/1/messages", params={"user_id": 1, "limit": 0}).status_code == 422
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 1, 2, 3, 4, 5, 678000)
+    assert ConversationService.decode_cursor(ConversationService.encode_cursor(created_at, 42)) == (created_at, 42)
+    with pytest.raises(InvalidCursorError):
+        ConversationService.decode_cursor("not-a-cursor")
+
+def test_cursor_headers_are_exposed_to_cross_origin_clients():
+    from main import app
+    response = TestClient(app).get("/health", headers={"Origin": "http://example.com"})
+    exposed = response.headers["access-control-expose-headers"]
+    assert "X-Before-Cursor" in exposed and "X-After-Cursor" in exposed
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.core import database
+from app.core.metrics import Metrics
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(database, "metrics", metrics)
+    return metrics
+
+@pytest.fixture
+async def engine(tmp_path):
+    pytest.importorskip("aiosqlite")
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=database.MeteredQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.2,
+    )
+    database.instrument_pool(engine.sync_engine, 2)
+    yield engine
+    await engine.dispose()
+
+async def test_pool_usage_gauges_follow_checkout_and_checkin(engine, metrics):
+    async with engine.connect() as first:
+        await first.execute(text("select 1"))
+        async with engine.connect() as second:
+            await second.execute(text("select 1"))
+            gauges = metrics.snapshot()["gauges"]
+            assert gauges["db.pool.checked_out"] == 2
+            assert gauges["db.pool.overflow"] == 1
+            assert gauges["db.pool.saturation"] == 1.0
+        assert metrics.snapshot()["gauges"]["db.pool.checked_out"] == 1
+
+    gauges = metrics.snapshot()["gauges"]
+    assert gauges["db.pool.checked_out"] == 0
+    assert gauges["db.pool.saturation"] == 0.0
+
+async def test_pool_timeouts_are_counted(engine, metrics):
+    async def hold():
+        async with engine.connect() as conn:
+            await conn.execute(text("select 1"))
+            await asyncio.sleep(0.5)
+
+    results = await asyncio.gather(*(hold() for _ in range(3)), return_exceptions=True)
+
+    assert sum(isinstance(result, Exception) for result in results) == 1
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["db.pool.timeouts"] == 1
+    assert snapshot["timings"]["db.pool.checkout_seconds"]["count"] == 3
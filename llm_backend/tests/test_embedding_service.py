@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+from app.services.embedding_service import EmbeddingService
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def service(monkeypatch):
+    service = EmbeddingService(model_name="test-embedding", cache_size=8, batch_window=0.01, max_batch_size=4)
+    service.requests = []
+
+    async def fake_request(texts):
+        service.requests.append(list(texts))
+        await asyncio.sleep(0.01)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    monkeypatch.setattr(service, "_request", fake_request)
+    return service
+
+async def test_repeated_text_is_served_from_memo(service):
+    assert await service.embed("hello") == [5.0, 1.0]
+    assert await service.embed("hello") == [5.0, 1.0]
+    assert service.requests == [["hello"]]
+
+async def test_concurrent_calls_are_coalesced(service):
+    results = await asyncio.gather(service.embed("a"), service.embed("bb"), service.embed("a"))
+
+    assert results == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert service.requests == [["a", "bb"]] # 窗口内的请求合并, 相同文本只发送一次
+
+async def test_batches_never_exceed_max_batch_size(service):
+    texts = [f"text {i}" * (i + 1) for i in range(10)]
+
+    results = await asyncio.gather(*(service.embed(text) for text in texts))
+
+    assert results == [[float(len(text)), 1.0] for text in texts]
+    assert [len(batch) for batch in service.requests] == [4, 4, 2]
+    assert sorted(text for batch in service.requests for text in batch) == sorted(texts)
+
+async def test_failed_batch_is_not_cached(service, monkeypatch):
+    async def failing_request(texts):
+        raise RuntimeError("ollama down")
+
+    monkeypatch.setattr(service, "_request", failing_request)
+    with pytest.raises(RuntimeError):
+        await service.embed("hello")
+    assert service._memo == {}
+    assert service._inflight == {}
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import pytest
+from app.services.function_tools import FunctionTool, ToolCall, ToolRegistry
+
+pytestmark = pytest.mark.anyio
+
+PARAMETERS = {"type": "object", "properties": {"value": {"type": "string"}}, "required": ["value"]}
+
+def call(call_id: str, name: str, **arguments) -> ToolCall:
+    return ToolCall(call_id, name, json.dumps(arguments))
+
+async def test_results_keep_call_order_when_calls_finish_out_of_order():
+    finished = []
+
+    async def delayed(value: str, delay: float):
+        await asyncio.sleep(delay)
+        finished.append(value)
+        return value.upper()
+
+    registry = ToolRegistry()
+    registry.register(FunctionTool("delayed", "", PARAMETERS, delayed))
+
+    results = await registry.execute_tool_calls([
+        call("1", "delayed", value="slow", delay=0.1),
+        call("2", "delayed", value="fast", delay=0),
+    ])
+
+    assert finished == ["fast", "slow"]
+    assert [result.call.id for result in results] == ["1", "2"]
+    assert [result.result for result in results] == ["SLOW", "FAST"]
+    assert results[0].arguments == {"value": "slow", "delay": 0.1}
+    assert all(result.error is None for result in results)
+
+async def test_calls_run_concurrently():
+    async def sleep(value: str):
+        await asyncio.sleep(0.1)
+        return value
+
+    registry = ToolRegistry()
+    registry.register(FunctionTool("sleep", "", PARAMETERS, sleep))
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    results = await registry.execute_tool_calls([call(str(i), "sleep", value=str(i)) for i in range(5)])
+
+    assert loop.time() - start < 0.3
+    assert [result.result for result in results] == ["0", "1", "2", "3", "4"]
+
+async def test_max_concurrency_limits_calls_per_tool():
+    running = 0
+    peak = 0
+
+    async def limited(value: str):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return value
+
+    async def other(value: str):
+        return value
+
+    registry = ToolRegistry()
+    registry.register(FunctionTool("limited", "", PARAMETERS, limited, max_concurrency=1))
+    registry.register(FunctionTool("other", "", PARAMETERS, other))
+
+    results = await registry.execute_tool_calls(
+        [call(str(i), "limited", value=str(i)) for i in range(4)] + [call("x", "other", value="x")]
+    )
+
+    assert peak == 1
+    assert [result.result for result in results] == ["0", "1", "2", "3", "x"]
+
+async def test_timeouts_and_errors_do_not_affect_other_calls():
+    async def hang(value: str):
+        await asyncio.sleep(10)
+
+    async def fail(value: str):
+        raise RuntimeError(f"bad {value}")
+
+    async def ok(value: str):
+        return value
+
+    registry = ToolRegistry()
+    registry.register(FunctionTool("hang", "", PARAMETERS, hang, timeout=0.05))
+    registry.register(FunctionTool("fail", "", PARAMETERS, fail))
+    registry.register(FunctionTool("ok", "", PARAMETERS, ok))
+
+    results = await registry.execute_tool_calls([
+        call("1", "hang", value="a"),
+        call("2", "fail", value="b"),
+        ToolCall("3", "ok", "not json"),
+        call("4", "missing", value="c"),
+        call("5", "ok", value="d"),
+    ])
+
+    assert [(result.result, result.error) for result in results[:2]] == [(None, "timeout"), (None, "bad b")]
+    assert results[0].seconds < 1
+    assert results[2].error is not None and results[2].arguments == {}
+    assert results[3].error == "Tool missing not found"
+    assert (results[4].result, results[4].error) == ("d", None)
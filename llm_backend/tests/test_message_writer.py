@@ -0,0 +1,124 @@
+import pytest
+from sqlalchemy import select
+from app.core.metrics import Metrics
+from app.core.config import settings
+from app.models.conversation import Conversation, DialogueType
+from app.models.message import Message
+from app.services import message_writer
+from app.services.message_writer import MessageWriter
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(message_writer, "metrics", metrics)
+    return metrics
+
+@pytest.fixture
+async def sessions(sqlite_sessions):
+    async with sqlite_sessions() as db:
+        db.add(Conversation(user_id=1, title="新会话", dialogue_type=DialogueType.NORMAL))
+        await db.commit()
+    return sqlite_sessions
+
+async def load(sessions, conversation_id: int):
+    async with sessions() as db:
+        conversation = await db.get(Conversation, conversation_id)
+        messages = (await db.execute(
+            select(Message.sender, Message.content).where(Message.conversation_id == conversation_id).order_by(Message.id)
+        )).all()
+        return conversation, [tuple(row) for row in messages]
+
+def turn(question: str):
+    return [{"role": "system", "content": "ignored"}, {"role": "user", "content": question}]
+
+async def test_queued_turns_are_written_in_one_batch(sessions, metrics):
+    writer = MessageWriter(max_queue_size=16, batch_size=10, flush_interval=0.05)
+    writer.start()
+    await writer.enqueue(1, 1, turn("第一个   问题"), "回答一")
+    await writer.enqueue(1, 1, turn("第二个问题"), "回答二")
+    await writer.enqueue(1, 99, turn("不存在的会话"), "丢弃")
+    await writer.stop()
+
+    conversation, messages = await load(sessions, 1)
+    assert messages == [("user", "第一个   问题"), ("assistant", "回答一"), ("user", "第二个问题"), ("assistant", "回答二")]
+    assert conversation.message_count == 4
+    assert conversation.title == "第一个 问题" # 第一轮对话设置标题
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["message_writer.messages_written"] == 4
+    assert snapshot["timings"]["message_writer.flush_seconds"]["count"] == 1
+
+async def test_batches_are_split_by_batch_size(sessions, metrics):
+    writer = MessageWriter(max_queue_size=16, batch_size=2, flush_interval=0.05)
+    writer.start()
+    for i in range(5):
+        await writer.enqueue(1, 1, turn(f"问题 {i}"), f"回答 {i}")
+    await writer.stop()
+
+    conversation, messages = await load(sessions, 1)
+    assert len(messages) == 10
+    assert conversation.message_count == 10
+    assert conversation.title == "问题 0"
+    assert metrics.snapshot()["timings"]["message_writer.flush_seconds"]["count"] == 3
+
+async def test_enqueue_writes_directly_when_not_started(sessions, metrics):
+    await MessageWriter().enqueue(1, 1, turn("问题"), "回答")
+
+    conversation, messages = await load(sessions, 1)
+    assert messages == [("user", "问题"), ("assistant", "回答")]
+    assert conversation.message_count == 2
+
+@pytest.fixture
+def flaky_insert(monkeypatch):
+    """让 _insert_batch 先失败 failures 次, 或在批次中包含坏数据时一直失败"""
+    monkeypatch.setattr(settings, "MESSAGE_WRITER_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "MESSAGE_WRITER_RETRY_BACKOFF", 0.01)
+    state = {"failures": 0, "calls": []}
+    insert_batch = MessageWriter._insert_batch
+
+    async def flaky(self, batch):
+        state["calls"].append(len(batch))
+        if state["failures"] > 0:
+            state["failures"] -= 1
+            raise ConnectionError("database restarting")
+        if any(turn.response == "bad" for turn in batch):
+            raise ValueError("bad row")
+        await insert_batch(self, batch)
+
+    monkeypatch.setattr(MessageWriter, "_insert_batch", flaky)
+    return state
+
+async def test_transient_failures_are_retried(sessions, metrics, flaky_insert):
+    flaky_insert["failures"] = 2
+    await MessageWriter().enqueue(1, 1, turn("问题"), "回答")
+
+    _, messages = await load(sessions, 1)
+    assert messages == [("user", "问题"), ("assistant", "回答")]
+    assert flaky_insert["calls"] == [1, 1, 1]
+    assert metrics.snapshot()["counters"]["message_writer.errors"] == 2
+
+async def test_failing_batch_falls_back_to_single_turns(sessions, metrics, flaky_insert):
+    writer = MessageWriter(max_queue_size=16, batch_size=10, flush_interval=0.05)
+    writer.start()
+    await writer.enqueue(1, 1, turn("问题一"), "回答一")
+    await writer.enqueue(1, 1, turn("问题二"), "bad")
+    await writer.enqueue(1, 1, turn("问题三"), "回答三")
+    await writer.stop()
+
+    conversation, messages = await load(sessions, 1)
+    assert messages == [("user", "问题一"), ("assistant", "回答一"), ("user", "问题三"), ("assistant", "回答三")]
+    assert conversation.message_count == 4
+    assert flaky_insert["calls"] == [3, 3, 3, 1, 1, 1] # 整批重试两次后逐条写入
+    counters = metrics.snapshot()["counters"]
+    assert counters["message_writer.fallback_writes"] == 2
+    assert counters["message_writer.dropped"] == 1
+
+async def test_single_turn_is_dropped_after_retries(sessions, metrics, flaky_insert):
+    flaky_insert["failures"] = 10
+    await MessageWriter().enqueue(1, 1, turn("问题"), "回答")
+
+    _, messages = await load(sessions, 1)
+    assert messages == []
+    assert flaky_insert["calls"] == [1, 1, 1]
+    assert metrics.snapshot()["counters"]["message_writer.dropped"] == 1
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import pytest
+from app.core.config import settings
+from app.core.vector_codec import decode_vector, is_legacy
+from app.services import vector_index
+from app.services.redis_semantic_cache import RedisSemanticCache
+from scripts.migrate_cache_vectors import migrate, parse_vector_key
+
+pytestmark = pytest.mark.anyio
+
+class FakeEmbedder:
+    async def embed(self, text):
+        return [3.0, 4.0, 0.0]
+
+@pytest.fixture
+def cache(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_CACHE_INDEX_BACKEND", "memory")
+    monkeypatch.setattr(vector_index, "_local_indexes", {})
+    cache = RedisSemanticCache(model_name="test-embedding", prefix="test-cache")
+    cache.embedder = FakeEmbedder()
+    return cache
+
+def md5(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+def test_parse_vector_key():
+    item_id = md5("hello")
+    assert parse_vector_key("test-cache", f"test-cache:{item_id}") == ("test-cache", item_id, True)
+    assert parse_vector_key("test-cache", f"test-cache:7:{item_id}") == ("test-cache:7", item_id, True)
+    assert parse_vector_key("test-cache", f"test-cache:7:vec:{item_id}") == ("test-cache:7", item_id, False)
+    for key in (
+        f"test-cache:response:{item_id}",
+        f"test-cache:7:metadata:{item_id}",
+        f"test-cache:vidx:{item_id}",
+        "test-cache:7:lru",
+        f"other-cache:{item_id}",
+    ):
+        assert parse_vector_key("test-cache", key) is None
+
+async def test_migrates_baseline_layout(cache, fake_redis):
+    # 最早版本写入的条目: JSON 向量、响应和元数据共用消息的 md5
+    item_id = md5("What is Redis?")
+    await fake_redis.set(f"test-cache:7:{item_id}", json.dumps([3.0, 4.0, 0.0]), ex=600)
+    await fake_redis.set(f"test-cache:7:response:{item_id}", "an in-memory store", ex=600)
+    await fake_redis.set(f"test-cache:7:metadata:{item_id}", json.dumps({"last_access": 1000.0, "access_count": 5}), ex=600)
+    # 响应已过期的向量
+    orphan_id = md5("orphan")
+    await fake_redis.set(f"test-cache:7:{orphan_id}", json.dumps([1.0, 0.0, 0.0]), ex=600)
+
+    assert await migrate(cache, batch_size=1) == 1
+
+    raw = await fake_redis.get(f"test-cache:7:vec:{item_id}")
+    assert not is_legacy(raw)
+    assert decode_vector(raw) == pytest.approx([0.6, 0.8, 0.0], abs=1e-6)
+    assert 0 < await fake_redis.ttl(f"test-cache:7:vec:{item_id}") <= 600 # 保留原有的过期时间
+    for key in (f"test-cache:7:{item_id}", f"test-cache:7:metadata:{item_id}", f"test-cache:7:{orphan_id}"):
+        assert not await fake_redis.exists(key)
+    # 登记到淘汰用的有序集合, 沿用旧的访问时间和次数
+    assert await fake_redis.zscore("test-cache:7:lru", item_id) == 1000.0
+    assert await fake_redis.zscore("test-cache:7:lfu", item_id) == 5
+    assert await fake_redis.zscore("test-cache:7:expiry", item_id) is not None
+    assert int(await fake_redis.get("test-cache:7:bytes")) > 0
+    assert await fake_redis.sismember("test-cache:namespaces", "test-cache:7")
+
+    cached = await cache.lookup([{"role": "user", "content": "tell me about redis"}], user_id=7)
+    assert cached is not None and cached.text == "an in-memory store"
+
+    assert await migrate(cache) == 0 # 可重复执行
+
+async def test_migrates_json_vectors_in_vec_layout(cache, fake_redis):
+    await fake_redis.set("test-cache:vec:legacy", json.dumps([3.0, 4.0, 0.0]), ex=600)
+    await fake_redis.set("test-cache:response:legacy", "cached answer", ex=600)
+    await fake_redis.set("test-cache:frames:legacy", b"data: x\n\n", ex=600)
+
+    assert await migrate(cache) == 1
+
+    assert not is_legacy(await fake_redis.get("test-cache:vec:legacy"))
+    assert await fake_redis.zscore("test-cache:lru", "legacy") is not None
+    assert await fake_redis.zscore("test-cache:expiry", "legacy") is not None
+    cached = await cache.lookup([{"role": "user", "content": "a question"}])
+    assert cached is not None and cached.frames == b"data: x\n\n"
@@ -0,0 +1,30 @@
+import json
+import pytest
+from app.core.ndjson import NDJSONParser
+
+OBJECTS = [
+    {"message": {"content": "你好"}, "done": False},
+    {"message": {"content": ", world"}, "done": False},
+    {"message": {"content": ""}, "done": True, "eval_count": 12},
+]
+PAYLOAD = "".join(json.dumps(obj, ensure_ascii=False) + "\n" for obj in OBJECTS).encode("utf-8")
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, len(PAYLOAD)])
+def test_round_trip_with_arbitrary_chunk_boundaries(chunk_size):
+    # 块边界可能落在一行中间, 也可能切开一个多字节的 UTF-8 字符
+    parser = NDJSONParser()
+    parsed = []
+    for i in range(0, len(PAYLOAD), chunk_size):
+        parsed.extend(parser.feed(PAYLOAD[i:i + chunk_size]))
+    parsed.extend(parser.flush())
+    assert parsed == OBJECTS
+
+def test_flush_parses_last_line_without_newline():
+    parser = NDJSONParser()
+    assert parser.feed(b'{"a": 1}\n{"b": 2}') == [{"a": 1}]
+    assert parser.flush() == [{"b": 2}]
+    assert parser.flush() == []
+
+def test_blank_and_malformed_lines_are_skipped():
+    parser = NDJSONParser()
+    assert parser.feed(b'\n{"a": 1}\r\nnot json\n\n{"b": 2}\n') == [{"a": 1}, {"b": 2}]
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import pytest
+from aiohttp import web
+from app.core import streaming
+from app.core.config import settings
+from app.core.metrics import Metrics
+from app.core.streaming import stream_until_disconnect
+from app.services.ollama_service import OllamaService
+from tests.test_streaming import FakeRequest
+
+pytestmark = pytest.mark.anyio
+
+def create_fake_ollama(tokens, delay: float, stats: dict = None) -> web.Application:
+    """模拟 Ollama 的 /api/chat 流式接口, 每个 token 之间间隔 delay 秒
+
+    stats 记录已发送的 token 数和连接是否被客户端提前关闭
+    """
+    stats = stats if stats is not None else {}
+    stats.update(sent=0, aborted=False)
+
+    async def chat(request: web.Request):
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        try:
+            for token in tokens:
+                await asyncio.sleep(delay)
+                await response.write(json.dumps({"message": {"content": token}, "done": False}).encode("utf-8") + b"\n")
+                stats["sent"] += 1
+            await response.write(json.dumps({"message": {"content": ""}, "done": True}).encode("utf-8") + b"\n")
+        except (asyncio.CancelledError, ConnectionResetError):
+            stats["aborted"] = True
+            raise
+        return response
+
+    app = web.Application()
+    app.router.add_post("/api/chat", chat)
+    return app
+
+@pytest.fixture
+async def ollama(monkeypatch):
+    runner = web.AppRunner(create_fake_ollama(["你好", ", ", "世界"], delay=0.1))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    monkeypatch.setattr(settings, "OLLAMA_BASE_URL", "http://%s:%d" % runner.addresses[0][:2])
+    service = OllamaService()
+    yield service
+    await service.close()
+    await runner.cleanup()
+
+async def test_streams_beyond_the_connection_limit_wait_for_a_free_connection(ollama, monkeypatch):
+    # 每个流约 0.3 秒, 远超建立连接的超时; 超出并行数的流应排队而不是超时失败
+    monkeypatch.setattr(settings, "OLLAMA_NUM_PARALLEL", 1)
+    monkeypatch.setattr(settings, "OLLAMA_CONNECT_TIMEOUT", 0.1)
+    completed = []
+
+    async def on_complete(user_id, conversation_id, messages, response):
+        completed.append(response)
+
+    async def consume():
+        async for _ in ollama.generate_stream([{"role": "user", "content": "hi"}], 1, 1, on_complete):
+            pass
+
+    await asyncio.gather(*(consume() for _ in range(3)))
+
+    assert completed == ["你好, 世界"] * 3
+
+async def test_disconnect_closes_the_ollama_connection_and_saves_partial_answer(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(streaming, "metrics", metrics)
+    stats = {}
+    runner = web.AppRunner(create_fake_ollama([f"t{i} " for i in range(50)], delay=0.02, stats=stats))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    monkeypatch.setattr(settings, "OLLAMA_BASE_URL", "http://%s:%d" % runner.addresses[0][:2])
+    service = OllamaService()
+    saved = []
+
+    async def on_complete(user_id, conversation_id, messages, response):
+        saved.append(response)
+
+    try:
+        frames = []
+        stream = service.generate_stream([{"role": "user", "content": "hi"}], 1, 1, on_complete)
+        async for frame in stream_until_disconnect(FakeRequest(0.15), stream, poll_interval=0.02):
+            frames.append(frame)
+        await asyncio.sleep(0.1)
+
+        assert 0 < len(frames) < 50
+        assert stats["aborted"] # 服务端的写入因连接关闭而中断, 不再继续生成
+        assert stats["sent"] < 50
+        assert saved == ["".join(f"t{i} " for i in range(len(frames)))]
+        assert metrics.snapshot()["counters"]["ollama.stream.aborted_tokens"] > 0
+    finally:
+        await service.close()
+        await runner.cleanup()
@@ -0,0 +1,34 @@
+from app.prompts import registry as prompt_registry
+from app.services.function_tools import FunctionTool, ToolRegistry
+from app.tools.definitions import SEARCH_TOOL
+
+
+async def _noop_handler(query: str):
+    return []
+
+
+def build_registry() -> ToolRegistry:
+    registry = ToolRegistry()
+    registry.register(FunctionTool(**SEARCH_TOOL, handler=_noop_handler))
+    return registry
+
+
+def test_same_tool_set_shares_compiled_prompts(monkeypatch):
+    monkeypatch.setattr(prompt_registry, "_compiled", {})
+
+    first = prompt_registry.get_compiled_prompts(build_registry())
+    second = prompt_registry.get_compiled_prompts(build_registry())
+
+    assert second is first
+    assert first.tools == build_registry().get_tools_definition()
+
+
+def test_system_prompt_lists_required_parameters(monkeypatch):
+    monkeypatch.setattr(prompt_registry, "_compiled", {})
+
+    prompts = prompt_registry.get_compiled_prompts(build_registry())
+
+    content = prompts.system_message["content"]
+    assert "{tools_description}" not in content
+    assert "search," in content
+    assert "必须参数有: query" in content
@@ -0,0 +1,39 @@
+from app.core.tokens import estimate_tokens
+from app.services.search_context import build_search_context
+
+def result(title, url, snippet):
+    return {"title": title, "url": url, "snippet": snippet}
+
+def test_duplicate_urls_and_snippets_are_dropped():
+    results = [
+        result("Redis 文档", "https://redis.io/docs/", "Redis 是一个开源的内存数据结构存储, 可用作数据库和缓存"),
+        result("Redis 文档 镜像", "http://www.redis.io/docs", "完全不同的摘要"),
+        result("转载", "https://example.com/copy", "Redis 是一个开源的内存数据结构存储, 可用作数据库和缓存。"),
+        result("其他", "https://example.com/other", "Memcached 也是常见的缓存服务"),
+    ]
+
+    context = build_search_context("redis", results, token_budget=1000, dedup_threshold=0.8)
+
+    assert context.duplicates == 2
+    assert [item["url"] for item in context.results] == ["https://redis.io/docs/", "https://example.com/other"]
+
+def test_results_are_ranked_by_relevance_with_stable_ties():
+    results = [
+        result("天气", "https://a.example/1", "今天多云"),
+        result("上海天气预报", "https://a.example/2", "上海明天晴转多云, 气温 20 度"),
+        result("新闻", "https://a.example/3", "今天没有新闻"),
+    ]
+
+    context = build_search_context("上海明天天气", results, token_budget=1000, dedup_threshold=0.8)
+
+    assert [item["url"] for item in context.results] == ["https://a.example/2", "https://a.example/1", "https://a.example/3"]
+
+def test_context_stays_within_token_budget():
+    results = [result(f"标题 {i}", f"https://b.example/{i}", f"第 {i} 条: " + "很长的摘要内容 " * 40) for i in range(10)]
+
+    context = build_search_context("摘要", results, token_budget=300, dedup_threshold=0.99)
+
+    assert context.tokens <= 300
+    assert estimate_tokens(context.text) <= 300
+    assert context.dropped == 10 - len(context.results)
+    assert context.results[-1]["snippet"].endswith("…") # 最后一条被截断放入
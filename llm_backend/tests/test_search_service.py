@@ -0,0 +1,139 @@
+import json
+import pytest
+from openai.types.chat import ChatCompletionChunk
+from app.services.search_service import SearchService
+
+pytestmark = pytest.mark.anyio
+
+def chunk(content=None, tool_calls=None, finish_reason=None) -> ChatCompletionChunk:
+    delta = {"role": "assistant"}
+    if content is not None:
+        delta["content"] = content
+    if tool_calls is not None:
+        delta["tool_calls"] = tool_calls
+    return ChatCompletionChunk.model_validate({
+        "id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": "test",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    })
+
+def tool_delta(index, call_id=None, name=None, arguments=None) -> dict:
+    delta = {"index": index, "type": "function", "function": {}}
+    if call_id:
+        delta["id"] = call_id
+    if name:
+        delta["function"]["name"] = name
+    if arguments:
+        delta["function"]["arguments"] = arguments
+    return delta
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    async def __aiter__(self):
+        for item in self.chunks:
+            yield item
+
+    async def close(self):
+        self.closed = True
+
+class FakeCompletions:
+    """按顺序返回预设的流, 并记录每次请求的参数"""
+
+    def __init__(self, *streams):
+        self.streams = list(streams)
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return FakeStream(self.streams.pop(0))
+
+@pytest.fixture
+def service(monkeypatch):
+    service = SearchService()
+    service.queries = []
+
+    async def fake_search(query, num_results=5):
+        service.queries.append(query)
+        return [{"title": f"{query} 标题", "url": f"https://example.com/{query}", "snippet": f"{query} 的摘要"}]
+
+    monkeypatch.setattr(service.search_tool, "search", fake_search)
+    return service
+
+def use_streams(monkeypatch, service, *streams) -> FakeCompletions:
+    completions = FakeCompletions(*streams)
+    monkeypatch.setattr(service.client.chat, "completions", completions)
+    return completions
+
+async def collect(service, query, on_complete=None):
+    frames = []
+    async for frame in service.generate(query, 1, 1, on_complete):
+        assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+        frames.append(json.loads(frame[6:]))
+    return frames
+
+async def test_plain_answer_streams_directly_without_a_second_call(monkeypatch, service):
+    completions = use_streams(monkeypatch, service, [chunk("你好"), chunk(", 世界"), chunk(finish_reason="stop")])
+    saved = []
+
+    async def on_complete(user_id, conversation_id, messages, response):
+        saved.append(response)
+
+    frames = await collect(service, "打个招呼", on_complete)
+
+    assert frames == [
+        {"type": "normal_start"},
+        {"type": "direct_content", "content": "你好"},
+        {"type": "direct_content", "content": ", 世界"},
+    ]
+    assert saved == ["你好, 世界"]
+    assert len(completions.requests) == 1
+    assert completions.requests[0]["tools"] == service.prompts.tools
+    assert service.queries == []
+
+async def test_tool_call_split_across_deltas_is_merged(monkeypatch, service):
+    completions = use_streams(
+        monkeypatch,
+        service,
+        [
+            chunk(tool_calls=[tool_delta(0, call_id="call_1", name="search")]),
+            chunk(tool_calls=[tool_delta(0, arguments='{"que')]),
+            chunk(tool_calls=[tool_delta(0, arguments='ry": "上海')]),
+            chunk(tool_calls=[tool_delta(0, arguments='天气"}')]),
+            chunk(finish_reason="tool_calls"),
+        ],
+        [chunk("上海今天晴"), chunk(finish_reason="stop")],
+    )
+
+    frames = await collect(service, "上海天气怎么样")
+
+    assert service.queries == ["上海天气"]
+    assert [frame if isinstance(frame, str) else frame["type"] for frame in frames] == [
+        "search_start", "tool_timings", "search_results", "上海今天晴",
+    ]
+    assert frames[1]["tools"][0]["arguments"] == {"query": "上海天气"}
+    assert frames[2]["query"] == "上海天气"
+    assert "上海天气 的摘要" in completions.requests[1]["messages"][1]["content"]
+
+async def test_parallel_tool_calls_are_merged_by_index(monkeypatch, service):
+    use_streams(
+        monkeypatch,
+        service,
+        [
+            chunk(tool_calls=[tool_delta(0, call_id="call_a", name="search", arguments='{"query": ')]),
+            chunk(tool_calls=[tool_delta(1, call_id="call_b", name="search", arguments='{"query": "北京')]),
+            chunk(tool_calls=[tool_delta(0, arguments='"上海"}')]),
+            chunk(tool_calls=[tool_delta(1, arguments='"}')]),
+            chunk(finish_reason="tool_calls"),
+        ],
+        [chunk("两地天气"), chunk(finish_reason="stop")],
+    )
+
+    frames = await collect(service, "上海和北京的天气")
+
+    assert set(service.queries) == {"上海", "北京"}
+    assert [tool["arguments"] for tool in frames[1]["tools"]] == [{"query": "上海"}, {"query": "北京"}]
+    assert frames[2]["query"] == "上海、北京"
+    assert frames[2]["total"] == 2
+    assert frames[-1] == "两地天气"
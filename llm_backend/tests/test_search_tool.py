@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from aiohttp import web
+from app.core.config import settings
+from app.core.metrics import Metrics
+from app.tools import search
+from app.tools.search import SearchTool
+from scripts.fake_serpapi import create_app
+
+pytestmark = pytest.mark.anyio
+
+async def start_fake_serpapi(monkeypatch, latency: float = 0.05, error_rate: int = 0):
+    runner = web.AppRunner(create_app(latency, error_rate))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base_url = "http://%s:%d" % runner.addresses[0][:2]
+    monkeypatch.setattr(settings, "SERPAPI_URL", f"{base_url}/search")
+    return runner, base_url
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(search, "metrics", metrics)
+    return metrics
+
+@pytest.fixture
+async def serpapi(monkeypatch):
+    runner, base_url = await start_fake_serpapi(monkeypatch)
+    yield base_url
+    await runner.cleanup()
+
+@pytest.fixture
+async def tool():
+    tool = SearchTool(cache_size=8, cache_ttl=60)
+    yield tool
+    await tool.close()
+
+async def upstream_queries(tool: SearchTool, base_url: str) -> dict:
+    async with tool._get_session().get(f"{base_url}/stats") as response:
+        return (await response.json())["queries"]
+
+async def test_concurrent_identical_queries_share_one_request(serpapi, tool, metrics):
+    results = await asyncio.gather(*(tool.search("redis 缓存") for _ in range(10)))
+
+    assert await upstream_queries(tool, serpapi) == {"redis 缓存": 1}
+    assert all(result == results[0] for result in results)
+    assert len(results[0]) == settings.SEARCH_RESULT_COUNT
+    assert set(results[0][0]) == {"title", "url", "snippet"}
+    assert results[0][0]["url"].startswith("https://example.com/")
+    assert metrics.snapshot()["counters"]["search.coalesced"] == 9
+
+async def test_normalized_queries_hit_the_cache(serpapi, tool, metrics):
+    first = await tool.search("Redis  缓存")
+    # 全角字符、大小写和多余空白规范化后是同一个查询
+    second = await tool.search(" ｒｅｄｉｓ 缓存 ")
+
+    assert second == first
+    assert await upstream_queries(tool, serpapi) == {"Redis 缓存": 1}
+    assert metrics.snapshot()["counters"]["search.cache_hits"] == 1
+
+async def test_cached_results_expire_after_ttl(serpapi):
+    tool = SearchTool(cache_size=8, cache_ttl=0.1)
+    try:
+        await tool.search("ttl")
+        await tool.search("ttl")
+        assert await upstream_queries(tool, serpapi) == {"ttl": 1}
+
+        await asyncio.sleep(0.15)
+        await tool.search("ttl")
+        assert await upstream_queries(tool, serpapi) == {"ttl": 2}
+    finally:
+        await tool.close()
+
+async def test_cache_evicts_least_recently_used(serpapi):
+    tool = SearchTool(cache_size=2, cache_ttl=60)
+    try:
+        for query in ("a", "b", "a", "c", "a", "b"):
+            await tool.search(query)
+        # 写入 c 时淘汰最久未使用的 b, a 一直命中缓存
+        assert await upstream_queries(tool, serpapi) == {"a": 1, "b": 2, "c": 1}
+    finally:
+        await tool.close()
+
+async def test_failures_are_not_cached(monkeypatch, tool, metrics):
+    runner, base_url = await start_fake_serpapi(monkeypatch, latency=0, error_rate=1)
+    try:
+        assert await tool.search("broken") == []
+        assert await tool.search("broken") == []
+        assert await upstream_queries(tool, base_url) == {"broken": 2}
+        assert metrics.snapshot()["counters"]["search.errors"] == 2
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,112 @@
+import asyncio
+import itertools
+import json
+import time
+from types import SimpleNamespace
+import pytest
+from app.core.config import settings
+from app.core.vector_codec import decode_vector, is_legacy
+from app.services import redis_semantic_cache, vector_index
+from app.services.redis_semantic_cache import RedisSemanticCache
+
+pytestmark = pytest.mark.anyio
+
+class FakeEmbedder:
+    """固定返回同一个向量, 不请求 Ollama"""
+
+    def __init__(self, vector):
+        self.vector = vector
+
+    async def embed(self, text):
+        return self.vector
+
+@pytest.fixture(params=["hnsw", "memory"])
+def cache(request, fake_redis, monkeypatch):
+    if request.param == "hnsw":
+        pytest.importorskip("hnswlib")
+    monkeypatch.setattr(settings, "REDIS_CACHE_INDEX_BACKEND", request.param)
+    monkeypatch.setattr(vector_index, "_local_indexes", {}) # 进程内索引是全局共享的, 每个测试用新的
+    cache = RedisSemanticCache(model_name="test-embedding", prefix="test-cache")
+    cache.embedder = FakeEmbedder([3.0, 4.0, 0.0])
+    return cache
+
+async def test_lookup_migrates_legacy_json_vectors(cache, fake_redis):
+    # 旧版本写入的条目: 向量为未归一化的 JSON 文本
+    await fake_redis.set("test-cache:vec:legacy", json.dumps([3.0, 4.0, 0.0]), ex=600)
+    await fake_redis.set("test-cache:response:legacy", "cached answer", ex=600)
+
+    cached = await cache.lookup([{"role": "user", "content": "a question"}])
+
+    assert cached is not None
+    assert cached.text == "cached answer"
+    raw = await fake_redis.get("test-cache:vec:legacy")
+    assert not is_legacy(raw)
+    assert decode_vector(raw) == pytest.approx([0.6, 0.8, 0.0], abs=1e-6)
+    assert 0 < await fake_redis.ttl("test-cache:vec:legacy") <= 600 # 迁移保留原有的过期时间
+
+async def test_update_then_exact_and_semantic_lookup(cache):
+    messages = [{"role": "user", "content": "What is Redis?"}]
+    await cache.update(messages, "an in-memory store", frames=b"data: x\n\n")
+
+    exact = await cache.lookup([{"role": "user", "content": "  what is   REDIS? "}])
+    assert exact == ("an in-memory store", b"data: x\n\n")
+
+    semantic = await cache.lookup([{"role": "user", "content": "tell me about redis"}])
+    assert semantic is not None and semantic.text == "an in-memory store"
+
+@pytest.fixture
+def small_cache(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_CACHE_INDEX_BACKEND", "memory")
+    monkeypatch.setattr(settings, "CACHE_EVICTION_POLICY", "lru")
+    monkeypatch.setattr(vector_index, "_local_indexes", {})
+    # 每次写入的时间递增, 淘汰顺序不受时钟精度影响
+    clock = itertools.count(int(time.time()))
+    monkeypatch.setattr(redis_semantic_cache, "time", SimpleNamespace(time=lambda: next(clock), perf_counter=time.perf_counter))
+    cache = RedisSemanticCache(model_name="test-embedding", prefix="test-cache", max_cache_size=2, max_cache_bytes=0)
+    cache.embedder = FakeEmbedder([1.0, 0.0, 0.0])
+    return cache
+
+async def entry_ids(redis, key):
+    return [member.decode("utf-8") for member in await redis.zrange(key, 0, -1)]
+
+async def test_store_and_trim_evicts_least_recently_used(small_cache, fake_redis):
+    questions = ["first", "second", "third"]
+    for question in questions:
+        await small_cache.update([{"role": "user", "content": question}], f"answer to {question}")
+    ids = [small_cache._get_exact_hash([{"role": "user", "content": q}], q) for q in questions]
+
+    # 最早写入的条目及其所有键都被删除, 计数和字节数与剩余条目一致
+    assert sorted(await entry_ids(fake_redis, "test-cache:lru")) == sorted(ids[1:])
+    assert sorted(await entry_ids(fake_redis, "test-cache:expiry")) == sorted(ids[1:])
+    assert not await fake_redis.exists(f"test-cache:vec:{ids[0]}", f"test-cache:response:{ids[0]}")
+    sizes = await fake_redis.hgetall("test-cache:sizes")
+    assert {key.decode("utf-8") for key in sizes} == set(ids[1:])
+    assert int(await fake_redis.get("test-cache:bytes")) == sum(int(size) for size in sizes.values())
+    assert await fake_redis.smembers("test-cache:namespaces") == {b"test-cache"}
+    assert await small_cache._get_cached("test-cache", ids[0]) is None
+
+async def test_store_and_trim_drops_expired_entries(small_cache, fake_redis):
+    await small_cache.update([{"role": "user", "content": "old"}], "stale", expire=1)
+    await fake_redis.zadd("test-cache:expiry", {small_cache._get_exact_hash([{"role": "user", "content": "old"}], "old"): 0})
+
+    await small_cache._cleanup_prefix("test-cache")
+
+    assert await fake_redis.zcard("test-cache:lru") == 0
+    assert int(await fake_redis.get("test-cache:bytes")) == 0
+    assert await fake_redis.keys("test-cache:response:*") == []
+    assert await small_cache.lookup([{"role": "user", "content": "old"}]) is None
+
+async def test_concurrent_first_lookups_warm_the_index_once(cache, fake_redis, monkeypatch):
+    await cache.update([{"role": "user", "content": "What is Redis?"}], "an in-memory store")
+    warmups = []
+    warmup = cache.index.warmup
+
+    async def count_warmup(namespace, items):
+        warmups.append(namespace)
+        await warmup(namespace, items)
+
+    monkeypatch.setattr(cache.index, "warmup", count_warmup)
+    results = await asyncio.gather(*(cache.lookup([{"role": "user", "content": f"redis {i}"}]) for i in range(5)))
+
+    assert warmups == ["test-cache"]
+    assert all(result is not None and result.text == "an in-memory store" for result in results)
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from contextlib import aclosing
+import pytest
+from app.core import sse
+
+pytestmark = pytest.mark.anyio
+
+class Source:
+    """按 (等待秒数, token) 依次产出, 记录是否被关闭"""
+
+    def __init__(self, script):
+        self.script = script
+        self.closed = False
+
+    async def tokens(self):
+        try:
+            for delay, token in self.script:
+                if delay:
+                    await asyncio.sleep(delay)
+                yield token
+        finally:
+            self.closed = True
+
+async def collect(source: Source, window: float, max_chars: int = 0):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    frames = []
+    async for frame in sse.coalesce(source.tokens(), window, max_chars):
+        frames.append((frame, loop.time() - start))
+    return frames
+
+def test_encode_data_frames_json_without_escaping():
+    frame = sse.encode_data({"type": "direct_content", "content": "你好\n"})
+    assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+    assert json.loads(frame[6:]) == {"type": "direct_content", "content": "你好\n"}
+    assert "你好".encode("utf-8") in frame
+
+async def test_zero_window_passes_tokens_through():
+    source = Source([(0, "a"), (0, "b"), (0, "c")])
+    assert [frame for frame, _ in await collect(source, 0)] == ["a", "b", "c"]
+    assert source.closed
+
+async def test_tokens_within_the_window_are_merged():
+    # 第二段的第一个 token 在窗口结束后才到达, 等待它的任务跨窗口保留
+    source = Source([(0, "a"), (0.01, "b"), (0.01, "c"), (0.2, "d"), (0.01, "e")])
+
+    frames = await collect(source, 0.1)
+
+    assert [frame for frame, _ in frames] == ["abc", "de"]
+    assert 0.09 <= frames[0][1] < 0.2 # 在窗口结束时发出, 不等下一个 token
+
+async def test_frame_is_flushed_once_max_chars_is_reached():
+    source = Source([(0, "ab"), (0, "cd"), (0, "ef"), (0, "g")])
+
+    frames = await collect(source, 1, max_chars=4)
+
+    assert [frame for frame, _ in frames] == ["abcd", "efg"]
+    assert frames[0][1] < 0.5 # 达到上限立即发出, 不等窗口结束
+
+async def test_single_token_larger_than_max_chars_is_sent_alone():
+    source = Source([(0, "abcdef"), (0, "g")])
+    assert [frame for frame, _ in await collect(source, 1, max_chars=4)] == ["abcdef", "g"]
+
+async def test_remaining_tokens_are_flushed_when_the_source_ends():
+    source = Source([(0, "a"), (0.01, "b")])
+
+    frames = await collect(source, 1)
+
+    assert [frame for frame, _ in frames] == ["ab"]
+    assert frames[0][1] < 0.5 # 上游结束时立即发出, 不等窗口结束
+    assert source.closed
+
+async def test_closing_the_coalescer_closes_the_source():
+    source = Source([(0, "a"), (0.2, "b"), (10, "never")])
+
+    async with aclosing(sse.coalesce(source.tokens(), 0.05, 0)) as frames:
+        async for frame in frames:
+            assert frame == "a"
+            break # 等待 "b" 的任务仍在进行时关闭
+
+    assert source.closed
@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app.core import streaming
+from app.core.metrics import Metrics
+from app.core.streaming import stream_until_disconnect
+from app.services.deepseek_service import DeepseekService
+from tests.test_search_service import chunk
+
+pytestmark = pytest.mark.anyio
+
+class FakeRequest:
+    """is_disconnected() 在 disconnect_after 秒后返回 True"""
+
+    def __init__(self, disconnect_after: float):
+        self.url = SimpleNamespace(path="/api/chat")
+        self.disconnect_at = asyncio.get_running_loop().time() + disconnect_after
+
+    async def is_disconnected(self) -> bool:
+        return asyncio.get_running_loop().time() >= self.disconnect_at
+
+class SlowStream:
+    """逐个产出 chunk, 每个之间等待 delay 秒, 记录是否被关闭"""
+
+    def __init__(self, chunks, delay: float):
+        self.chunks = chunks
+        self.delay = delay
+        self.sent = 0
+        self.closed = False
+
+    async def __aiter__(self):
+        for item in self.chunks:
+            await asyncio.sleep(self.delay)
+            self.sent += 1
+            yield item
+
+    async def close(self):
+        self.closed = True
+
+class FakeCache:
+    def __init__(self):
+        self.updates = []
+
+    async def lookup(self, messages, user_id=None, model=None):
+        return None
+
+    async def update(self, messages, response, **kwargs):
+        self.updates.append(response)
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(streaming, "metrics", metrics)
+    return metrics
+
+async def consume(request, stream):
+    frames = []
+    async for frame in stream_until_disconnect(request, stream, poll_interval=0.02):
+        frames.append(frame)
+    return frames
+
+async def test_stream_until_disconnect_stops_a_silent_upstream(metrics):
+    closed = asyncio.Event()
+
+    async def thinking():
+        try:
+            yield "first"
+            await asyncio.sleep(10) # 模型长时间没有输出
+            yield "never"
+        finally:
+            closed.set()
+
+    frames = await asyncio.wait_for(consume(FakeRequest(0.05), thinking()), 1)
+
+    assert frames == ["first"]
+    assert closed.is_set()
+    assert metrics.snapshot()["counters"]["stream.client_disconnects"] == 1
+
+async def test_deepseek_disconnect_closes_upstream_and_saves_partial_answer(monkeypatch, metrics):
+    service = DeepseekService()
+    service.cache = FakeCache()
+    upstream = SlowStream([chunk(f"t{i} ") for i in range(50)], delay=0.02)
+
+    async def create(**kwargs):
+        return upstream
+
+    monkeypatch.setattr(service.client.chat, "completions", SimpleNamespace(create=create))
+    saved = []
+
+    async def on_complete(user_id, conversation_id, messages, response):
+        saved.append(response)
+
+    messages = [{"role": "user", "content": "hi"}]
+    frames = await consume(FakeRequest(0.15), service.generate_stream(messages, 1, 1, on_complete))
+    await asyncio.sleep(0.05) # 关闭上游在后台任务中执行
+
+    assert 0 < len(frames) < 50
+    assert upstream.closed
+    assert upstream.sent < 50
+    assert saved == ["".join(f"t{i} " for i in range(len(frames)))]
+    assert service.cache.updates == [] # 不完整的回答不写入缓存
+    counters = metrics.snapshot()["counters"]
+    assert counters["deepseek.stream.aborted"] == 1
+    assert counters["deepseek.stream.aborted_tokens"] > 0
+    assert counters["deepseek.stream.partial_tokens_saved"] == counters["deepseek.stream.aborted_tokens"]
+
+async def test_disconnect_before_any_output_saves_nothing(monkeypatch, metrics):
+    service = DeepseekService()
+    service.cache = FakeCache()
+    upstream = SlowStream([chunk("late")], delay=1)
+
+    async def create(**kwargs):
+        return upstream
+
+    monkeypatch.setattr(service.client.chat, "completions", SimpleNamespace(create=create))
+    saved = []
+
+    async def on_complete(*args):
+        saved.append(args)
+
+    frames = await consume(FakeRequest(0.05), service.generate_stream([{"role": "user", "content": "hi"}], 1, 1, on_complete))
+    await asyncio.sleep(0.05)
+
+    assert frames == []
+    assert upstream.closed
+    assert saved == []
+    assert metrics.snapshot()["counters"]["deepseek.stream.aborted_tokens"] == 0
@@ -0,0 +1,38 @@
+import json
+import numpy as np
+import pytest
+from app.core.vector_codec import FORMAT_VERSION, decode_vector, encode_vector, is_legacy
+
+VECTOR = np.random.default_rng(0).standard_normal(768).astype(np.float32)
+UNIT = VECTOR / np.linalg.norm(VECTOR)
+
+def test_float32_round_trip_is_exact():
+    raw = encode_vector(VECTOR)
+    assert len(raw) == 2 + 768 * 4
+    np.testing.assert_array_equal(decode_vector(raw), VECTOR)
+
+@pytest.mark.parametrize("dtype, size, min_cosine", [("float16", 2 + 768 * 2, 0.9999), ("int8", 2 + 4 + 768, 0.999)])
+def test_compact_dtypes_preserve_cosine_similarity(dtype, size, min_cosine):
+    raw = encode_vector(UNIT, dtype)
+    decoded = decode_vector(raw)
+
+    assert len(raw) == size
+    assert decoded.dtype == np.float32
+    assert float(decoded @ UNIT) / float(np.linalg.norm(decoded)) >= min_cosine
+
+def test_int8_zero_vector():
+    np.testing.assert_array_equal(decode_vector(encode_vector([0.0, 0.0, 0.0], "int8")), [0.0, 0.0, 0.0])
+
+def test_legacy_json_vectors_still_decode():
+    raw = json.dumps([0.25, -0.5, 1.0]).encode("utf-8")
+    assert is_legacy(raw)
+    assert not is_legacy(encode_vector([0.25, -0.5, 1.0]))
+    np.testing.assert_array_equal(decode_vector(raw), [0.25, -0.5, 1.0])
+
+def test_rejects_unknown_dtype_and_version():
+    with pytest.raises(ValueError):
+        encode_vector([1.0], "float64")
+    raw = bytearray(encode_vector([1.0]))
+    raw[0] = FORMAT_VERSION + 1
+    with pytest.raises(ValueError):
+        decode_vector(bytes(raw))
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from app.services import vector_index
+from app.services.vector_index import HnswVectorIndex, InMemoryVectorIndex
+
+pytestmark = pytest.mark.anyio
+
+def units(n: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+async def test_least_recently_used_namespaces_are_evicted():
+    index = InMemoryVectorIndex(max_namespaces=2)
+    vectors = units(3)
+    for i, namespace in enumerate(["a", "b"]):
+        await index.warmup(namespace, [(f"{namespace}-0", vectors[i])])
+    await index.search("a", vectors[0]) # a 最近使用过, 淘汰 b
+    await index.warmup("c", [("c-0", vectors[2])])
+
+    assert not index.needs_warmup("a")
+    assert index.needs_warmup("b")
+    assert await index.search("b", vectors[1]) == []
+    assert (await index.search("a", vectors[0]))[0][0] == "a-0"
+
+async def test_add_to_unwarmed_namespace_waits_for_warmup():
+    index = InMemoryVectorIndex()
+    vector = units(1)[0]
+    await index.add("a", "a-0", vector)
+
+    assert index.needs_warmup("a") # 条目只在 Redis 中, 由预热载入
+    assert await index.search("a", vector) == []
+
+async def test_warmup_builds_off_the_event_loop(monkeypatch):
+    index = InMemoryVectorIndex()
+    build_threads = []
+    build = index._build
+
+    def record_thread(item_ids, vectors):
+        build_threads.append(threading.get_ident())
+        return build(item_ids, vectors)
+
+    monkeypatch.setattr(index, "_build", record_thread)
+    vectors = units(4)
+    await index.warmup("a", [(f"id-{i}", vector) for i, vector in enumerate(vectors)])
+
+    assert build_threads and build_threads[0] != threading.get_ident()
+    assert (await index.search("a", vectors[2]))[0][0] == "id-2"
+
+async def test_writes_during_warmup_are_replayed(monkeypatch):
+    index = InMemoryVectorIndex()
+    started = threading.Event()
+    release = threading.Event()
+    build = index._build
+
+    def slow_build(item_ids, vectors):
+        started.set()
+        release.wait(5)
+        return build(item_ids, vectors)
+
+    monkeypatch.setattr(index, "_build", slow_build)
+    vectors = units(3)
+    warmup = asyncio.ensure_future(index.warmup("a", [("id-0", vectors[0]), ("id-1", vectors[1])]))
+    await asyncio.to_thread(started.wait, 5)
+
+    await index.add("a", "id-2", vectors[2])
+    await index.remove("a", ["id-0"])
+    release.set()
+    await warmup
+
+    assert (await index.search("a", vectors[2]))[0][0] == "id-2"
+    assert "id-0" not in {item_id for item_id, _ in await index.search("a", vectors[0], k=3)}
+
+async def test_small_namespaces_use_a_matrix_and_large_ones_move_to_hnsw():
+    pytest.importorskip("hnswlib")
+    index = HnswVectorIndex(min_entries=8)
+    vectors = units(9)
+    await index.warmup("a", [(f"id-{i}", vectors[i]) for i in range(7)])
+    assert isinstance(index._namespaces["a"], vector_index._Matrix)
+
+    await index.add("a", "id-7", vectors[7]) # 达到 min_entries, 后台重建为 HNSW 图
+    await index.add("a", "id-8", vectors[8]) # 重建期间的写入
+    for _ in range(100):
+        if isinstance(index._namespaces["a"], vector_index._HnswGraph):
+            break
+        await asyncio.sleep(0.01)
+
+    graph = index._namespaces["a"]
+    assert isinstance(graph, vector_index._HnswGraph)
+    assert graph.graph.max_elements == 16 # 按条目数分配, 不预留大容量
+    for i in range(9):
+        assert (await index.search("a", vectors[i]))[0][0] == f"id-{i}"